@@ -0,0 +1,234 @@
+"""
+Mergeable summaries of many games, in memory that does not grow with the number of games.
+
+Accumulators only hold integer counts and sums. Adding values one at a time, or merging accumulators filled in other
+processes, gives exactly the same totals whatever the order, and their dicts go through JSON unchanged. Means and
+variances are only worked out from the totals when they are read.
+
+    summary = GameSummary()
+    summary.watch(game)
+    game.play_game()
+    other.merge(GameSummary.from_dict(json.loads(json.dumps(summary.to_dict()))))
+    print(other.report())
+"""
+from typing import Optional
+
+from backend.deck import Deck
+from backend.game import Game
+from backend.rules import PASS_OFFSETS
+
+_QUEEN_OF_SPADES = 1 << Deck.Card("spades", 12).index()
+
+
+class Moments:
+    """Count, sum and sum of squares of integer values"""
+    __slots__ = ("count", "total", "squares")
+
+    def __init__(self, count: int = 0, total: int = 0, squares: int = 0) -> None:
+        self.count = count
+        self.total = total
+        self.squares = squares
+
+    def add(self, value: int) -> None:
+        self.count += 1
+        self.total += value
+        self.squares += value * value
+
+    def merge(self, other: 'Moments') -> None:
+        self.count += other.count
+        self.total += other.total
+        self.squares += other.squares
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def variance(self) -> Optional[float]:
+        """Sample variance, None with fewer than 2 values"""
+        if self.count < 2:
+            return None
+        # Worked out in integers, so it is exact until the division
+        return (self.count * self.squares - self.total * self.total) / (self.count * (self.count - 1))
+
+    def to_list(self) -> list[int]:
+        return [self.count, self.total, self.squares]
+
+    @classmethod
+    def from_list(cls, values: list) -> 'Moments':
+        count, total, squares = values
+        return cls(int(count), int(total), int(squares))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Moments) and self.to_list() == other.to_list()
+
+
+class Histogram:
+    """Counts of integer values in a fixed range, values outside it are counted in the first or last bin"""
+    __slots__ = ("low", "counts")
+
+    def __init__(self, low: int, high: int) -> None:
+        self.low = low
+        self.counts = [0] * (high - low + 1)
+
+    def add(self, value: int) -> None:
+        self.counts[min(max(value - self.low, 0), len(self.counts) - 1)] += 1
+
+    def merge(self, other: 'Histogram') -> None:
+        if (other.low, len(other.counts)) != (self.low, len(self.counts)):
+            raise ValueError("Only histograms of the same range can be merged")
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+
+    def quantile(self, fraction: float) -> Optional[int]:
+        """The smallest value with at least `fraction` of the values at or below it, None when empty"""
+        total = sum(self.counts)
+        if not total:
+            return None
+        seen = 0
+        for offset, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * total:
+                return self.low + offset
+        return self.low + len(self.counts) - 1
+
+    def to_dict(self) -> dict:
+        return {"low": self.low, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        histogram = cls(int(data["low"]), int(data["low"]) + len(data["counts"]) - 1)
+        histogram.counts = [int(count) for count in data["counts"]]
+        return histogram
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Histogram) and self.to_dict() == other.to_dict()
+
+
+class GameSummary:
+    """Summary of the rounds and games played, by seat and by passing direction"""
+
+    def __init__(self) -> None:
+        self.games = 0
+        self.rounds = 0
+        # Points of each seat in each round, and at the end of each game
+        self.round_points = [Moments() for _ in range(4)]
+        self.game_points = [Moments() for _ in range(4)]
+        # Games each seat ended with the lowest score, ties count for every seat in them
+        self.wins = [0, 0, 0, 0]
+        # Rounds each seat took the queen of spades, and took every point card
+        self.queens = [0, 0, 0, 0]
+        self.moons = [0, 0, 0, 0]
+        # Points of every seat in the rounds of each passing direction
+        self.by_direction = {direction: Moments() for direction in PASS_OFFSETS}
+        self.round_histogram = Histogram(-36, 36)
+        self.length_histogram = Histogram(1, 40)
+
+    def watch(self, game: Game) -> None:
+        """Add the rounds and the end of a game as it is played. The game's hooks are still called after."""
+        trick_end_hook = game.trick_end_hook
+        round_end_hook = game.round_end_hook
+        end_game_hook = game.end_game_hook
+        totals = [player.total_score for player in game.seats]
+        # Cards each seat took this round
+        taken = [0, 0, 0, 0]
+
+        def trick_end(trick) -> None:
+            taken[trick.winner.seat] |= Deck.cards_to_mask(trick.cards)
+            return trick_end_hook(trick)
+
+        def round_end() -> None:
+            # The round count has moved on to the next round already
+            direction = game.rules.pass_direction(game.round_count - 1)
+            point_cards = game.rules.point_cards
+            self.rounds += 1
+            for seat, player in enumerate(game.seats):
+                points = player.total_score - totals[seat]
+                totals[seat] = player.total_score
+                self.round_points[seat].add(points)
+                self.by_direction[direction].add(points)
+                self.round_histogram.add(points)
+                self.queens[seat] += bool(taken[seat] & _QUEEN_OF_SPADES)
+                self.moons[seat] += taken[seat] & point_cards == point_cards
+                taken[seat] = 0
+            return round_end_hook()
+
+        def end_game() -> None:
+            scores = [player.total_score for player in game.seats]
+            best = min(scores)
+            self.games += 1
+            self.length_histogram.add(game.round_count)
+            for seat, score in enumerate(scores):
+                self.game_points[seat].add(score)
+                self.wins[seat] += score == best
+            return end_game_hook()
+
+        game.trick_end_hook = trick_end
+        game.round_end_hook = round_end
+        game.end_game_hook = end_game
+
+    def merge(self, other: 'GameSummary') -> None:
+        self.games += other.games
+        self.rounds += other.rounds
+        for mine, theirs in zip(self.round_points + self.game_points, other.round_points + other.game_points):
+            mine.merge(theirs)
+        self.wins = [mine + theirs for mine, theirs in zip(self.wins, other.wins)]
+        self.queens = [mine + theirs for mine, theirs in zip(self.queens, other.queens)]
+        self.moons = [mine + theirs for mine, theirs in zip(self.moons, other.moons)]
+        for direction, moments in other.by_direction.items():
+            self.by_direction[direction].merge(moments)
+        self.round_histogram.merge(other.round_histogram)
+        self.length_histogram.merge(other.length_histogram)
+
+    def to_dict(self) -> dict:
+        return {
+            "games": self.games,
+            "rounds": self.rounds,
+            "round_points": [moments.to_list() for moments in self.round_points],
+            "game_points": [moments.to_list() for moments in self.game_points],
+            "wins": self.wins,
+            "queens": self.queens,
+            "moons": self.moons,
+            "by_direction": {direction: moments.to_list() for direction, moments in self.by_direction.items()},
+            "round_histogram": self.round_histogram.to_dict(),
+            "length_histogram": self.length_histogram.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'GameSummary':
+        summary = cls()
+        summary.games = int(data["games"])
+        summary.rounds = int(data["rounds"])
+        summary.round_points = [Moments.from_list(values) for values in data["round_points"]]
+        summary.game_points = [Moments.from_list(values) for values in data["game_points"]]
+        summary.wins = [int(wins) for wins in data["wins"]]
+        summary.queens = [int(queens) for queens in data["queens"]]
+        summary.moons = [int(moons) for moons in data["moons"]]
+        for direction, values in data["by_direction"].items():
+            summary.by_direction[direction] = Moments.from_list(values)
+        summary.round_histogram = Histogram.from_dict(data["round_histogram"])
+        summary.length_histogram = Histogram.from_dict(data["length_histogram"])
+        return summary
+
+    def report(self) -> dict:
+        """The summary as means, variances and rates"""
+        rounds = self.rounds or 1
+        return {
+            "games": self.games,
+            "rounds": self.rounds,
+            "seats": [{
+                "round_points_mean": round_points.mean(),
+                "round_points_variance": round_points.variance(),
+                "game_points_mean": game_points.mean(),
+                "win_rate": self.wins[seat] / self.games if self.games else None,
+                "queen_rate": self.queens[seat] / rounds,
+                "moon_rate": self.moons[seat] / rounds,
+            } for seat, (round_points, game_points) in enumerate(zip(self.round_points, self.game_points))],
+            "moon_rate": sum(self.moons) / rounds,
+            # Every round gives out the same points, the spread is what passing changes
+            "round_points_by_direction": {direction: {"mean": moments.mean(), "variance": moments.variance()}
+                                          for direction, moments in self.by_direction.items() if moments.count},
+            "round_points_median": self.round_histogram.quantile(0.5),
+            "game_length_median": self.length_histogram.quantile(0.5),
+            "game_length_p99": self.length_histogram.quantile(0.99),
+        }
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, GameSummary) and self.to_dict() == other.to_dict()
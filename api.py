@@ -1,12 +1,88 @@
 
-from inspect import signature, Parameter, _empty
-from typing import Callable, Literal, Optional
+import random
+from functools import lru_cache
+from inspect import CO_VARARGS, CO_VARKEYWORDS, signature, _empty, isawaitable, iscoroutinefunction, ismethod
+from types import CodeType, MappingProxyType
+from typing import Any, BinaryIO, Callable, Literal, Mapping, Optional, Sequence
 
 from backend.exceptions import BadPlayerListError
 from backend.game import Game
 from backend.player import Player
 from backend.round import Round
 from backend.deck import Deck, SUIT
+from backend.events import BATCH, Event, EventStream
+from backend.game_log import GameLogWriter, GameReplay
+from backend.hooks import Steps, run_steps, run_steps_async
+from backend.profiler import Profiler
+from backend.rules import Rules
+import backend.ai as ai
+
+
+def _compare_annotations(found: list, found_return: Any, annotations: tuple, return_annotation: Any) -> Optional[str]:
+    """Compare the annotations of a hook's parameters and return value to the expected ones.
+
+    Returns:
+        Optional[str]: What is wrong with the hook, None if it matches
+    """
+    if len(found) != len(annotations) or any(annotation != expected for annotation, expected in zip(found, annotations)):
+        return "Hook does not have the correct parameters"
+    if found_return is not _empty and found_return != return_annotation:
+        return "Hook does not return the correct type"
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _check_signature(code: CodeType, bound: bool, hook_annotations: tuple, annotations: tuple, return_annotation: Any) -> Optional[str]:
+    """Compare the annotations of a function to the expected ones. Cached, so each function is only inspected once.
+
+    The cache is keyed on the function's code and annotations, not on the function: every table wraps its hooks in new
+    closures (see `Registry.timed`), which would never be looked up again and would keep their table alive.
+    """
+    count = code.co_argcount + code.co_kwonlyargcount
+    count += bool(code.co_flags & CO_VARARGS) + bool(code.co_flags & CO_VARKEYWORDS)
+    found = dict(hook_annotations)
+    return _compare_annotations([found.get(name, _empty) for name in code.co_varnames[1 if bound else 0:count]],
+                                found.get("return", _empty), annotations, return_annotation)
+
+
+def _validate_hook(hook: Callable, annotations: tuple, return_annotation: Any) -> None:
+    """Make sure a hook takes parameters with the given annotations and returns the given type. Both plain and async functions are accepted.
+
+    Raises:
+        ValueError: If the hook is not callable or does not match
+    """
+    if not callable(hook):
+        raise ValueError("Hook must be a callable function")
+    # Check the function that bound methods and `functools.wraps` wrappers stand for
+    function, bound = hook, False
+    while True:
+        if ismethod(function):
+            function, bound = function.__func__, True  # type: ignore
+        elif hasattr(function, "__wrapped__"):
+            function = function.__wrapped__  # type: ignore
+        else:
+            break
+    try:
+        error = _check_signature(function.__code__, bound, tuple(function.__annotations__.items()),  # type: ignore
+                                 annotations, return_annotation)
+    except (AttributeError, TypeError):  # Callable objects without code or with annotations that can not be hashed
+        sig = signature(hook)
+        error = _compare_annotations([parameter.annotation for parameter in sig.parameters.values()],
+                                     sig.return_annotation, annotations, return_annotation)
+    if error:
+        raise ValueError(error)
+
+
+def _checked(result: Any, check: Callable[[Any], None]) -> Any:
+    """Run `check` on what a hook returned. If the hook is async, the check runs once its result is awaited."""
+    if isawaitable(result):
+        async def await_and_check():
+            value = await result
+            check(value)
+            return value
+        return await_and_check()
+    check(result)
+    return result
 
 
 class API:
@@ -45,11 +121,34 @@ class API:
         # This hook gets called when the players have passed their cards, it sends which cards were
 
         self.trick_end_hook: Callable[[
-            'Round.Trick'], None] | None = None
+            'Round.Trick'], None] = lambda _: None
 
         self.passed_cards_hook: Callable[[
         ], dict['Player', list['Deck.Card']]] = lambda: {}
 
+        # These hooks decide for the bots, by default the functions in `backend.ai` are used
+        self.bot_play_card: Callable[['Player', Optional['SUIT'], bool, list['Deck.Card']],
+                                     'Deck.Card'] = ai.play_card
+        self.bot_pass_cards: Callable[[
+            'Player'], list['Deck.Card']] = ai.bot_pass_cards
+
+        # What happens in the game as batches of compact events, see `subscribe_events`
+        self.events = EventStream()
+        # The variant of the rules the next game is played with, see `set_settings`
+        self.settings: Mapping = {}
+
+        # Read only views of the state, rebuilt only when the version of the players they show changes
+        self._player_views: dict[Player, tuple[int, Mapping]] = {}
+        self._state_view: Optional[tuple[tuple[int, int], Mapping]] = None
+
+        # Where to write the binary log of the game, see backend/game_log.py
+        self.game_log: Optional[BinaryIO] = None
+        self.game_log_batch: BATCH = "round"
+        # The rest of a game brought back with `restore_game`, played by the next start
+        self._restored_steps: Optional[Steps[None]] = None
+        # Times the phases and hooks of the game when set, see backend/profiler.py
+        self.profiler: Optional[Profiler] = None
+
         self.game = None
 
     def set_end_game_score(self, score: int):
@@ -64,41 +163,35 @@ class API:
         if not isinstance(score, int) or score <= 0:
             raise ValueError("Score must be a positive integer")
 
-        self.game.settings['END_GAME_SCORE'] = score
+        self.game.settings = {**self.game.settings, 'END_GAME_SCORE': score}
+
+    def set_settings(self, settings: Mapping):
+        """Play the next game with a variant of the rules, see `backend.rules.DEFAULT_SETTINGS` for what can be changed
+
+        Args:
+            settings (Mapping): The settings to change from the defaults
+
+        Raises:
+            ValueError: If a setting is unknown or has a bad value
+        """
+        Rules.compile(settings)
+        self.settings = dict(settings)
 
     def set_play_card_hook(self, hook: Callable[['Player', Optional[SUIT], bool], 'Deck.Card']):
         """Set the hook that will be called when a player needs to play a card. Get input from the user in any way you like.
+        The hook may be an `async def` function if the game is started with `start_game_async`.
 
         Args:
             hook (Callable[[Player, Optional[SUIT], bool], Deck.Card]): your function header should look like this
         """
         # Make sure the hook is a callable function that takes the correct arguments
-        if not callable(hook):
-            raise ValueError("Hook must be a callable function")
-        sig = signature(hook)
-        expected_params = [
-            Parameter('player', Parameter.POSITIONAL_OR_KEYWORD,
-                      annotation=Player),
-            Parameter('led_suit', Parameter.POSITIONAL_OR_KEYWORD,
-                      annotation=Optional[SUIT]),
-            Parameter('is_leading', Parameter.POSITIONAL_OR_KEYWORD,
-                      annotation=bool)
-        ]
-        expected_return_type = Deck.Card
-
-        # Check if the parameters match
-        if len(sig.parameters) != len(expected_params) or \
-           any(sig.parameters[key].annotation != expected_params[index].annotation for index, key in enumerate(sig.parameters)):
-            raise ValueError("Hook does not have the correct parameters")
-
-        # Check if the return type matches
-        if sig.return_annotation is not _empty and sig.return_annotation != expected_return_type:
-            raise ValueError("Hook does not return the correct type")
+        _validate_hook(hook, (Player, Optional[SUIT], bool), Deck.Card)
 
         self.play_card = hook
 
     def set_get_pass_cards_hook(self, hook: Callable[['Player'], list['Deck.Card']]):
         """Set the hook that will be called when a player needs to pass cards. Get input from the user in any way you like.
+        The hook may be an `async def` function if the game is started with `start_game_async`.
 
         Args:
             hook (Callable[[Player], list[Deck.Card]]): your function header should look like this
@@ -106,23 +199,7 @@ class API:
         """
 
         # Make sure the hook is a callable function that takes the correct arguments
-        if not callable(hook):
-            raise ValueError("Hook must be a callable function")
-        sig = signature(hook)
-        expected_params = [
-            Parameter('player', Parameter.POSITIONAL_OR_KEYWORD,
-                      annotation=Player)
-        ]
-        expected_return_type = list[Deck.Card]
-
-        # Check if the parameters match
-        if len(sig.parameters) != len(expected_params) or \
-                any(sig.parameters[key].annotation != expected_params[index].annotation for index, key in enumerate(sig.parameters)):
-            raise ValueError("Hook does not have the correct parameters")
-
-        # Check if the return type matches
-        if sig.return_annotation is not _empty and sig.return_annotation != expected_return_type:
-            raise ValueError("Hook does not return the correct type")
+        _validate_hook(hook, (Player,), list[Deck.Card])
 
         self.pass_cards = hook
 
@@ -138,7 +215,8 @@ class API:
         self.round_end_hook = hook
 
     def set_trick_end_hook(self, hook: Callable[['Round.Trick'], None]):
-        """Set the hook that will be called when a trick ends
+        """Set the hook that will be called when a trick ends. The round plays its next trick in the same object,
+        copy what is needed from it (like `trick.played`) rather than keeping the trick.
 
         Args:
             hook (Callable[[], None]): the `trick_end_hook` must be a callable function
@@ -191,6 +269,96 @@ class API:
 
         self.card_played_hook = hook
 
+    def set_bot_play_card_hook(self, hook: Callable[['Player', Optional[SUIT], bool, list['Deck.Card']], 'Deck.Card']):
+        """Set the hook that chooses the card a bot plays
+
+        Args:
+            hook (Callable[[Player, Optional[SUIT], bool, list[Deck.Card]], Deck.Card]): Called with the bot, the led suit, whether it is leading and the cards it is allowed to play
+        """
+        if not callable(hook):
+            raise ValueError("Hook must be a callable function")
+
+        self.bot_play_card = hook
+
+    def set_bot_pass_cards_hook(self, hook: Callable[['Player'], list['Deck.Card']]):
+        """Set the hook that chooses the 3 cards a bot passes
+
+        Args:
+            hook (Callable[[Player], list[Deck.Card]]): Called with the bot
+        """
+        if not callable(hook):
+            raise ValueError("Hook must be a callable function")
+
+        self.bot_pass_cards = hook
+
+    def subscribe_events(self, callback: Callable[[list[Event]], None], batch: BATCH = "trick") -> Callable[[], None]:
+        """Get what happens in the game in batches, at the end of every trick or every round.
+        Cheaper than the per event hooks when a frontend does not need to react to every card, like a log or a spectator.
+
+        Args:
+            callback (Callable[[list[Event]], None]): Called with each batch of events, see backend/events.py
+            batch (BATCH): "trick" or "round"
+
+        Returns:
+            Callable[[], None]: Call to unsubscribe
+        """
+        if not callable(callback):
+            raise ValueError("Callback must be a callable function")
+        return self.events.subscribe(callback, batch)
+
+    def set_game_log(self, stream: BinaryIO, batch: BATCH = "round"):
+        """Record the game in the compact binary log format, see backend/game_log.py. Must be set before the game starts.
+
+        Args:
+            stream (BinaryIO): A binary file or buffer the log is appended to
+            batch (BATCH): Append once per "round", or once per "trick"
+        """
+        if not hasattr(stream, 'write'):
+            raise ValueError("The game log must be a writable binary stream")
+        if batch not in ("trick", "round"):
+            raise ValueError("The game log is written by trick or by round")
+        self.game_log = stream
+        self.game_log_batch = batch
+
+    def set_profiler(self, profiler: Optional[Profiler]):
+        """Profile where the game spends its time, see backend/profiler.py. Must be set before the game starts.
+
+        Args:
+            profiler (Optional[Profiler]): The profiler, None to stop profiling the next game
+        """
+        if profiler is not None and not isinstance(profiler, Profiler):
+            raise ValueError("The profiler must be a backend.profiler.Profiler")
+        self.profiler = profiler
+
+    def _profiled(self, check: Callable[[Any], None]) -> Callable[[Any], None]:
+        """Checking a human's answer is engine work, profiled apart from the wait for the answer"""
+        profiler = self.profiler
+        if profiler is None:
+            return check
+        return lambda result: profiler.call("rules", check, result)
+
+    def restore_game(self, log: bytes):
+        """Bring back a game that was interrupted from its log, the next `start_game` carries on from where the log ends.
+        The players must have been added in the logged order. A game log that is set carries on without a new header.
+
+        Args:
+            log (bytes): The log of the game, see `set_game_log`
+
+        Raises:
+            ValueError: If the log is not of a game between these players
+        """
+        replay = GameReplay(log)
+        # The log is attached after the restore, what is replayed is in it already
+        game_log, self.game_log = self.game_log, None
+        try:
+            self.create_game()
+        finally:
+            self.game_log = game_log
+        self.game.settings = replay.rules.settings  # type: ignore
+        self._restored_steps = replay.restore(self.game)  # type: ignore
+        if self.game_log is not None:
+            GameLogWriter(self.game_log, self.game, self.game_log_batch, header=False)
+
     def add_player(self, player_name: str):
         """Add a player to the game
 
@@ -209,24 +377,45 @@ class API:
             raise ValueError("Game has not started")
         if player not in self.players:
             raise ValueError("Player is not in the game")
-        cards = self.pass_cards(player)
-        if not all([card in player.hand for card in cards]):
-            raise ValueError("Player does not have all the cards")
 
-        if len(cards) != 3:
-            raise ValueError("You must pass exactly 3 cards")
-        return cards
+        def check(cards: list['Deck.Card']):
+            if not all([card in player.hand for card in cards]):
+                raise ValueError("Player does not have all the cards")
+
+            if len(cards) != 3:
+                raise ValueError("You must pass exactly 3 cards")
+        return _checked(self.pass_cards(player), self._profiled(check))  # type: ignore
 
     def start_game(self):
+        """Play the game on this thread. Every hook must be a plain function, use `start_game_async` for async hooks."""
+        hooks = [self.play_card, self.pass_cards, self.round_end_hook, self.card_played_hook, self.hearts_broken_hook,
+                 self.end_game_hook, self.trick_end_hook, self.passed_cards_hook, self.bot_play_card, self.bot_pass_cards]
+        if any(iscoroutinefunction(hook) for hook in hooks):
+            raise ValueError(
+                "Async hooks are set, start the game with start_game_async")
+        run_steps(self._game_steps())
+
+    async def start_game_async(self):
+        """Play the game on the running event loop. Hooks may be plain or `async def` functions, async ones are awaited."""
+        await run_steps_async(self._game_steps())
+
+    def _game_steps(self) -> Steps[None]:
+        if self._restored_steps is not None:
+            steps, self._restored_steps = self._restored_steps, None
+            return steps
+        self.create_game()
+        return self.game.steps()  # type: ignore
+
+    def create_game(self):
         if not self.play_card or not self.pass_cards:
             raise ValueError("Play card and pass cards hooks must be set")
 
         # We can not be sure the play_card function is valid so we override it with a validated version
         def play_card_validated(player: Player, led_suit: Optional['SUIT'], is_leading: bool) -> 'Deck.Card':
-            card = self.play_card(player, led_suit, is_leading)  # type: ignore
-            if card not in self.get_allowed_cards(player, led_suit, is_leading):
-                raise ValueError("Invalid card played")
-            return card
+            def check(card: 'Deck.Card'):
+                if card not in self.get_allowed_cards(player, led_suit, is_leading):
+                    raise ValueError("Invalid card played")
+            return _checked(self.play_card(player, led_suit, is_leading), self._profiled(check))  # type: ignore
         try:
             self.game = Game(self.players,
                              play_card_validated,
@@ -236,12 +425,17 @@ class API:
                              self.trick_end_hook,
                              self.card_played_hook,
                              self.end_game_hook,
-                             self.passed_cards_hook
+                             self.passed_cards_hook,
+                             bot_play_card=self.bot_play_card,
+                             bot_pass_cards=self.bot_pass_cards,
+                             settings=self.settings,
+                             events=self.events,
+                             profiler=self.profiler
                              )
         except BadPlayerListError as e:
             raise ValueError(str(e))
-
-        self.game.play_game()
+        if self.game_log is not None:
+            GameLogWriter(self.game_log, self.game, self.game_log_batch)
 
     def reset_game(self):
         '''Reset the game to the initial state'''
@@ -250,60 +444,92 @@ class API:
             raise ValueError("Game has not started")
         self.game.reset_game()
 
-    def get_current_state(self):
+    def get_current_state(self) -> Mapping:
         '''
-        Get the current state of the game'''
+        Get the current state of the game. The state is read only and is only rebuilt after a player changes,
+        so calling this repeatedly is cheap. Hands and cards taken are sorted tuples.'''
         if not self.game:
             raise ValueError("Game has not started")
 
-        state = {
-            "round_count": self.game.round_count,
-            "players": {
-                player.name: {
-                    "total_score": player.total_score,
-                    "round_score": player.round_score,
-                    "cards_taken":   self.sort_hand(player.cards_taken),
-                    "hand": self.sort_hand(player.hand),
-                } for player in self.game.players + self.game.bots
-            }
-        }
-        return state
-
-    def get_player_state(self, player: 'Player'):
-        '''Get the state of a player in the game'''
+        key = (self.game.round_count, self.get_state_version())
+        if self._state_view is None or self._state_view[0] != key:
+            self._state_view = (key, MappingProxyType({
+                "round_count": self.game.round_count,
+                "version": key[1],
+                "players": MappingProxyType({
+                    player.name: self.get_player_state(player) for player in self.game.seats
+                })
+            }))
+        return self._state_view[1]
+
+    def get_player_state(self, player: 'Player') -> Mapping:
+        '''Get the state of a player in the game. Read only and cached until the player changes, see `get_current_state`'''
         if not self.game:
             raise ValueError("Game has not started")
 
-        state = {
+        cached = self._player_views.get(player)
+        if cached is not None and cached[0] == player.version:
+            return cached[1]
+        # The engine keeps the hand and cards taken sorted
+        state = MappingProxyType({
             "total_score": player.total_score,
             "round_score": player.round_score,
-            "cards_taken":  self.sort_hand(player.cards_taken),
-            "hand": self.sort_hand(player.hand),
-            'passed_cards':  self.sort_hand(player.passed_cards) if player.passed_cards else None
-        }
+            "cards_taken": tuple(player.cards_taken),
+            "hand": tuple(player.hand),
+            'passed_cards': tuple(self.sort_hand(player.passed_cards)) if player.passed_cards else None
+        })
+        self._player_views[player] = (player.version, state)
         return state
 
+    def get_state_version(self) -> int:
+        '''Get a number that grows whenever the state of the game changes, for use with `get_changes_since`'''
+        if not self.game:
+            raise ValueError("Game has not started")
+        return max(player.version for player in self.game.seats)
+
+    def get_changes_since(self, version: int) -> Mapping:
+        '''Get the state of the players that changed after the given version, for clients that poll for updates.
+
+        Args:
+            version (int): The `version` of the last state the client has, 0 for everything
+
+        Returns:
+            Mapping: round_count, the current version and the states of the players that changed, by name
+        '''
+        if not self.game:
+            raise ValueError("Game has not started")
+        return MappingProxyType({
+            "round_count": self.game.round_count,
+            "version": self.get_state_version(),
+            "players": MappingProxyType({
+                player.name: self.get_player_state(player)
+                for player in self.game.seats if player.version > version
+            })
+        })
+
+    def get_current_trick(self) -> list[tuple[str, 'Deck.Card']]:
+        '''Get the cards played so far in the current trick, in the order they were played'''
+        if not self.game:
+            raise ValueError("Game has not started")
+        current_round = getattr(self.game, 'round', None)
+        if current_round is None or current_round.current_trick is None:
+            return []
+        return [(player.name, card) for player, card in current_round.current_trick.played.items()]
+
     def get_allowed_cards(self, player: 'Player', led_suit: Optional['SUIT'], is_leading: bool):
         '''Get the cards that the player is allowed to play in the current trick.'''
         if not self.game:
             raise ValueError("Game has not started")
 
         allowed_cards = player.allowed_cards_to_play(
-            self.game.round.hearts_broken, self.game.round.trick_count == 0, led_suit, is_leading)
+            self.game.round.hearts_broken, self.game.round.trick_count == 0, led_suit, is_leading, self.game.rules)
         return self.sort_hand(allowed_cards)
 
     def get_passing_direction(self) -> Literal['left', 'right', 'across', 'hold']:
         '''Get the direction in which the player should pass cards in the current round. Note, this is informational only. Passing is handled by the game automatically.'''
         if not self.game:
             raise ValueError("Game has not started")
-        round_mod = self.game.round_count % 4
-        match = {
-            0: "left",
-            1: "right",
-            2: "across",
-            3: "hold"
-        }
-        return match[round_mod]
+        return self.game.rules.pass_direction(self.game.round_count)
 
     def sort_hand(self, hand):
         '''Sort the hand of the player'''
@@ -311,3 +537,26 @@ class API:
             raise ValueError("Game has not started")
 
         return self.game.deck.sort_hand(hand)
+
+
+def scripted_api(names: Sequence[str] = ("Alice",), rng: Optional[random.Random] = None) -> API:
+    """An API whose people play by script, for tests and benchmarks. Bots take the other seats.
+
+    Args:
+        names (Sequence[str]): The people at the table
+        rng (Optional[random.Random]): Makes the people play and pass random allowed cards. Without it they play the
+            first allowed card and pass the first 3 cards of their hand
+    """
+    api = API()
+    for name in names:
+        api.add_player(name)
+
+    def play_card(player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
+        allowed_cards = api.get_allowed_cards(player, led_suit, is_leading)
+        return rng.choice(allowed_cards) if rng else allowed_cards[0]
+
+    def pass_cards(player: Player) -> list[Deck.Card]:
+        return rng.sample(player.hand, 3) if rng else player.hand[:3]
+    api.set_play_card_hook(play_card)
+    api.set_get_pass_cards_hook(pass_cards)
+    return api
@@ -0,0 +1,371 @@
+"""
+Memory-mapped archive of logged rounds with secondary indexes.
+
+Every round of every game is one fixed width record in `rounds.bin`, which is mapped into memory as a NumPy
+structured array. Queries scan it in chunks of views, or look rows up in the indexes, without creating a Python object
+per record.
+
+    python archive.py ingest games/ server-games.hlog
+    python archive.py index games/
+    python archive.py query games/
+
+Games are often played with other rules than the defaults (see backend/rules.py). Each record has the id of the
+settings of its game in `Archive.settings`, and `Archive.rules` has the rules compiled from them.
+
+Game logs are the length prefixed files the server writes to GAME_LOG_PATH, see backend/game_log.py.
+"""
+import argparse
+import json
+import os
+import struct
+import time
+from typing import Iterable, Iterator, Mapping, Optional, Sequence
+
+import numpy as np
+
+from backend.deck import Deck
+from backend.game_log import GameReplay, read_framed
+from backend.rules import Rules
+
+ROUND_DTYPE = np.dtype([
+    ("game", "<u4"),
+    ("round", "u1"),
+    # Bit per seat that was played by a bot
+    ("bots", "u1"),
+    # Trick in which the first heart was played, -1 if hearts were never broken
+    ("hearts_broken_trick", "i1"),
+    # Seat that took the queen of spades
+    ("queen_seat", "i1"),
+    # Player ids, see `Archive.players`
+    ("players", "<u4", 4),
+    # Settings id, see `Archive.settings`
+    ("settings", "<u2"),
+    # Card masks of each seat, see `Deck.cards_to_mask`
+    ("dealt", "<u8", 4),
+    ("passed", "<u8", 4),
+    ("taken", "<u8", 4),
+    # Card indices in the order they were played, the seats follow from the trick winners
+    ("plays", "u1", 52),
+    ("trick_winners", "u1", 13),
+    ("round_scores", "<i2", 4),
+    ("total_scores", "<i2", 4),
+])
+
+MAGIC = b"HARC"
+ARCHIVE_VERSION = 2
+# magic, version, record size, padded to 64 bytes. The records are packed, so they and their fields are not aligned
+_HEADER = struct.Struct("<4sHI54x")
+
+QUEEN_OF_SPADES = Deck.Card("spades", 12).index()
+TWO_OF_CLUBS = Deck.Card("clubs", 2).index()
+_HEARTS = Deck.Card.suiteValues["hearts"]
+
+
+def settings_key(settings: Mapping) -> str:
+    """The settings of a game as JSON, the same for the same settings"""
+    return json.dumps(dict(settings), sort_keys=True)
+
+
+def _rules(settings: dict) -> Rules:
+    # JSON has the passing cycle as a list, settings hold it as a tuple
+    return Rules.compile({**settings, 'PASS_CYCLE': tuple(settings['PASS_CYCLE'])})
+
+
+def _per_row(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """List each row under its keys, one column of keys per listing"""
+    keys = keys.reshape(len(keys), -1)
+    return np.repeat(np.arange(len(keys)), keys.shape[1]), keys.ravel().astype(np.int64)
+
+
+def _mask_bits(masks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """List each row under the card indices set in any seat's mask
+
+    Args:
+        masks (np.ndarray): (rows, seats) uint64
+    """
+    combined = np.ascontiguousarray(np.bitwise_or.reduce(masks, axis=1), dtype="<u8")
+    bits = np.unpackbits(combined.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    return np.nonzero(bits)
+
+
+# Secondary indexes: the (row, key) pairs a chunk of records is listed under, rows counted from the chunk start
+INDEXES = {
+    # player id -> rounds they played
+    "player": lambda records: _per_row(records["players"]),
+    # seat -> rounds in which that seat took the queen of spades
+    "queen_seat": lambda records: _per_row(records["queen_seat"]),
+    # trick + 1 -> rounds in which hearts were broken on that trick, 0 for never
+    "hearts_broken_trick": lambda records: _per_row(records["hearts_broken_trick"] + 1),
+    # card index -> rounds in which the card was passed
+    "passed_card": lambda records: _mask_bits(records["passed"]),
+}
+
+
+def round_records(log: bytes, game_id: int, player_ids: dict[str, int], settings_ids: dict[str, int]) -> np.ndarray:
+    """Turn the complete rounds of a game log into archive records
+
+    Args:
+        log (bytes): A log written by `GameLogWriter`
+        game_id (int): Stored in each record
+        player_ids (dict[str, int]): Player name to id, new names are added
+        settings_ids (dict[str, int]): Settings (see `settings_key`) to id, new settings are added
+
+    Returns:
+        np.ndarray: One ROUND_DTYPE record per complete round
+    """
+    replay = GameReplay(log)
+    names = replay.names + [f"Bot {index + 1}" for index in range(4 - len(replay.names))]
+    ids = [player_ids.setdefault(name, len(player_ids)) for name in names]
+    rules = replay.rules
+    settings_id = settings_ids.setdefault(settings_key(rules.settings), len(settings_ids))
+    bots = sum(1 << seat for seat in range(len(replay.names), 4))
+    rounds = [logged for logged in replay.rounds if len(logged.plays) == 52 and logged.scores is not None]
+    records = np.zeros(len(rounds), dtype=ROUND_DTYPE)
+    totals = [0, 0, 0, 0]
+    for row, (round_index, logged) in zip(records, enumerate(rounds)):
+        dealt = [Deck.cards_to_mask(hand) for hand in logged.deal]
+        passed = [Deck.cards_to_mask(logged.passes.get(seat, [])) for seat in range(4)]
+        hands = list(dealt)
+        offset = rules.pass_offset(round_index)
+        if offset is not None:
+            hands = [dealt[seat] & ~passed[seat] | passed[(seat - offset) % 4] for seat in range(4)]
+        leader = next(seat for seat in range(4) if hands[seat] >> TWO_OF_CLUBS & 1)
+
+        taken = [0, 0, 0, 0]
+        winners = []
+        hearts_broken_trick = -1
+        queen_seat = -1
+        plays = logged.plays
+        for trick in range(13):
+            cards = plays[trick * 4:trick * 4 + 4]
+            led_suit = cards[0] // 13
+            # Card indices are in rank order within a suit
+            best = max(range(4), key=lambda play: cards[play] if cards[play] // 13 == led_suit else -1)
+            winner = (leader + best) % 4
+            winners.append(winner)
+            for card in cards:
+                taken[winner] |= 1 << card
+            if hearts_broken_trick < 0 and any(card // 13 == _HEARTS for card in cards):
+                hearts_broken_trick = trick
+            if QUEEN_OF_SPADES in cards:
+                queen_seat = winner
+            leader = winner
+
+        row["game"] = game_id
+        row["round"] = round_index
+        row["bots"] = bots
+        row["hearts_broken_trick"] = hearts_broken_trick
+        row["queen_seat"] = queen_seat
+        row["players"] = ids
+        row["settings"] = settings_id
+        row["dealt"] = dealt
+        row["passed"] = passed
+        row["taken"] = taken
+        row["plays"] = np.frombuffer(bytes(plays), dtype=np.uint8)
+        row["trick_winners"] = winners
+        row["total_scores"] = logged.scores
+        row["round_scores"] = [score - total for score, total in zip(logged.scores, totals)]
+        totals = list(logged.scores)
+    return records
+
+
+class Archive:
+    """An archive directory: the round records, the player names, the settings of the games and the indexes"""
+
+    def __init__(self, path: str) -> None:
+        """Open or create an archive.
+
+        Args:
+            path (str): The archive directory
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.records_path = os.path.join(path, "rounds.bin")
+        if not os.path.exists(self.records_path):
+            with open(self.records_path, "wb") as records_file:
+                records_file.write(_HEADER.pack(MAGIC, ARCHIVE_VERSION, ROUND_DTYPE.itemsize))
+        with open(self.records_path, "rb") as records_file:
+            magic, version, record_size = _HEADER.unpack(records_file.read(_HEADER.size))
+        if magic != MAGIC or version != ARCHIVE_VERSION or record_size != ROUND_DTYPE.itemsize:
+            raise ValueError(f"{self.records_path} is not a version {ARCHIVE_VERSION} archive")
+
+        self.players_path = os.path.join(path, "players.json")
+        self.players: list[str] = []
+        if os.path.exists(self.players_path):
+            with open(self.players_path) as players_file:
+                self.players = json.load(players_file)
+        self.settings_path = os.path.join(path, "settings.json")
+        # Settings of the games, by id
+        self.settings: list[dict] = []
+        if os.path.exists(self.settings_path):
+            with open(self.settings_path) as settings_file:
+                self.settings = json.load(settings_file)
+        self.rules = [_rules(settings) for settings in self.settings]
+        self.records = self._map()
+
+    def _map(self) -> np.ndarray:
+        count = (os.path.getsize(self.records_path) - _HEADER.size) // ROUND_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=ROUND_DTYPE)
+        return np.memmap(self.records_path, dtype=ROUND_DTYPE, mode="r", offset=_HEADER.size, shape=(count,))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def append_logs(self, logs: Iterable[bytes], batch_rounds: int = 65536) -> int:
+        """Add the complete rounds of game logs to the end of the archive. Indexes have to be rebuilt afterwards.
+
+        Args:
+            logs (Iterable[bytes]): Game logs
+            batch_rounds (int): Rounds held in memory before they are written
+
+        Returns:
+            int: The number of rounds added
+        """
+        player_ids = {name: player_id for player_id, name in enumerate(self.players)}
+        settings_ids = {settings_key(settings): settings_id for settings_id, settings in enumerate(self.settings)}
+        game_id = int(self.records["game"].max()) + 1 if len(self.records) else 0
+        added = 0
+        pending: list[np.ndarray] = []
+        pending_rounds = 0
+        with open(self.records_path, "ab") as records_file:
+            for log in logs:
+                records = round_records(log, game_id, player_ids, settings_ids)
+                game_id += 1
+                pending.append(records)
+                pending_rounds += len(records)
+                if pending_rounds >= batch_rounds:
+                    records_file.write(np.concatenate(pending).tobytes())
+                    added += pending_rounds
+                    pending, pending_rounds = [], 0
+            if pending:
+                records_file.write(np.concatenate(pending).tobytes())
+                added += pending_rounds
+        self.players = sorted(player_ids, key=player_ids.__getitem__)
+        with open(self.players_path, "w") as players_file:
+            json.dump(self.players, players_file)
+        self.settings = [json.loads(key) for key in sorted(settings_ids, key=settings_ids.__getitem__)]
+        with open(self.settings_path, "w") as settings_file:
+            json.dump(self.settings, settings_file)
+        self.rules = [_rules(settings) for settings in self.settings]
+        self.records = self._map()
+        return added
+
+    def scan(self, fields: Optional[Sequence[str]] = None, chunk_rows: int = 1 << 18) -> Iterator[tuple[int, np.ndarray]]:
+        """Go through the records in chunks.
+
+        Args:
+            fields (Optional[Sequence[str]]): Only these fields, all of them by default
+            chunk_rows (int): Records per chunk
+
+        Yields:
+            tuple[int, np.ndarray]: The row number of the first record of the chunk, and a read only view of the chunk
+        """
+        records = self.records if fields is None else self.records[list(fields)]
+        for start in range(0, len(records), chunk_rows):
+            yield start, records[start:start + chunk_rows]
+
+    def build_indexes(self, chunk_rows: int = 1 << 20) -> None:
+        """(Re)build every index in INDEXES over all records"""
+        for name, keys_of in INDEXES.items():
+            keys_parts = []
+            rows_parts = []
+            for start, chunk in self.scan(chunk_rows=chunk_rows):
+                rows, keys = keys_of(chunk)
+                keys_parts.append(keys.astype(np.uint32))
+                rows_parts.append((rows + start).astype(np.uint32))
+            keys = np.concatenate(keys_parts) if keys_parts else np.zeros(0, np.uint32)
+            rows = np.concatenate(rows_parts) if rows_parts else np.zeros(0, np.uint32)
+            key_count = int(keys.max()) + 1 if len(keys) else 0
+            # A stable sort of small integer types is a radix sort, much faster than sorting uint32
+            order = np.argsort(keys.astype(np.min_scalar_type(max(key_count - 1, 0))), kind="stable")
+            keys, rows = keys[order], rows[order]
+            # Rows listed under key k are rows[offsets[k]:offsets[k + 1]], in row order
+            offsets = np.searchsorted(keys, np.arange(key_count + 1)).astype(np.int64)
+            np.save(os.path.join(self.path, f"index_{name}_offsets.npy"), offsets)
+            np.save(os.path.join(self.path, f"index_{name}_rows.npy"), rows)
+        with open(os.path.join(self.path, "indexes.json"), "w") as meta_file:
+            json.dump({"records": len(self.records)}, meta_file)
+
+    def lookup(self, index: str, key: int) -> np.ndarray:
+        """Get the rows listed under a key of an index.
+
+        Args:
+            index (str): One of INDEXES
+            key (int): The key, see INDEXES
+
+        Raises:
+            ValueError: If the index is unknown or was built before records were added
+
+        Returns:
+            np.ndarray: Row numbers in increasing order
+        """
+        if index not in INDEXES:
+            raise ValueError(f"Unknown index: {index}")
+        meta_path = os.path.join(self.path, "indexes.json")
+        if not os.path.exists(meta_path):
+            raise ValueError("The indexes have not been built")
+        with open(meta_path) as meta_file:
+            if json.load(meta_file)["records"] != len(self.records):
+                raise ValueError("The indexes are out of date, rebuild them")
+        offsets = np.load(os.path.join(self.path, f"index_{index}_offsets.npy"), mmap_mode="r")
+        if not 0 <= key < len(offsets) - 1:
+            return np.zeros(0, dtype=np.uint32)
+        rows = np.load(os.path.join(self.path, f"index_{index}_rows.npy"), mmap_mode="r")
+        return rows[offsets[key]:offsets[key + 1]]
+
+    def player_rows(self, name: str) -> np.ndarray:
+        """The rows of every round a player played"""
+        if name not in self.players:
+            return np.zeros(0, dtype=np.uint32)
+        return self.lookup("player", self.players.index(name))
+
+
+def bot_took_passed_queen(archive: Archive) -> np.ndarray:
+    """Rounds in which a bot passed the queen of spades and took it back in a trick"""
+    queen = np.uint64(1 << QUEEN_OF_SPADES)
+    seats = np.arange(4, dtype=np.uint8)
+    found = []
+    for start, chunk in archive.scan(("bots", "passed", "taken")):
+        bot = (chunk["bots"][:, None] >> seats) & 1
+        passed_and_took = (chunk["passed"] & chunk["taken"] & queen) != 0
+        found.append(start + np.flatnonzero((passed_and_took & bot.astype(bool)).any(axis=1)))
+    return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+
+def hearts_broken_on(archive: Archive, trick: int) -> np.ndarray:
+    """Rounds in which hearts were broken on the given trick (counting from 1), using the index"""
+    return archive.lookup("hearts_broken_trick", trick)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["ingest", "index", "query"])
+    parser.add_argument("archive", help="archive directory")
+    parser.add_argument("logs", nargs="*", help="game log files to ingest")
+    args = parser.parse_args()
+
+    archive = Archive(args.archive)
+    start = time.perf_counter()
+    if args.command == "ingest":
+        def logs():
+            for path in args.logs:
+                with open(path, "rb") as log_file:
+                    yield from read_framed(log_file.read())
+        added = archive.append_logs(logs())
+        print(f"Added {added} rounds in {time.perf_counter() - start:.2f}s, {len(archive)} in total")
+    elif args.command == "index":
+        archive.build_indexes()
+        print(f"Indexed {len(archive)} rounds in {time.perf_counter() - start:.2f}s")
+    else:
+        rows = bot_took_passed_queen(archive)
+        print(f"{len(rows)} rounds where a bot took the queen of spades after passing it "
+              f"({time.perf_counter() - start:.2f}s for {len(archive)} rounds)")
+        start = time.perf_counter()
+        rows = hearts_broken_on(archive, 2)
+        print(f"{len(rows)} rounds where hearts were broken on trick 2 ({time.perf_counter() - start:.4f}s)")
+
+
+if __name__ == '__main__':
+    main()
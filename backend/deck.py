@@ -12,10 +12,9 @@ class Deck:
     """
 
     def __init__(self) -> None:
-        """Initialize the deck with the 52 cards.
+        """Initialize the deck with the 52 cards. The cards are shared by every deck, only their order is the deck's own.
         """
-        self.cards = [self.Card(suit, value)
-                      for suit in get_args(SUIT) for value in range(2, 15)]
+        self.cards = list(_CARDS_BY_INDEX)
 
     def shuffle(self) -> None:
         """Shuffle the deck of cards.
@@ -43,14 +42,95 @@ class Deck:
         """
         return sorted(hand)
 
+    @classmethod
+    def card_from_index(cls, index: int) -> 'Card':
+        """Get the card with the given index, see `Card.index`
+
+        Args:
+            index (int): 0-51
+
+        Returns:
+            Card: The card
+        """
+        if not 0 <= index < 52:
+            raise BadPlayingCardError(f"Invalid card index: {index}")
+        return _CARDS_BY_INDEX[index]
+
+    @classmethod
+    def cards_to_mask(cls, cards: list['Card']) -> int:
+        """Pack a collection of cards into a 52 bit integer, one bit per card index.
+
+        Args:
+            cards (list[Card]): A list of cards
+
+        Returns:
+            int: The mask
+        """
+        mask = 0
+        for card in cards:
+            mask |= 1 << card.index()
+        return mask
+
+    @classmethod
+    def mask_to_cards(cls, mask: int) -> list['Card']:
+        """Unpack a mask made by `cards_to_mask`. The cards come out sorted.
+
+        Args:
+            mask (int): The mask
+
+        Returns:
+            list[Card]: A sorted list of cards
+        """
+        cards = []
+        while mask:
+            low_bit = mask & -mask
+            cards.append(_CARDS_BY_INDEX[low_bit.bit_length() - 1])
+            mask ^= low_bit
+        return cards
+
+    @classmethod
+    def pack_deal(cls, hands: list[list['Card']]) -> int:
+        """Pack the 4 hands of a deal into a 104 bit integer, 2 bits per card index holding the seat that was dealt the card.
+
+        Args:
+            hands (list[list[Card]]): The hand of each seat
+
+        Returns:
+            int: The packed deal
+        """
+        packed = 0
+        for seat, hand in enumerate(hands):
+            for card in hand:
+                packed |= seat << 2 * card.index()
+        return packed
+
+    @classmethod
+    def unpack_deal(cls, packed: int) -> list[list['Card']]:
+        """Unpack a deal made by `pack_deal`. The hands come out sorted.
+
+        Args:
+            packed (int): The packed deal
+
+        Returns:
+            list[list[Card]]: The hand of each seat
+        """
+        hands: list[list['Deck.Card']] = [[], [], [], []]
+        for index in range(52):
+            hands[packed >> 2 * index & 3].append(cls.card_from_index(index))
+        return hands
+
     class Card:
         '''
         A class to represent a playing card in hearts. Each card has a suit, a rank, and a point value. 
         The rank is an integer, 2-14, where 11 is a jack, 12 is a queen, 13 is a king, and 14 is an ace. (Note that in hearts, the ace is high, so it has a value of 14.)
         '''
+        __slots__ = ("suit", "rank")
         faceCardNames = {11: "Jack", 12: "Queen", 13: "King", 14: "Ace"}
         suiteValues = {"clubs": 0, "hearts": 1, "spades": 2,
                        "diamonds": 3}  # used for sorting value
+        # Position in SUIT of the suit with each sorting value
+        suitOrder = [get_args(SUIT).index(suit) for suit in sorted(
+            suiteValues, key=suiteValues.__getitem__)]
 
         def __init__(self, suit: SUIT, rank: int):
             """Create a new card with the given suit and rank after validating the data.
@@ -76,8 +156,17 @@ class Deck:
             """
             return f"{self.suit[0].lower()}{self.rank}"
 
+        def index(self) -> int:
+            """A compact number for the card, 0-51. Cards are numbered in sorted order, so the index of the 2 of clubs is 0 and the index of the ace of diamonds is 51.
+
+            Returns:
+                int: The index of the card
+            """
+            return self.suiteValues[self.suit] * 13 + self.rank - 2
+
         def points(self) -> int:
             """Return the number of points this card is worth in the game hearts. 1 point for each heart, 13 for the queen of spades, -10 for the jack of diamonds.
+            Games score with the points of their rules instead, see `Game.rules`.
 
             Returns:
                 int: points
@@ -126,3 +215,19 @@ class Deck:
             if self.rank in self.faceCardNames:
                 return f"{self.faceCardNames[self.rank]} of {self.suit.capitalize()}"
             return f"{self.rank} of {self.suit.capitalize()}"
+
+
+# Cards are never changed once made, so the cards looked up by index are shared
+_CARDS_BY_INDEX = [Deck.Card(get_args(SUIT)[Deck.Card.suitOrder[index // 13]], index % 13 + 2)
+                   for index in range(52)]
+
+
+class SeededDeck(Deck):
+    """A deck that shuffles with a generator of its own, so its deals only depend on its seed"""
+
+    def __init__(self, seed: int) -> None:
+        super().__init__()
+        self.rng = random.Random(seed)
+
+    def shuffle(self) -> None:
+        self.rng.shuffle(self.cards)
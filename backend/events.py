@@ -0,0 +1,123 @@
+from enum import IntEnum
+from typing import Callable, Literal, NamedTuple
+
+BATCH = Literal["trick", "round"]
+
+
+class EventKind(IntEnum):
+    # value: the number of rounds played before this one
+    ROUND_START = 0
+    # seat: the passing player, value: the mask of the passed cards, see `Deck.cards_to_mask`
+    PASS = 1
+    # seat: the player, value: the index of the card, see `Deck.Card.index`
+    CARD_PLAYED = 2
+    # seat: the player who broke hearts
+    HEARTS_BROKEN = 3
+    # seat: the winner of the trick, value: the points in the trick
+    TRICK_END = 4
+    # value: the number of rounds played, including this one
+    ROUND_END = 5
+    GAME_END = 6
+    # value: the cards dealt to each seat, see `Deck.pack_deal`
+    DEAL = 7
+
+
+class Event(NamedTuple):
+    kind: EventKind
+    seat: int
+    value: int
+
+
+# Events are packed into one int each: 4 bits of kind, 4 bits of seat and the value above them
+_KIND_BITS = 4
+_SEAT_BITS = 4
+_VALUE_SHIFT = _KIND_BITS + _SEAT_BITS
+
+
+def pack_event(kind: EventKind, seat: int = 0, value: int = 0) -> int:
+    return kind | seat << _KIND_BITS | value << _VALUE_SHIFT
+
+
+def unpack_event(packed: int) -> Event:
+    return Event(EventKind(packed & 0xF), packed >> _KIND_BITS & 0xF, packed >> _VALUE_SHIFT)
+
+
+class _Subscriber:
+    __slots__ = ("callback", "batch", "cursor")
+
+    def __init__(self, callback: Callable[[list[Event]], None], batch: BATCH, cursor: int) -> None:
+        self.callback = callback
+        self.batch = batch
+        # Number of events emitted before the next one this subscriber has not seen
+        self.cursor = cursor
+
+
+class EventStream:
+    """
+    What happens in a game, as a stream of compact events.
+
+    The engine appends events to a fixed size ring buffer and subscribers get them in batches, at the end of each trick
+    or of each round. The engine checks `active` before building an event, so a game nobody subscribed to does no work.
+    """
+
+    def __init__(self, capacity: int = 256) -> None:
+        """
+        Args:
+            capacity (int): Events held in the ring buffer. If a subscriber has not been handed the oldest event
+                when the buffer is full, it gets what has been buffered early
+        """
+        self.capacity = capacity
+        # Made by the first subscriber, most games have none
+        self.buffer: list[int] = []
+        # Number of events emitted so far, the next event goes at `count % capacity`
+        self.count = 0
+        self.subscribers: list[_Subscriber] = []
+        self.active = False
+
+    def subscribe(self, callback: Callable[[list[Event]], None], batch: BATCH = "trick") -> Callable[[], None]:
+        """Get the events of the game from now on.
+
+        Args:
+            callback (Callable[[list[Event]], None]): Called with each batch of events
+            batch (BATCH): Get the events at the end of every trick or every round
+
+        Returns:
+            Callable[[], None]: Call to unsubscribe
+        """
+        if batch not in ("trick", "round"):
+            raise ValueError("Events are batched by trick or by round")
+        if not self.buffer:
+            self.buffer = [0] * self.capacity
+        subscriber = _Subscriber(callback, batch, self.count)
+        self.subscribers.append(subscriber)
+        self.active = True
+
+        def unsubscribe():
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+            self.active = bool(self.subscribers)
+        return unsubscribe
+
+    def emit(self, kind: EventKind, seat: int = 0, value: int = 0) -> None:
+        """Append an event. Does nothing without subscribers."""
+        if not self.active:
+            return
+        if self.count - min(subscriber.cursor for subscriber in self.subscribers) >= self.capacity:
+            # The oldest event is about to be overwritten, hand it out first
+            self._deliver(self.subscribers)
+        self.buffer[self.count % self.capacity] = pack_event(kind, seat, value)
+        self.count += 1
+        if kind == EventKind.TRICK_END:
+            self._deliver([subscriber for subscriber in self.subscribers if subscriber.batch == "trick"])
+        elif kind == EventKind.ROUND_END or kind == EventKind.GAME_END:
+            self._deliver(self.subscribers)
+
+    def _deliver(self, subscribers: list[_Subscriber]) -> None:
+        # Copied, a callback may unsubscribe
+        for subscriber in list(subscribers):
+            if subscriber.cursor == self.count:
+                continue
+            events = [unpack_event(self.buffer[index % self.capacity])
+                      for index in range(subscriber.cursor, self.count)]
+            subscriber.cursor = self.count
+            subscriber.callback(events)
@@ -1,12 +1,27 @@
-from typing import Callable, Optional, TYPE_CHECKING
+import struct
+from typing import Callable, Mapping, Optional, TYPE_CHECKING
 from backend.player import Player
-from backend.deck import Deck
+from backend.deck import Deck, SeededDeck
 from backend.exceptions import BadPlayerListError
 from backend.round import Round
+from backend.hooks import Steps, ignore, no_people, run_steps, run_steps_async
+from backend.events import EventKind, EventStream
+from backend.profiler import BOT, HOOK, HUMAN, Profiler
+from backend.rules import Rules
 import backend.ai as ai
 if TYPE_CHECKING:
     from backend.deck import SUIT
 
+CHECKPOINT_VERSION = 1
+# version, number of players (the rest of the seats are bots), flags, round count, seats that have passed,
+# tricks played in the round, seat leading the trick, cards in the current trick, end game score
+_CHECKPOINT = struct.Struct("<BBBHBBBBh")
+# hand, cards taken and cards passed to the seat as card masks, total score, round score
+_SEAT = struct.Struct("<QQQhh")
+_IN_ROUND = 1
+_PLAYING = 2
+_HEARTS_BROKEN = 4
+
 
 class Game:
     def __init__(self,
@@ -19,13 +34,21 @@ class Game:
                  card_end_hook: Callable[[Player, Deck.Card], None],
                  end_game_hook: Callable[[], None],
                  passed_cards_hook: Callable[[dict[Player, list[Deck.Card]]], None],
-                 settings={'END_GAME_SCORE': 50, 'JACK_NEGATIVE': True}
+                 settings: Optional[Mapping] = None,
+                 bot_play_card: Callable[[Player, Optional['SUIT'], bool, list[Deck.Card]], Deck.Card] = ai.play_card,
+                 bot_pass_cards: Callable[[Player], list[Deck.Card]] = ai.bot_pass_cards,
+                 events: Optional[EventStream] = None,
+                 profiler: Optional[Profiler] = None
                  ) -> None:
         """Initialize the game with the given players and deal the cards. Ensure that there are a correct number of unique players
         Version 1.0 - Only supports 4 players
 
         Args:
             players (list[Player]): A list of players
+            settings (Optional[Mapping]): Settings to change from `backend.rules.DEFAULT_SETTINGS`
+
+        Raises:
+            ValueError: If a setting is unknown or has a bad value
         """
 
         if len([player.name.lower() for player in players]) != len(set([player.name.lower() for player in players])) or len(players) > 4:
@@ -38,7 +61,11 @@ class Game:
                 self.bots.append(Player(f"Bot {i+1}", am_bot=True))
 
         self.players = players
-        self.settings = settings
+        # Every player at the table by seat, see `Player.seat`
+        self.seats = players + self.bots
+        for seat, player in enumerate(self.seats):
+            player.seat = seat
+        self.settings = settings or {}
 
         # Hook that will be called when a player needs to play a card, it will return a valid card to play
         self.play_card = play_card
@@ -51,12 +78,24 @@ class Game:
         self.end_game_hook = end_game_hook
         self.card_played_hook = card_end_hook
         self.passed_cards_hook = passed_cards_hook
+        # Decide for the bots, these default to the functions in `backend.ai`
+        self.bot_play_card = bot_play_card
+        self.bot_pass_cards = bot_pass_cards
+        # Subscribers get what happens in the game in batches, see backend/events.py
+        self.events = events if events is not None else EventStream()
+        # Times the phases and hooks of the game when set, see backend/profiler.py
+        self.profiler = profiler
 
         self.deck = Deck()
 
         self.current_round = None
         # The number of rounds that have been played in this game
         self.round_count = 0
+        # Set from the deal until the round is scored. The round is None while the cards are being passed
+        self.in_round = False
+        self.round: Optional[Round] = None
+        # Seats that have passed this round, they pass in seat order
+        self.passes_made = 0
 
     def pass_cards(self, player: Player, cards: list[Deck.Card]) -> None:
         """Method to pass cards from one player to another. This should be  called in the beginning of each round.
@@ -70,68 +109,243 @@ class Game:
             raise ValueError("You must pass exactly 3 cards")
         if not all([card in player.hand for card in cards]):
             raise ValueError("You must pass cards that are in your hand")
-        all_players = self.players + self.bots
-        player.hand = [card for card in player.hand if card not in cards]
+        player.remove_from_hand(cards)
         # Pass the cards to the correct player
-        if self.round_count % 4 == 0:  # pass to the left
-            other = all_players[(all_players.index(player) - 1) % 4]
-        elif self.round_count % 4 == 1:  # pass to the right
-            other = all_players[(all_players.index(player) + 1) % 4]
-        elif self.round_count % 4 == 2:  # pass across
-            other = all_players[(all_players.index(player) + 2) % 4]
-        else:  # Hold hand
+        offset = self.rules.pass_offset(self.round_count)
+        if offset is None:
             raise ValueError("You should not be passing cards on a hold round")
+        other = self.seats[(player.seat + offset) % 4]
 
         # We don't want to put the cards in the hand yet until everyone has passed
-        other.passed_cards.extend(cards)
+        other.receive_passed_cards(cards)
+        if self.events.active:
+            self.events.emit(EventKind.PASS, player.seat,
+                             Deck.cards_to_mask(cards))
 
     def play_game(self) -> None:
         """Main play loop for the game. We keep playing rounds until a player reaches the end game score.
         """
-        while max([player.total_score for player in self.players]) < self.settings['END_GAME_SCORE']:
-            self.hands = self.deck.deal()
-            for i, player in enumerate(self.players+self.bots):
-                player.set_hand(self.hands[i])
-
-            # Pass cards
-            if self.round_count % 4 != 3:
-                for player in self.players:
-                    cards = self.get_pass_cards(player)
-                    self.pass_cards(player, cards)
-                for bot in self.bots:
-                    cards = ai.bot_pass_cards(bot)
-                    self.pass_cards(bot, cards)
-                # Put the passed cards in the hand
-                passed_cards = {}
-                for player in self.players+self.bots:
-                    player.hand.extend(player.passed_cards)
-                    passed_cards[player] = player.passed_cards
-                    player.passed_cards = []
-
-            self.round = Round(self)  # type: ignore
-            self.round.play_round()
-            for player in self.players+self.bots:
+        run_steps(self.steps())
+
+    async def play_game_async(self) -> None:
+        """Play the game like `play_game`, awaiting the hooks that are async"""
+        await run_steps_async(self.steps())
+
+    def steps(self) -> Steps[None]:
+        """`play_game` as a generator of hook calls, see backend/hooks.py. Carries on from a restored checkpoint."""
+        if self.profiler is None:
+            return self._steps()
+        return self.profiler.phase("game", self._steps(), self.hook_label)
+
+    def _steps(self) -> Steps[None]:
+        profiler = self.profiler
+        # The humans' scores end the game, the bots' when only bots play
+        scorers = self.players or self.bots
+        while self.in_round or max([player.total_score for player in scorers]) < self.rules.end_game_score:
+            if not self.in_round:
+                if profiler is None:
+                    self._deal()
+                else:
+                    profiler.call("deal", self._deal)
+
+            if self.round is None:
+                # Pass cards, except on hold rounds
+                if self.rules.pass_offset(self.round_count) is not None:
+                    passes = self._pass_steps()
+                    if profiler is not None:
+                        passes = profiler.phase("pass", passes)
+                    yield from passes
+                self.round = Round(self)
+
+            yield from self.round.steps()
+            if self.rules.shoot_the_moon:
+                self._shoot_the_moon()
+            for player in self.seats:
                 player.finish_round()  # Update player scores and prepare for next round
 
             self.round_count += 1
-            self.round_end_hook()  # Call round end hook
-        self.end_game_hook()  # Call end game hook
+            self.in_round = False
+            self.events.emit(EventKind.ROUND_END, value=self.round_count)
+            yield self.round_end_hook, ()  # Call round end hook
+        self.events.emit(EventKind.GAME_END)
+        yield self.end_game_hook, ()  # Call end game hook
 
-    def reset_game(self) -> None:
+    @property
+    def settings(self) -> Mapping:
+        """The settings of the game, read only. Set new settings to change them, they are compiled into `rules`."""
+        return self.rules.settings
+
+    @settings.setter
+    def settings(self, settings: Mapping) -> None:
+        self.rules = Rules.compile(settings)
+
+    def _shoot_the_moon(self) -> None:
+        """A player who took every point card gives the points to everyone else"""
+        rules = self.rules
+        for player in self.seats:
+            if Deck.cards_to_mask(player.cards_taken) & rules.point_cards == rules.point_cards:
+                for other in self.seats:
+                    other.round_score += -rules.moon_points if other is player else rules.moon_points
+                    other.touch()
+                return
+
+    def _deal(self) -> None:
+        self.hands = self.deck.deal()
+        for player, hand in zip(self.seats, self.hands):
+            player.set_hand(hand)
+        self.in_round = True
+        self.round = None
+        self.passes_made = 0
+        if self.events.active:
+            self.events.emit(EventKind.ROUND_START, value=self.round_count)
+            self.events.emit(EventKind.DEAL, value=Deck.pack_deal(self.hands))
+
+    def _pass_steps(self) -> Steps[None]:
+        """Every seat that has not passed yet passes, then the passed cards go into the hands"""
+        while self.passes_made < 4:
+            player = self.seats[self.passes_made]
+            if player.am_bot:
+                cards = yield self.bot_pass_cards, (player,)
+            else:
+                cards = yield self.get_pass_cards, (player,)
+            self.pass_cards(player, cards)
+            self.passes_made += 1
+        # Put the passed cards in the hand
+        for player in self.seats:
+            passed_cards = player.passed_cards
+            player.passed_cards = []
+            player.add_to_hand(passed_cards)
+
+    def hook_label(self, hook: Callable) -> str:
+        """The name of a hook of this game in profiles, telling the humans' decisions from the bots' and the rest"""
+        labels = ((self.play_card, HUMAN + "play_card"), (self.get_pass_cards, HUMAN + "pass_cards"),
+                  (self.bot_play_card, BOT + "play_card"), (self.bot_pass_cards, BOT + "pass_cards"),
+                  (self.card_played_hook, HOOK + "card_played"), (self.trick_end_hook, HOOK + "trick_end"),
+                  (self.hearts_broken_hook, HOOK + "hearts_broken"), (self.round_end_hook, HOOK + "round_end"),
+                  (self.passed_cards_hook, HOOK + "passed_cards"), (self.end_game_hook, HOOK + "end_game"))
+        for known, label in labels:
+            if hook is known:
+                return label
+        return HOOK + getattr(hook, "__name__", "hook")
+
+    def checkpoint(self) -> bytes:
+        """Save the state of the game in about 130 bytes. Hooks are not saved, nor are the settings apart from the end game score.
+        Taken from inside a hook, `restore` carries on from the same point.
+
+        Returns:
+            bytes: The checkpoint
         """
-        Reset the game to the initial state
+        flags = _IN_ROUND if self.in_round else 0
+        current_round = self.round if self.in_round else None
+        trick_cards: list[Deck.Card] = []
+        trick_count = lead_seat = 0
+        if current_round is not None:
+            flags |= _PLAYING | (_HEARTS_BROKEN if current_round.hearts_broken else 0)
+            trick_count = current_round.trick_count
+            lead_seat = current_round.lead_player.seat
+            trick = current_round.current_trick
+            if trick is not None and trick.number == trick_count:
+                trick_cards = trick.cards[:trick.size]
+        parts = [_CHECKPOINT.pack(CHECKPOINT_VERSION, len(self.players), flags, self.round_count, self.passes_made,
+                                  trick_count, lead_seat, len(trick_cards), self.rules.end_game_score)]
+        for player in self.seats:
+            parts.append(_SEAT.pack(Deck.cards_to_mask(player.hand), Deck.cards_to_mask(player.cards_taken),
+                                    Deck.cards_to_mask(player.passed_cards), player.total_score, player.round_score))
+        parts.append(bytes(card.index() for card in trick_cards))
+        return b''.join(parts)
+
+    def restore(self, data: bytes) -> None:
+        """Put the game in the state saved by `checkpoint`, `steps` and `play_game` then carry on from there.
+        The players keep their names and this game's hooks are used.
+
+        Args:
+            data (bytes): The checkpoint
+
+        Raises:
+            ValueError: If the data is not a checkpoint of a game with as many players as this one
         """
-        self.deck = Deck()
-        self.hands = self.deck.deal()
-        for i, player in enumerate(self.players+self.bots):
-            player.set_hand(self.hands[i])
+        if len(data) < _CHECKPOINT.size:
+            raise ValueError("Not a game checkpoint")
+        (version, player_count, flags, round_count, passes_made,
+         trick_count, lead_seat, trick_size, end_game_score) = _CHECKPOINT.unpack_from(data)
+        if version != CHECKPOINT_VERSION or len(data) != _CHECKPOINT.size + 4 * _SEAT.size + trick_size:
+            raise ValueError("Not a game checkpoint or an unsupported version")
+        if player_count != len(self.players):
+            raise ValueError(f"The checkpoint is of a game with {player_count} players")
+
+        for seat, player in enumerate(self.seats):
+            hand, taken, passed, total_score, round_score = _SEAT.unpack_from(
+                data, _CHECKPOINT.size + seat * _SEAT.size)
+            # Masks unpack sorted, as the players keep them
+            player.hand = Deck.mask_to_cards(hand)
+            player.hand_mask = hand
+            player.cards_taken = Deck.mask_to_cards(taken)
+            player.passed_cards = Deck.mask_to_cards(passed)
+            player.total_score = total_score
+            player.round_score = round_score
+            player.touch()
+        if self.rules.end_game_score != end_game_score:
+            self.settings = {**self.settings, 'END_GAME_SCORE': end_game_score}
+        self.round_count = round_count
+        self.in_round = bool(flags & _IN_ROUND)
+        self.passes_made = passes_made
+        self.round = None
+        if flags & _PLAYING:
+            self.round = Round(self, self.seats[lead_seat])
+            self.round.trick_count = trick_count
+            self.round.hearts_broken = bool(flags & _HEARTS_BROKEN)
+            self.round.current_trick = self.round.Trick(self.round)
+            self.round.current_trick.restore(
+                [Deck.card_from_index(index) for index in data[-trick_size:]] if trick_size else [])
 
+    def reset_game(self) -> None:
+        """
+        Reset the game to the initial state and deal new hands. The deck, the players and the hooks are kept,
+        so a finished game can be played again without making new objects.
+        """
+        for player in self.seats:
+            player.reset()
         self.round_count = 0
-        self.trick_count = 0
+        self._deal()
+
+    def seat_players(self, names: list[str]) -> None:
+        """Seat new people at the table for the next game, bots take the other seats. Call `reset_game` after.
+
+        Raises:
+            BadPlayerListError: If there are more than 4 names or two of them are the same
+        """
+        if len({name.lower() for name in names}) != len(names) or len(names) > 4:
+            raise BadPlayerListError(
+                "Up to 4 people may play, each must have a different name")
+        for seat, player in enumerate(self.seats):
+            player.am_bot = seat >= len(names)
+            player.name = f"Bot {seat - len(names) + 1}" if player.am_bot else names[seat]
+        self.players = self.seats[:len(names)]
+        self.bots = self.seats[len(names):]
 
     def print_current_hands(self) -> None:
-        for player in self.players+self.bots:
+        for player in self.seats:
             print(f"{player}: ", end="")
             for card in Deck.sort_hand(player.hand):
                 print(card, end=", ")
             print("\n\n", "-"*20, "\n")
+
+
+# The hooks of `Game` that only tell what happened
+_NOTIFICATION_HOOKS = ("hearts_broken_hook", "round_end_hook", "trick_end_hook", "card_end_hook", "end_game_hook",
+                       "passed_cards_hook")
+
+
+def bot_game(seed: Optional[int] = None, **options) -> Game:
+    """A game between four bots, not started yet.
+
+    Args:
+        seed (Optional[int]): Deal from a `SeededDeck`, so the game only depends on the seed. Without one the game deals
+            from the shared `random` generator.
+        options: Arguments of `Game` by name, like the settings or the bot hooks. Notification hooks that are not given
+            are ignored.
+    """
+    game = Game([], no_people, no_people, **{**{hook: ignore for hook in _NOTIFICATION_HOOKS}, **options})
+    if seed is not None:
+        game.deck = SeededDeck(seed)
+    return game
@@ -0,0 +1,369 @@
+"""
+Compact binary log of a game, and a replay engine that rebuilds any position from it.
+
+A log is a header, with the settings of the game and the names of its players, followed by an append-only stream of
+records:
+ - a card played is a single byte, the index of the card (0-51)
+ - DEAL followed by the packed deal (13 bytes, see `Deck.pack_deal`)
+ - PASS followed by the seat and the indices of the 3 cards passed
+ - SCORES followed by the total score of each seat after the round (4 int16)
+ - END when the game is over
+Who played each card is not stored, the replay works it out from the rules. A full game takes a few hundred bytes.
+"""
+import struct
+from typing import BinaryIO, Iterator, Optional
+
+from backend.deck import Deck
+from backend.events import BATCH, Event, EventKind
+from backend.game import Game
+from backend.hooks import HookCall, Steps, ignore
+from backend.player import Player
+from backend.rules import PASS_OFFSETS, Rules
+
+MAGIC = b"HLOG"
+# Version 2 logs every setting, version 1 only had the end game score
+LOG_VERSION = 2
+
+DEAL = 0x80
+PASS = 0x81
+SCORES = 0x82
+END = 0x83
+
+# magic, version, end game score, flags of the settings below, passing cycle length, number of players (the rest of
+# the seats are bots). The passing cycle follows, one byte per round as the index of its direction in PASS_OFFSETS,
+# then the names.
+_HEADER = struct.Struct("<4sBhBBB")
+_FLAG_SETTINGS = ('JACK_NEGATIVE', 'FIRST_TRICK_POINTS', 'SHOOT_THE_MOON')
+_DIRECTIONS = tuple(PASS_OFFSETS)
+_SCORES = struct.Struct("<4h")
+_DEAL_BYTES = 13
+# Length prefix of each game in a file of many games, see `append_framed`
+_FRAME = struct.Struct("<I")
+
+
+class ReplayError(ValueError):
+    pass
+
+
+class GameLogWriter:
+    """Writes the log of a game to a binary stream, one write per round or per trick. Subscribes to the game's events."""
+
+    def __init__(self, stream: BinaryIO, game: Game, batch: BATCH = "round", header: bool = True) -> None:
+        """Write the header and start logging.
+
+        Args:
+            stream (BinaryIO): Where to append the log
+            game (Game): A game that has not started yet, or that was just restored with `GameReplay.restore`
+            batch (BATCH): Write at the end of every "round", or of every "trick" so less is lost if the process dies
+            header (bool): False to carry on a log that already has one, after a restore
+        """
+        self.stream = stream
+        self.game = game
+        if header:
+            rules = game.rules
+            flags = sum(bool(rules.settings[setting]) << bit for bit, setting in enumerate(_FLAG_SETTINGS))
+            parts = [_HEADER.pack(MAGIC, LOG_VERSION, rules.end_game_score, flags,
+                                  len(rules.pass_cycle), len(game.players)),
+                     bytes(_DIRECTIONS.index(direction) for direction in rules.pass_cycle)]
+            for player in game.players:
+                # Cut to 255 bytes on a character boundary, so the name still decodes
+                name = player.name.encode()[:255].decode(errors="ignore").encode()
+                parts.append(bytes([len(name)]) + name)
+            stream.write(b''.join(parts))
+        self.unsubscribe = game.events.subscribe(self.write_events, batch)
+
+    def write_events(self, events: list[Event]) -> None:
+        record = bytearray()
+        for kind, seat, value in events:
+            if kind == EventKind.CARD_PLAYED:
+                record.append(value)
+            elif kind == EventKind.DEAL:
+                record.append(DEAL)
+                record += value.to_bytes(_DEAL_BYTES, 'little')
+            elif kind == EventKind.PASS:
+                record.append(PASS)
+                record.append(seat)
+                record += bytes(card.index() for card in Deck.mask_to_cards(value))
+            elif kind == EventKind.ROUND_END:
+                # Delivered as the round ends, so the scores are up to date
+                record.append(SCORES)
+                record += _SCORES.pack(*(player.total_score for player in self.game.seats))
+            elif kind == EventKind.GAME_END:
+                record.append(END)
+                self.unsubscribe()
+        self.stream.write(bytes(record))
+
+
+class _Round:
+    __slots__ = ("deal", "passes", "plays", "scores")
+
+    def __init__(self, deal: list[list[Deck.Card]]) -> None:
+        self.deal = deal
+        self.passes: dict[int, list[Deck.Card]] = {}
+        self.plays = bytearray()
+        self.scores: Optional[tuple[int, ...]] = None
+
+
+class _EndOfLog(Exception):
+    pass
+
+
+class _LoggedDeck(Deck):
+    """Deals the logged hands instead of shuffling"""
+
+    def __init__(self, rounds: list[_Round]) -> None:
+        super().__init__()
+        self.rounds = iter(rounds)
+
+    def deal(self) -> list[list[Deck.Card]]:
+        try:
+            return [list(hand) for hand in next(self.rounds).deal]
+        except StopIteration:
+            raise _EndOfLog() from None
+
+
+class _ResumedDeck(_LoggedDeck):
+    """Deals the logged hands, then shuffles once the log runs out"""
+
+    def deal(self) -> list[list[Deck.Card]]:
+        try:
+            return super().deal()
+        except _EndOfLog:
+            return Deck.deal(self)
+
+
+# Stand in for the hooks of a replayed game. They are never called, the replay answers the decisions from the log
+def _logged_play(*args):
+    raise ReplayError("A replayed game must be driven by GameReplay")
+
+
+def _logged_pass(*args):
+    raise ReplayError("A replayed game must be driven by GameReplay")
+
+
+def _round_ended() -> None:
+    pass
+
+
+class GameReplay:
+    """
+    Rebuilds positions of a logged game by playing it through the engine with the logged deals, passes and plays.
+    No hooks are called.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        """Parse a log made by `GameLogWriter`
+
+        Raises:
+            ReplayError: If the data is not a game log
+        """
+        if len(data) < _HEADER.size:
+            raise ReplayError("Not a game log")
+        magic, version, self.end_game_score, flags, cycle_length, player_count = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != LOG_VERSION:
+            raise ReplayError("Not a game log or an unsupported version")
+        offset = _HEADER.size + cycle_length
+        try:
+            settings = {setting: bool(flags >> bit & 1) for bit, setting in enumerate(_FLAG_SETTINGS)}
+            settings['END_GAME_SCORE'] = self.end_game_score
+            settings['PASS_CYCLE'] = tuple(_DIRECTIONS[index] for index in data[_HEADER.size:offset])
+            # The rules the game was played with
+            self.rules = Rules.compile(settings)
+        except (ValueError, IndexError):
+            raise ReplayError("The logged settings are not valid")
+        self.names: list[str] = []
+        for _ in range(player_count):
+            length = data[offset]
+            self.names.append(data[offset + 1:offset + 1 + length].decode())
+            offset += 1 + length
+
+        self.rounds: list[_Round] = []
+        self.finished = False
+        record_sizes = {DEAL: _DEAL_BYTES, PASS: 4, SCORES: _SCORES.size}
+        while offset < len(data):
+            tag = data[offset]
+            offset += 1
+            if offset + record_sizes.get(tag, 0) > len(data):
+                break  # The log was cut off in the middle of a record
+            if tag < 52:
+                self._current_round().plays.append(tag)
+            elif tag == DEAL:
+                self.rounds.append(_Round(Deck.unpack_deal(
+                    int.from_bytes(data[offset:offset + _DEAL_BYTES], 'little'))))
+                offset += _DEAL_BYTES
+            elif tag == PASS:
+                seat = data[offset]
+                self._current_round().passes[seat] = [
+                    Deck.card_from_index(index) for index in data[offset + 1:offset + 4]]
+                offset += 4
+            elif tag == SCORES:
+                self._current_round().scores = _SCORES.unpack_from(data, offset)
+                offset += _SCORES.size
+            elif tag == END:
+                self.finished = True
+            else:
+                raise ReplayError(f"Unknown record {tag:#x} at byte {offset - 1}")
+
+    def _current_round(self) -> _Round:
+        if not self.rounds:
+            raise ReplayError("Record before the first deal")
+        return self.rounds[-1]
+
+    def new_game(self) -> Game:
+        """A game with the logged players and settings, set up to be replayed"""
+        game = Game([Player(name) for name in self.names],
+                    _logged_play, _logged_pass,
+                    ignore, _round_ended, ignore, ignore, ignore, ignore,
+                    settings=self.rules.settings,
+                    bot_play_card=_logged_play, bot_pass_cards=_logged_pass)
+        game.deck = _LoggedDeck(self.rounds)
+        return game
+
+    def positions(self) -> Iterator[tuple[Game, int, int]]:
+        """Replay the game, stopping before every card is played.
+
+        Yields:
+            tuple[Game, int, int]: The game, the round and the number of cards played so far in the round.
+                The game is only valid until the next position is asked for
+        """
+        game = self.new_game()
+        seats = game.seats
+        steps = game.steps()
+        round_index = -1
+        plays = iter(())
+        result = None
+        while True:
+            try:
+                hook, args = steps.send(result)
+            except (StopIteration, _EndOfLog):  # The game is over or the log stops between rounds
+                return
+            result = None
+            if hook is _logged_pass:
+                if game.round_count != round_index:
+                    round_index, plays = game.round_count, iter(self.rounds[game.round_count].plays)
+                try:
+                    result = self.rounds[round_index].passes[args[0].seat]
+                except KeyError:
+                    if round_index == len(self.rounds) - 1:
+                        return  # The log ends during the passes
+                    raise ReplayError(f"No pass logged for {args[0]} in round {round_index}") from None
+            elif hook is _logged_play:
+                if game.round_count != round_index:  # A hold round, nothing was passed
+                    round_index, plays = game.round_count, iter(self.rounds[game.round_count].plays)
+                current_round = game.round
+                yield game, round_index, current_round.trick_count * 4 + current_round.current_trick.size  # type: ignore
+                try:
+                    result = Deck.card_from_index(next(plays))
+                except StopIteration:
+                    return  # The log ends here
+            elif hook is _round_ended:
+                logged = self.rounds[game.round_count - 1].scores
+                scores = tuple(player.total_score for player in seats)
+                if logged is not None and logged != scores:
+                    raise ReplayError(
+                        f"Round {game.round_count - 1} ended with scores {scores}, the log says {logged}")
+
+    def restore(self, game: Game) -> Steps[None]:
+        """Bring a new game to where the log ends, to carry on a game that was interrupted.
+        The hooks of the game are not called for anything in the log, including the notification hooks.
+
+        Args:
+            game (Game): A game with the logged players and settings that has not started
+
+        Raises:
+            ReplayError: If the game does not have the logged players, or the log does not match the rules
+
+        Returns:
+            Steps[None]: The rest of the game, starting with the first decision that is not in the log.
+                Drive it like `Game.steps()`
+        """
+        if [player.name for player in game.players] != self.names:
+            raise ReplayError(f"The log is of a game between {self.names}")
+        game.deck = _ResumedDeck(self.rounds)
+        seats = game.seats
+        steps = game.steps()
+        result = None
+        while True:
+            try:
+                call = steps.send(result)
+            except StopIteration:
+                return _continue(steps, None)
+            hook, args = call
+            result = None
+            logged = self.rounds[game.round_count] if game.round_count < len(self.rounds) else None
+            if hook is game.get_pass_cards or hook is game.bot_pass_cards:
+                cards = logged.passes.get(args[0].seat) if logged else None
+                if cards is None:
+                    return _continue(steps, call)
+                result = list(cards)
+            elif hook is game.play_card or hook is game.bot_play_card:
+                current_round = game.round
+                played = current_round.trick_count * 4 + current_round.current_trick.size  # type: ignore
+                if logged is None or played >= len(logged.plays):
+                    return _continue(steps, call)
+                result = Deck.card_from_index(logged.plays[played])
+            elif hook is game.round_end_hook:
+                scores = tuple(player.total_score for player in seats)
+                expected = self.rounds[game.round_count - 1].scores
+                if expected is not None and expected != scores:
+                    raise ReplayError(
+                        f"Round {game.round_count - 1} ended with scores {scores}, the log says {expected}")
+
+    def seek(self, round_index: int, play: int = 0) -> Game:
+        """Fast forward to a position.
+
+        Args:
+            round_index (int): The round, counting from 0
+            play (int): The number of cards played in the round so far, 0-51
+
+        Raises:
+            ReplayError: If the log does not reach the position
+
+        Returns:
+            Game: The game just before the card is played. Its `round.current_trick` holds the cards of the trick so far
+        """
+        for game, position_round, position_play in self.positions():
+            if (position_round, position_play) == (round_index, play):
+                return game
+        raise ReplayError(f"The log does not reach card {play} of round {round_index}")
+
+    def final_game(self) -> Game:
+        """Replay the whole log, checking the logged scores of each round
+
+        Returns:
+            Game: The game after the last logged play
+        """
+        game = None
+        for game, _, _ in self.positions():
+            pass
+        if game is None:
+            raise ReplayError("The log has no plays")
+        return game
+
+
+def _continue(steps: Steps[None], pending: Optional[HookCall]) -> Steps[None]:
+    """The steps of a restored game, starting with the hook call it stopped at"""
+    if pending is None:
+        return
+    result = yield pending
+    while True:
+        try:
+            call = steps.send(result)
+        except StopIteration:
+            return
+        result = yield call
+
+
+def append_framed(stream: BinaryIO, log: bytes) -> None:
+    """Append the log of a finished game to a file of many games"""
+    stream.write(_FRAME.pack(len(log)) + log)
+
+
+def read_framed(data: bytes) -> Iterator[bytes]:
+    """Split a file written by `append_framed` back into game logs"""
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        (length,) = _FRAME.unpack_from(data, offset)
+        offset += _FRAME.size
+        yield data[offset:offset + length]
+        offset += length
@@ -0,0 +1,64 @@
+from inspect import isawaitable
+from typing import Any, Callable, Generator, TypeVar
+
+T = TypeVar('T')
+
+# The engine is written as generators that yield each hook it needs called, with its arguments, and get the result
+# sent back. The same game can then be driven by `run_steps` with plain hooks or by `run_steps_async` with async hooks.
+HookCall = tuple[Callable[..., Any], tuple]
+Steps = Generator[HookCall, Any, T]
+
+
+def run_steps(steps: Steps[T]) -> T:
+    """Drive the engine, calling each hook it yields.
+
+    Args:
+        steps (Steps[T]): The engine generator
+
+    Raises:
+        TypeError: If a hook is async, those games must be played with `run_steps_async`
+
+    Returns:
+        T: The return value of the generator
+    """
+    result = None
+    while True:
+        try:
+            hook, args = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = hook(*args)
+        if isawaitable(result):
+            if hasattr(result, 'close'):
+                result.close()  # type: ignore
+            raise TypeError(
+                f"{getattr(hook, '__name__', hook)} is async, start the game with start_game_async")
+
+
+async def run_steps_async(steps: Steps[T]) -> T:
+    """Drive the engine, calling each hook it yields and awaiting the hooks that are async.
+
+    Args:
+        steps (Steps[T]): The engine generator
+
+    Returns:
+        T: The return value of the generator
+    """
+    result = None
+    while True:
+        try:
+            hook, args = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = hook(*args)
+        if isawaitable(result):
+            result = await result
+
+
+def ignore(*args) -> None:
+    """A notification hook for games that need not be told"""
+
+
+def no_people(*args) -> None:
+    """The decision hooks of people in games played by bots only, which never call them"""
+    raise RuntimeError("Only bots play this game")
@@ -1,38 +1,93 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Optional
+from bisect import insort
+from itertools import count
+from typing import TYPE_CHECKING, Iterable, Optional
 
+from backend.deck import Deck
 from backend.exceptions import NoLegalMovesError
+from backend.rules import DEFAULT_RULES, Rules
 
 if TYPE_CHECKING:
-    from deck import SUIT, Deck
+    from deck import SUIT
     from round import Round
 
+# Versions are shared by every player, so the newest version of the players of a game is the version of the game
+_versions = count(1)
+
 
 class Player:
     """A class to represent a player in the hearts game"""
+    __slots__ = ("name", "am_bot", "seat", "hand", "hand_mask", "total_score", "round_score", "cards_taken",
+                 "passed_cards", "version")
 
     def __init__(self, name: str, am_bot=False) -> None:
         self.name = name
         self.am_bot = am_bot  # Am I a bot?
+        # Where the player sits at the table, 0-3, set by the game. The humans sit first, then the bots
+        self.seat = 0
         self.hand: list[Deck.Card] = []
+        # The hand as a mask of card indices, see `Deck.cards_to_mask`
+        self.hand_mask = 0
         self.total_score = 0
         self.round_score = 0  # The score of the player in the current round
         # A list of tricks taken by the player in the current round
         self.cards_taken: list['Deck.Card'] = []
         # The cards that the player has passed
         self.passed_cards: list['Deck.Card'] = []
+        # Changes whenever the hand, cards or scores of the player change, so views of the player can be cached.
+        # The engine changes players through the methods below, which keep the hand and cards taken sorted.
+        self.version = next(_versions)
+
+    def touch(self) -> None:
+        """Mark the player as changed"""
+        self.version = next(_versions)
+
+    def reset(self) -> None:
+        """Clear the hand, cards and scores for a new game"""
+        self.hand = []
+        self.hand_mask = 0
+        self.total_score = 0
+        self.round_score = 0
+        self.cards_taken = []
+        self.passed_cards = []
+        self.touch()
 
     def set_hand(self, hand: list['Deck.Card']):
-        self.hand = hand
+        self.hand = sorted(hand)
+        self.hand_mask = Deck.cards_to_mask(self.hand)
+        self.touch()
+
+    def add_to_hand(self, cards: Iterable['Deck.Card']):
+        for card in cards:
+            insort(self.hand, card)
+            self.hand_mask |= 1 << card.index()
+        self.touch()
+
+    def remove_from_hand(self, cards: Iterable['Deck.Card']):
+        for card in cards:
+            self.hand.remove(card)
+            self.hand_mask &= ~(1 << card.index())
+        self.touch()
+
+    def receive_passed_cards(self, cards: list['Deck.Card']):
+        self.passed_cards.extend(cards)
+        self.touch()
+
+    def take_trick(self, cards: Iterable['Deck.Card'], points: int):
+        for card in cards:
+            insort(self.cards_taken, card)
+        self.round_score += points
+        self.touch()
 
     def finish_round(self):
         self.total_score += self.round_score
-        # TODO: Check if the player has shot the moon
         self.round_score = 0
         self.cards_taken = []
         self.passed_cards = []
+        self.touch()
 
-    def allowed_cards_to_play(self, hearts_broken: bool, first_round: bool, led_suit: Optional['SUIT'], is_leading: bool) -> list['Deck.Card']:
+    def allowed_cards_to_play(self, hearts_broken: bool, first_round: bool, led_suit: Optional['SUIT'], is_leading: bool,
+                              rules: Rules = DEFAULT_RULES) -> list['Deck.Card']:
         """Get the cards that the player is allowed to play in the current trick.
 
         Args:
@@ -41,47 +96,18 @@ class Player:
 
             led_suit (Optional[SUIT]): The suit that was led in the trick, None if the player is leading (except first round where it is clubs)
             is_leading (bool): true if the player is leading the trick, false otherwise
-
-
+            rules (Rules): The rules of the game, see `Game.rules`
 
         Returns:
             list[Deck.Card]: The cards that the player is allowed to play
         """
-
-        void_in_led_suit = led_suit and not any(
-            [card.suit == led_suit for card in self.hand])
-        only_hearts_left = all([card.suit == "hearts" for card in self.hand])
-        if first_round:
-            if is_leading:
-                # We must have the 2 of clubs
-                result = [card for card in self.hand if card.suit ==
-                          "clubs" and card.rank == 2]
-            else:
-                if void_in_led_suit:  # Play any non point card
-                    # Play any card if no non point card is found
-                    result = [card for card in self.hand if card.points()
-                              <= 0] or self.hand
-                else:
-                    result = [
-                        card for card in self.hand if card.suit == "clubs"]
-
-        else:  # Not the first round
-            if led_suit is None:  # Player is leading
-                if hearts_broken or only_hearts_left:
-                    result = self.hand
-                else:
-                    result = [
-                        card for card in self.hand if card.suit != "hearts"]
-            else:  # someone else led
-                if void_in_led_suit:
-                    result = self.hand
-                else:
-                    # Play the same suit if possible
-                    result = [
-                        card for card in self.hand if card.suit == led_suit]
-        if not result:
+        hand = self.hand_mask
+        allowed = rules.allowed_mask(hand, hearts_broken, first_round, led_suit, is_leading)
+        if not allowed:
             raise NoLegalMovesError("No legal moves for player")
-        return result
+        if allowed == hand:
+            return list(self.hand)
+        return Deck.mask_to_cards(allowed)
 
     def __repr__(self):
         return self.name
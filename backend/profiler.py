@@ -0,0 +1,172 @@
+"""
+Opt-in profiler of where a game spends its time.
+
+The engine marks its phases (the game, dealing, passing, each round and trick, the rule checks and the scoring of a
+trick) and every hook call is a frame of its own under the phase that made it. Time is charged to the innermost
+frame running, so waiting on a human, deciding for a bot and computing in the engine come out apart. A game without
+a profiler checks for one once per phase and does nothing else.
+
+    profiler = Profiler()
+    api.set_profiler(profiler)
+    api.start_game()
+    profiler.summary()
+    with open("game.folded", "w") as out:
+        profiler.write_collapsed(out)
+
+The collapsed stacks are what flamegraph.pl and speedscope read.
+"""
+import time
+from collections import defaultdict
+from typing import Any, Callable, Optional, TextIO, TypeVar
+
+from backend.hooks import Steps
+
+T = TypeVar('T')
+
+# Prefixes of the hook frames, see `Game.hook_label`
+HUMAN = "human:"
+BOT = "bot:"
+HOOK = "hook:"
+
+
+def _default_label(hook: Callable) -> str:
+    return HOOK + getattr(hook, "__name__", "hook")
+
+
+class Profiler:
+    """Wall and CPU time of every stack of phases and hooks, for one game at a time"""
+
+    def __init__(self) -> None:
+        self.stack: list[str] = []
+        # Time spent with exactly this stack running, and how many times the innermost frame was entered
+        self.wall: defaultdict[tuple[str, ...], float] = defaultdict(float)
+        self.cpu: defaultdict[tuple[str, ...], float] = defaultdict(float)
+        self.calls: defaultdict[tuple[str, ...], int] = defaultdict(int)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        # Set while an outer phase is timing the hooks
+        self._driving = False
+
+    def _mark(self) -> None:
+        """Charge the time since the last mark to the running stack"""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if self.stack:
+            key = tuple(self.stack)
+            self.wall[key] += wall - self._wall
+            self.cpu[key] += cpu - self._cpu
+        self._wall = wall
+        self._cpu = cpu
+
+    def push(self, name: str) -> None:
+        self._mark()
+        self.stack.append(name)
+        self.calls[tuple(self.stack)] += 1
+
+    def pop(self) -> None:
+        self._mark()
+        self.stack.pop()
+
+    def call(self, name: str, function: Callable[..., T], *args: Any) -> T:
+        """Call a function as a phase"""
+        self.push(name)
+        try:
+            return function(*args)
+        finally:
+            self.pop()
+
+    def phase(self, name: str, steps: Steps[T], label: Callable[[Callable], str] = _default_label) -> Steps[T]:
+        """Run engine steps as a phase. The outermost phase also times the hooks, each as a frame named by `label`.
+
+        Args:
+            name (str): The phase
+            steps (Steps[T]): The steps of the phase, see backend/hooks.py
+            label (Callable[[Callable], str]): Names the frame of a hook
+
+        Returns:
+            Steps[T]: The same steps, to drive in their place
+        """
+        outermost = not self._driving
+        self._driving = True
+        self.push(name)
+        try:
+            if not outermost:
+                return (yield from steps)
+            result = None
+            while True:
+                try:
+                    hook, args = steps.send(result)
+                except StopIteration as stop:
+                    return stop.value
+                self.push(label(hook))
+                try:
+                    result = yield hook, args
+                finally:
+                    self.pop()
+        finally:
+            self.pop()
+            if outermost:
+                self._driving = False
+
+    def reset(self) -> None:
+        self.stack.clear()
+        self.wall.clear()
+        self.cpu.clear()
+        self.calls.clear()
+        self._driving = False
+        self._mark()
+
+    def _totals(self, keep: Callable[[tuple[str, ...]], Optional[str]]) -> dict[str, dict[str, float]]:
+        """Wall and CPU time summed by the name `keep` gives each stack, stacks it gives None are left out"""
+        totals: dict[str, dict[str, float]] = {}
+        for key in set(self.wall) | set(self.calls):
+            name = keep(key)
+            if name is None:
+                continue
+            total = totals.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            total["calls"] += self.calls.get(key, 0)
+        for key, wall in self.wall.items():
+            for name in {keep(key[:depth]) for depth in range(1, len(key) + 1)} - {None}:
+                totals[name]["wall"] += wall  # type: ignore
+                totals[name]["cpu"] += self.cpu[key]  # type: ignore
+        return totals
+
+    def summary(self) -> dict:
+        """Where the time went, in seconds.
+
+        Returns:
+            dict: "phases" and "hooks" with the wall time, CPU time and calls of each, counting what runs inside them,
+                and "split": the wall time spent waiting on humans, deciding for bots, in the other hooks and in the engine
+        """
+        def is_hook(name: str) -> bool:
+            return name.startswith((HUMAN, BOT, HOOK))
+
+        split = {"human_wait": 0.0, "bot": 0.0, "hooks": 0.0, "engine": 0.0}
+        for key, wall in self.wall.items():
+            innermost = key[-1]
+            if innermost.startswith(HUMAN):
+                split["human_wait"] += wall
+            elif innermost.startswith(BOT):
+                split["bot"] += wall
+            elif innermost.startswith(HOOK):
+                split["hooks"] += wall
+            else:
+                split["engine"] += wall
+        return {
+            "phases": self._totals(lambda key: None if is_hook(key[-1]) else key[-1]),
+            "hooks": self._totals(lambda key: key[-1] if is_hook(key[-1]) else None),
+            "split": split,
+        }
+
+    def write_collapsed(self, out: TextIO, cpu: bool = False) -> None:
+        """Write the stacks in the collapsed format of flamegraph.pl, one line per stack with its microseconds
+
+        Args:
+            out (TextIO): Where to write
+            cpu (bool): CPU time instead of wall time
+        """
+        times = self.cpu if cpu else self.wall
+        for key in sorted(times):
+            microseconds = round(times[key] * 1e6)
+            if microseconds > 0:
+                out.write(f"{';'.join(key)} {microseconds}\n")
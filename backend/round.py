@@ -2,7 +2,8 @@
 from typing import Optional, TYPE_CHECKING
 
 from backend.deck import Deck
-import backend.ai as ai
+from backend.hooks import Steps, run_steps
+from backend.events import EventKind
 if TYPE_CHECKING:
     from backend.player import Player
     from backend.deck import SUIT
@@ -10,49 +11,78 @@ if TYPE_CHECKING:
 
 
 class Round:
-    def __init__(self, game: 'Game') -> None:
+    __slots__ = ("game", "players", "bots", "seats", "trick_count", "lead_player", "hearts_broken", "current_trick")
+
+    def __init__(self, game: 'Game', lead_player: Optional['Player'] = None) -> None:
         """Initialize the round with the given players. The round will keep track of the tricks played and the lead player for each trick.
 
         Args:
-            players (list[Player]): The list of players
+            game (Game): The game the round is part of
+            lead_player (Optional[Player]): Who leads the current trick, the player with the 2 of clubs by default
         """
         self.game = game
 
         self.players = game.players
         self.bots = game.bots
+        self.seats = game.seats
         self.trick_count = 0
-        self.lead_player: 'Player' = self.get_first_player()
+        self.lead_player: 'Player' = lead_player or self.get_first_player()
         self.hearts_broken = False
-        self.current_trick: Optional[self.Trick] = None
+        # One trick is played after another in the same object, see `Trick.reset`
+        self.current_trick: Optional[Round.Trick] = None
 
     def play_round(self) -> None:
         """
         Play the 13 tricks of the round. Update the scores of the players and store the tricks taken by each player.
         """
-        for _ in range(13):
-            self.current_trick = self.Trick(self)
-            self.current_trick.play_trick()
-            self.game.trick_end_hook(self.current_trick)
-            print('\n', self.current_trick, '\n')
-
-            winner = self.current_trick.winner
-            if winner is None:
-                raise ValueError("No winner found for the trick")
-            # Update local score of the player who took the trick
-            played_cards = self.current_trick.played.values()
-            winner.round_score += sum([card.points()
-                                      for card in played_cards])
-
-            # Store the trick in the player's tricks_taken list
-            winner.cards_taken.extend(played_cards)
-
-            # Update the lead player for the next trick
-            self.lead_player = winner
-
-            # Remove the played cards from the player's hand
-            for player, card in self.current_trick.played.items():
-                player.hand.remove(card)
-            self.trick_count += 1
+        run_steps(self.steps())
+
+    def steps(self) -> Steps[None]:
+        """`play_round` as a generator of hook calls, see backend/hooks.py. Carries on from the current trick of a restored round."""
+        profiler = self.game.profiler
+        if profiler is None:
+            return self._steps()
+        return profiler.phase("round", self._steps(), self.game.hook_label)
+
+    def _steps(self) -> Steps[None]:
+        profiler = self.game.profiler
+        while self.trick_count < 13:
+            trick = self.current_trick
+            if trick is None:
+                trick = self.current_trick = self.Trick(self)
+            elif trick.number != self.trick_count:
+                trick.reset()
+            if trick.winner is None:
+                yield from trick.steps()
+                yield self.game.trick_end_hook, (trick,)
+            if profiler is None:
+                self._finish_trick()
+            else:
+                profiler.call("score", self._finish_trick)
+
+    def _finish_trick(self) -> None:
+        """Give the current trick to its winner, who leads the next one"""
+        trick: Round.Trick = self.current_trick  # type: ignore
+        winner = trick.winner
+        if winner is None:
+            raise ValueError("No winner found for the trick")
+        # Update local score of the player who took the trick
+        cards = trick.cards
+        points = self.game.rules.trick_points(cards)  # type: ignore
+        # Store the trick in the player's tricks_taken list
+        winner.take_trick(cards, points)  # type: ignore
+        events = self.game.events
+        if events.active:
+            events.emit(EventKind.TRICK_END, winner.seat, points)
+
+        # Update the lead player for the next trick
+        self.lead_player = winner
+
+        # Remove the played cards from the player's hand
+        seats = self.seats
+        for position, card in enumerate(cards):
+            seats[(trick.lead + position) % 4].remove_from_hand((card,))
+        self.trick_count += 1
 
     def get_first_player(self) -> 'Player':
         """Method to determine the first player of the round. This is the player with the 2 of clubs.
@@ -61,14 +91,16 @@ class Round:
             Player: The player who has the 2 of clubs
         """
 
-        for player in self.players+self.bots:
-            if Deck.Card("clubs", 2) in player.hand:
+        for player in self.seats:
+            if player.hand_mask & _TWO_OF_CLUBS:
                 return player
 
         # To fix the typing error possibility of no player returning
         raise ValueError("No player has the 2 of clubs")
 
     class Trick:
+        __slots__ = ("round", "game", "seats", "number", "lead", "seat", "cards", "size", "led_suit", "winner")
+
         def __init__(self, round: 'Round') -> None:
             """Sub class of Round to represent a trick. A trick is a single play of each player in a round of hearts.
 
@@ -77,74 +109,117 @@ class Round:
             """
             self.round = round
             self.game = round.game
-            self.players = round.players
-            self.bots = round.bots
-            self.all_players = self.players+self.bots
-            self.played: dict['Player', Deck.Card] = {}
-            self.current_player = self.round.lead_player
+            self.seats = round.seats
+            # The cards played in order from the lead player, only the first `size` are this trick's
+            self.cards: list[Deck.Card] = [None] * 4  # type: ignore
+            self.reset()
+
+        def reset(self) -> None:
+            """Make this the next trick of the round, with nothing played. The round reuses one trick for all of its tricks."""
+            # The trick of the round this is, counting from 0
+            self.number = self.round.trick_count
+            # Seat of the lead player, and of the player whose turn it is or who played last
+            self.lead = self.seat = self.round.lead_player.seat
+            self.size = 0
+            self.led_suit: Optional['SUIT'] = None
             self.winner: Optional['Player'] = None
 
+        @property
+        def current_player(self) -> 'Player':
+            return self.seats[self.seat]
+
+        @property
+        def played(self) -> dict['Player', Deck.Card]:
+            """The cards played so far by each player, in the order they were played"""
+            seats = self.seats
+            return {seats[(self.lead + position) % 4]: self.cards[position] for position in range(self.size)}
+
         def play_trick(self) -> None:
             """
             Play a single trick. Each player plays a card and the winner of the trick is determined.
             """
-            led_suit: Optional['SUIT'] = "clubs" if self.round.trick_count == 0 else None
-            if self.current_player.am_bot:
-                bot_allowed_cards = self.current_player.allowed_cards_to_play(
-                    self.round.hearts_broken, self.round.trick_count == 0, led_suit, True)
-                played_card = ai.play_card(
-                    self.current_player, led_suit, True, bot_allowed_cards)
-            else:
-                played_card = self.round.game.play_card(
-                    self.current_player, led_suit, True)
-            self.played[self.current_player] = played_card
-
-            self.led_suit = led_suit if led_suit else self.played[self.current_player].suit
-            if self.led_suit == "hearts" and not self.round.hearts_broken:
-                self.round.hearts_broken = True
-                self.game.hearts_broken_hook()
-
-            self.game.card_played_hook(self.current_player, played_card)
-            # Play the remaining cards
-            for _ in range(3):
-                self.current_player = self.all_players[(
-                    self.all_players.index(self.current_player) + 1) % 4]
-                if self.current_player.am_bot:
-                    bot_allowed_cards = self.current_player.allowed_cards_to_play(
-                        self.round.hearts_broken, self.round.trick_count == 0, self.led_suit, False)
-                    card = ai.play_card(self.current_player,
-                                        self.led_suit, False, bot_allowed_cards)
+            run_steps(self.steps())
+
+        def steps(self) -> Steps[None]:
+            """`play_trick` as a generator of hook calls, see backend/hooks.py. Carries on after the cards already played."""
+            profiler = self.game.profiler
+            if profiler is None:
+                return self._steps()
+            return profiler.phase("trick", self._steps(), self.game.hook_label)
+
+        def _steps(self) -> Steps[None]:
+            game = self.game
+            current_round = self.round
+            profiler = game.profiler
+            first_trick = current_round.trick_count == 0
+            while self.size < 4:
+                is_leading = self.size == 0
+                if is_leading:
+                    led_suit: Optional['SUIT'] = "clubs" if first_trick else None
                 else:
-                    card = self.round.game.play_card(
-                        self.current_player, self.led_suit, False)
-
-                self.played[self.current_player] = card
-                if card.suit == "hearts" and not self.round.hearts_broken:
-                    self.round.hearts_broken = True
-                    self.game.hearts_broken_hook()
-
-                self.game.card_played_hook(self.current_player, card)
-
-            self.winner = self.__get_winner_of_trick()
-
-        def __get_winner_of_trick(self) -> 'Player':
-            """Private method to determine the winner of a trick. The winner is the player who played the highest card of the leading suit.
-
+                    self.seat = (self.seat + 1) % 4
+                    led_suit = self.led_suit
+                player = self.seats[self.seat]
+                if player.am_bot:
+                    if profiler is None:
+                        bot_allowed_cards = player.allowed_cards_to_play(
+                            current_round.hearts_broken, first_trick, led_suit, is_leading, game.rules)
+                    else:
+                        bot_allowed_cards = profiler.call(
+                            "rules", player.allowed_cards_to_play,
+                            current_round.hearts_broken, first_trick, led_suit, is_leading, game.rules)
+                    card = yield game.bot_play_card, (player, led_suit, is_leading, bot_allowed_cards)
+                else:
+                    card = yield game.play_card, (player, led_suit, is_leading)
+                self.cards[self.size] = card
+                self.size += 1
+                if is_leading:
+                    self.led_suit = led_suit if led_suit else card.suit
+
+                if card.suit == "hearts" and not current_round.hearts_broken:
+                    current_round.hearts_broken = True
+                    self.emit(EventKind.HEARTS_BROKEN)
+                    yield game.hearts_broken_hook, ()
+
+                self.emit(EventKind.CARD_PLAYED, card.index())
+                yield game.card_played_hook, (player, card)
+
+            self.winner = self._get_winner_of_trick()
+
+        def restore(self, cards: list[Deck.Card]) -> None:
+            """Put back the cards played so far in a trick, in the order they were played from the lead player"""
+            self.cards[:len(cards)] = cards
+            self.size = len(cards)
+            if cards:
+                self.seat = (self.lead + len(cards) - 1) % 4
+                self.led_suit = cards[0].suit
+            if len(cards) == 4:
+                self.winner = self._get_winner_of_trick()
+
+        def emit(self, kind: EventKind, value: int = 0) -> None:
+            """Add an event by the current player to the game's event stream"""
+            events = self.game.events
+            if events.active:
+                events.emit(kind, self.seat, value)
+
+        def _get_winner_of_trick(self) -> 'Player':
+            """Determine the winner of a trick. The winner is the player who played the highest card of the leading suit.
 
             Returns:
                 Player: The player who won the trick
             """
-
-            players_on_suit = [
-                player for player in self.played
-                if self.played[player].suit == self.led_suit  # type: ignore
-            ]
-            return max(players_on_suit,
-                       key=lambda player: self.played[player].rank)  # type: ignore
+            cards = self.cards
+            best = 0
+            for position in range(1, 4):
+                card = cards[position]
+                if card.suit == self.led_suit and card.rank > cards[best].rank:
+                    best = position
+            return self.seats[(self.lead + best) % 4]
 
         def __repr__(self) -> str:
-            result = ''
-            for player, card in self.played.items():
-                result += f"{player}: {card}\n"
-            result += f"Winner: {self.winner}"
-            return result
+            lines = [f"{player}: {card}" for player, card in self.played.items()]
+            lines.append(f"Winner: {self.winner}")
+            return "\n".join(lines)
+
+
+_TWO_OF_CLUBS = 1 << Deck.Card("clubs", 2).index()
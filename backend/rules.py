@@ -0,0 +1,131 @@
+"""
+The rules of a game, compiled from its settings into lookup tables when the game is made.
+
+Variants of the rules are settings, see DEFAULT_SETTINGS. The engine never checks a setting while playing: the
+points of each card are a 52 entry table, the passing direction of each round is a table over the passing cycle,
+and the cards a player may play are worked out with masks of card indices (see `Deck.cards_to_mask`).
+"""
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Iterable, Literal, Mapping, Optional, get_args
+
+from backend.deck import Deck, SUIT
+
+PASS_DIRECTION = Literal["left", "right", "across", "hold"]
+
+DEFAULT_SETTINGS: Mapping = MappingProxyType({
+    # The game ends when a player's score reaches this
+    'END_GAME_SCORE': 50,
+    # The jack of diamonds is worth -10 points
+    'JACK_NEGATIVE': True,
+    # Where the cards are passed in each round, the cycle starts again after the last
+    'PASS_CYCLE': ("left", "right", "across", "hold"),
+    # Hearts and the queen of spades may be played on the first trick by a player out of clubs
+    'FIRST_TRICK_POINTS': False,
+    # Taking every heart and the queen of spades in a round gives the other players those points instead
+    'SHOOT_THE_MOON': False,
+})
+
+# Seats from the passing player to the one that gets the cards, None when the cards are held
+PASS_OFFSETS: dict[str, Optional[int]] = {"left": -1, "right": 1, "across": 2, "hold": None}
+
+# Cards of each suit, by sorting value (see `Deck.Card.suiteValues`)
+SUIT_MASKS = tuple(((1 << 13) - 1) << 13 * value for value in range(4))
+_SUIT_MASK = {suit: SUIT_MASKS[Deck.Card.suiteValues[suit]] for suit in get_args(SUIT)}
+_HEARTS = _SUIT_MASK["hearts"]
+_QUEEN_OF_SPADES = Deck.Card("spades", 12).index()
+_JACK_OF_DIAMONDS = Deck.Card("diamonds", 11).index()
+_TWO_OF_CLUBS = 1 << Deck.Card("clubs", 2).index()
+
+
+class Rules:
+    """The settings of a game as lookup tables. Made once per game, see `Game.settings`."""
+
+    def __init__(self, settings: Mapping) -> None:
+        """Compile the settings.
+
+        Args:
+            settings (Mapping): Settings to change from DEFAULT_SETTINGS
+
+        Raises:
+            ValueError: If a setting is unknown or has a bad value
+        """
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        settings = {**DEFAULT_SETTINGS, **settings}
+        self.settings: Mapping = MappingProxyType(settings)
+
+        self.end_game_score: int = settings['END_GAME_SCORE']
+        if not isinstance(self.end_game_score, int) or self.end_game_score <= 0:
+            raise ValueError("The end game score must be a positive integer")
+
+        # Points of each card by index
+        points = [_HEARTS >> index & 1 for index in range(52)]
+        points[_QUEEN_OF_SPADES] = 13
+        if settings['JACK_NEGATIVE']:
+            points[_JACK_OF_DIAMONDS] = -10
+        self.points = tuple(points)
+        # Cards that give points, taking all of them shoots the moon
+        self.point_cards = sum(1 << index for index, points in enumerate(self.points) if points > 0)
+        self.shoot_the_moon: bool = bool(settings['SHOOT_THE_MOON'])
+        self.moon_points = sum(points for points in self.points if points > 0)
+
+        self.pass_cycle: tuple[PASS_DIRECTION, ...] = tuple(settings['PASS_CYCLE'])
+        if not self.pass_cycle or any(direction not in PASS_OFFSETS for direction in self.pass_cycle):
+            raise ValueError(f"The passing cycle is made of {', '.join(PASS_OFFSETS)}")
+        self.pass_offsets = tuple(PASS_OFFSETS[direction] for direction in self.pass_cycle)
+
+        # What a player out of clubs may play on the first trick, when they have it
+        self.first_trick_discards = -1 if settings['FIRST_TRICK_POINTS'] else ~self.point_cards
+
+    @classmethod
+    def compile(cls, settings: Mapping) -> 'Rules':
+        """The rules for some settings. Rules are never changed once made, games with the same settings share them."""
+        try:
+            # Settings left out are the defaults, so they make the same rules as settings that spell them out
+            return _compiled(frozenset({**DEFAULT_SETTINGS, **settings}.items()))
+        except TypeError:  # A setting that can not be hashed, like a list for the passing cycle
+            return cls(settings)
+
+    def trick_points(self, cards: Iterable[Deck.Card]) -> int:
+        points = self.points
+        return sum([points[card.index()] for card in cards])
+
+    def pass_offset(self, round_count: int) -> Optional[int]:
+        """Seats from a passing player to the one getting the cards in a round, None if the cards are held"""
+        return self.pass_offsets[round_count % len(self.pass_offsets)]
+
+    def pass_direction(self, round_count: int) -> PASS_DIRECTION:
+        return self.pass_cycle[round_count % len(self.pass_cycle)]
+
+    def allowed_mask(self, hand: int, hearts_broken: bool, first_trick: bool, led_suit: Optional[SUIT],
+                     is_leading: bool) -> int:
+        """The cards a player may play, see `Player.allowed_cards_to_play`
+
+        Args:
+            hand (int): Mask of the player's hand
+
+        Returns:
+            int: Mask of the cards allowed, 0 if none is
+        """
+        if first_trick and is_leading:
+            return hand & _TWO_OF_CLUBS
+        if is_leading or led_suit is None:
+            not_hearts = hand & ~_HEARTS
+            return hand if hearts_broken or not not_hearts else not_hearts
+        following = hand & _SUIT_MASK[led_suit]
+        if following:
+            return following
+        if first_trick:
+            return hand & self.first_trick_discards or hand
+        return hand
+
+
+@lru_cache(maxsize=64)
+def _compiled(settings: frozenset) -> Rules:
+    return Rules(dict(settings))
+
+
+# The rules with the default settings, for players that are not in a game
+DEFAULT_RULES = Rules.compile({})
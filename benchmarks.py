@@ -0,0 +1,353 @@
+"""
+Benchmarks of the engine, the rules, the bots, the API and the server, with seeded workloads so runs compare.
+
+    python benchmarks.py
+runs every benchmark and compares it with benchmark_baseline.json, exiting with status 1 when one got slower than
+the baseline by more than the threshold.
+
+    python benchmarks.py --json --only deck_deal --only bot_game
+    python benchmarks.py --save-baseline
+
+Each result is the time of one operation in microseconds: the median and the fastest of a few repeats, apart from
+table_memory which is in bytes. Timings depend on the machine, save a baseline on the machine the comparisons run on.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Optional
+
+from api import API, scripted_api
+from backend.deck import Deck, SUIT
+from backend.game import bot_game
+from backend.player import Player
+from backend.round import Round
+
+SEED = 1234
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# A benchmark regresses when its median is this much slower than the baseline's
+THRESHOLD = 0.25
+
+# A benchmark sets up its workload and returns the operation to time, and how many operations one call does
+Setup = Callable[[], tuple[Callable[[], object], int]]
+BENCHMARKS: dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _card_decisions(seed: int) -> list[tuple[int, Player, bool, bool, Optional[SUIT], bool]]:
+    """Every card play decision of a seeded bot game, as the trick, a copy of the player and the arguments
+    of `Player.allowed_cards_to_play`"""
+    random.seed(seed)
+    game = bot_game()
+    decisions = []
+    steps = game.steps()
+    result = None
+    while True:
+        try:
+            hook, args = steps.send(result)
+        except StopIteration:
+            return decisions
+        if hook is game.bot_play_card:
+            player, led_suit, is_leading, _ = args
+            trick = game.round.trick_count  # type: ignore
+            state = Player(player.name, am_bot=True)
+            state.set_hand(player.hand)
+            decisions.append((trick, state, game.round.hearts_broken, trick == 0, led_suit, is_leading))  # type: ignore
+        result = hook(*args)
+
+
+@benchmark("deck_deal")
+def deck_deal():
+    random.seed(SEED)
+    return Deck().deal, 1
+
+
+def _allowed_cards(tricks: range):
+    decisions = [decision[1:] for decision in _card_decisions(SEED) if decision[0] in tricks]
+
+    def run():
+        for player, hearts_broken, first_trick, led_suit, is_leading in decisions:
+            player.allowed_cards_to_play(hearts_broken, first_trick, led_suit, is_leading)
+    return run, len(decisions)
+
+
+@benchmark("allowed_cards_early")
+def allowed_cards_early():
+    # The first trick has rules of its own, the hands are full
+    return _allowed_cards(range(0, 3))
+
+
+@benchmark("allowed_cards_late")
+def allowed_cards_late():
+    return _allowed_cards(range(10, 13))
+
+
+@benchmark("trick_winner")
+def trick_winner():
+    rng = random.Random(SEED)
+    game = bot_game()
+    seats = game.seats
+    current_round = Round(game, seats[0])
+    tricks = []
+    for _ in range(256):
+        cards = rng.sample(Deck().cards, 4)
+        tricks.append((seats[rng.randrange(4)], cards))
+
+    def run():
+        for lead_player, cards in tricks:
+            current_round.lead_player = lead_player
+            current_round.Trick(current_round).restore(cards)
+    return run, len(tricks)
+
+
+@benchmark("bot_game")
+def play_bot_game():
+    def run():
+        random.seed(SEED)
+        bot_game().play_game()
+    return run, 1
+
+
+def _dealt_api() -> tuple[API, Player]:
+    random.seed(SEED)
+    api = scripted_api()
+    api.create_game()
+    api.reset_game()
+    return api, api.players[0]
+
+
+@benchmark("get_current_state")
+def get_current_state():
+    api, _ = _dealt_api()
+    return api.get_current_state, 1
+
+
+@benchmark("get_current_state_changed")
+def get_current_state_changed():
+    api, player = _dealt_api()
+
+    def run():
+        # Only the player that changed is rebuilt
+        player.touch()
+        api.get_current_state()
+    return run, 1
+
+
+def measure(setup: Setup, min_time: float = 0.2, repeats: int = 5) -> dict:
+    """Time a benchmark.
+
+    Args:
+        setup (Setup): The benchmark
+        min_time (float): Seconds each repeat runs for, at least
+        repeats (int): How many times to time it
+
+    Returns:
+        dict: Microseconds per operation, the median and fastest of the repeats, and the operations timed
+    """
+    operation, per_call = setup()
+    timer = timeit.Timer(operation)
+    calls, elapsed = timer.autorange()
+    calls = max(1, int(calls * min_time / max(elapsed, 1e-9)))
+    times = [total / (calls * per_call) * 1e6 for total in timer.repeat(repeats, calls)]
+    return {
+        "median_us": round(statistics.median(times), 3),
+        "min_us": round(min(times), 3),
+        "ops": calls * per_call * repeats,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def measure_server(games: int = 2, startup_timeout: float = 10.0) -> dict:
+    """Play games against a local server in a subprocess and time every turn's round trip, see loadgen.py.
+
+    Returns:
+        dict: Microseconds from answering a prompt to getting the next one, the median and fastest, and the turns timed
+    """
+    from loadgen import run_fleet
+    port = _free_port()
+    # A server of its own, without metrics or a state database, that seats every player alone with bots
+    code = (f"import random, server; random.seed({SEED}); server.SERVER_IP = '127.0.0.1'; "
+            f"server.SERVER_PORT = {port}; server.TABLE_SIZE = 1; server.METRICS_PORT = None; "
+            "server.STATE_DB_PATH = None; server.main()")
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The server did not start") from None
+                time.sleep(0.05)
+        round_trips = []
+        for game in range(games):
+            stats = asyncio.run(run_fleet("127.0.0.1", port, 1, 0, 0, SEED + game))
+            if not stats.games_completed:
+                raise RuntimeError("The benchmark game did not finish")
+            round_trips += stats.round_trips
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "median_us": round(statistics.median(round_trips) * 1e6, 3),
+        "min_us": round(min(round_trips) * 1e6, 3),
+        "ops": len(round_trips),
+    }
+
+
+def measure_memory(tables: int = 1000) -> dict:
+    """Memory of bot games, see tracemalloc.
+
+    Args:
+        tables (int): Games to keep paused in the middle of their first round at once
+
+    Returns:
+        dict: The bytes each paused game holds on to, and the most a whole game allocates at once
+    """
+    random.seed(SEED)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        paused = []
+        for _ in range(tables):
+            game = bot_game()
+            steps = game.steps()
+            result = None
+            plays = 0
+            while plays < 26:
+                hook, args = steps.send(result)
+                result = hook(*args)
+                plays += hook is game.bot_play_card
+            paused.append((game, steps, result))
+        held = (tracemalloc.get_traced_memory()[0] - before) / tables
+        paused.clear()
+
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        bot_game().play_game()
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return {"bytes": round(held), "peak_bytes": peak}
+
+
+# Benchmarks that are not timed with `measure`
+MEASURED: dict[str, Callable[[], dict]] = {"table_memory": measure_memory, "server_round_trip": measure_server}
+
+
+def run_benchmarks(names: Optional[list[str]] = None, server: bool = True, min_time: float = 0.2) -> dict[str, dict]:
+    """Run the benchmarks by name, every one by default. "server_round_trip" runs only if `server` is set."""
+    results = {}
+    for name in names or list(BENCHMARKS) + list(MEASURED):
+        if name == "server_round_trip" and not server:
+            continue
+        if name in BENCHMARKS:
+            results[name] = measure(BENCHMARKS[name], min_time)
+        elif name in MEASURED:
+            results[name] = MEASURED[name]()
+        else:
+            raise ValueError(f"Unknown benchmark {name}")
+    return results
+
+
+def _metric(result: dict) -> str:
+    """What is compared with the baseline, the median time or the memory"""
+    return "median_us" if "median_us" in result else "bytes"
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float = THRESHOLD) -> dict[str, float]:
+    """The change of each benchmark's median time or memory against the baseline, as a fraction of the baseline.
+
+    Args:
+        results (dict[str, dict]): From `run_benchmarks`
+        baseline (dict[str, dict]): Earlier results, benchmarks missing from it are left out
+        threshold (float): Slowdown allowed before a benchmark counts as a regression
+
+    Returns:
+        dict[str, float]: The benchmarks that regressed, and how much slower or bigger they got
+    """
+    regressions = {}
+    for name, result in results.items():
+        metric = _metric(result)
+        if not baseline.get(name, {}).get(metric):
+            continue
+        change = result[metric] / baseline[name][metric] - 1
+        if change > threshold:
+            regressions[name] = round(change, 3)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", action="append", metavar="NAME",
+                        help="run only this benchmark, may be repeated: "
+                        + ", ".join(list(BENCHMARKS) + list(MEASURED)))
+    parser.add_argument("--no-server", action="store_true", help="skip the server round trip")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="results to compare with")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="slowdown allowed before failing, as a fraction of the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, server=not args.no_server)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+        "regressions": regressions,
+    }
+    if args.save_baseline:
+        # Keep the benchmarks that were not run this time
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({**report, "results": {**baseline, **results}, "regressions": {}}, baseline_file, indent=2)
+            baseline_file.write("\n")
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for name, result in results.items():
+            metric = _metric(result)
+            if metric == "bytes":
+                line = f"{name:>26}: {result['bytes']:>12} bytes (peak {result['peak_bytes']} bytes per game)"
+            else:
+                line = f"{name:>26}: {result['median_us']:>12.3f} us (min {result['min_us']:.3f}, {result['ops']} ops)"
+            if baseline.get(name, {}).get(metric):
+                change = result[metric] / baseline[name][metric] - 1
+                line += f" {change:+.1%} vs baseline"
+            if name in regressions:
+                line += " REGRESSION"
+            print(line)
+    if regressions and not args.save_baseline:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
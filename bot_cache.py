@@ -0,0 +1,231 @@
+"""
+Caches bot decisions by canonical position, so a bot that meets a position it has decided before does not decide again.
+
+Many positions are the same decision in disguise. Only the cards nobody has played yet this round matter, and among
+them only their order within each suit: once the 6 of clubs is played, holding the 5 and the 7 is the same as holding
+the 5 and the 6 when the 7 is gone. A position is made canonical by numbering the unplayed cards of each suit from the
+lowest, and keeping:
+
+- the hand and the cards of the trick, numbered that way, which also settle the cards the bot may play
+- how many cards of each suit are still out
+- where the cards worth other than 0 or 1 points are, like the queen of spades
+- whether this is the first trick and whether hearts are broken, and the rules of the game
+
+Everything else, like the scores or who took which trick, is left out. The cache is therefore only correct for
+decisions that depend on nothing else, and that pick the same card in positions that are the same once renumbered.
+`backend.ai` qualifies, a policy that looks at the scores (see policy.py) does not.
+
+    CachedBot(game)                                    # the game's bots go through the process wide cache
+    CachedBot(game, DecisionCache(4096), play_card)    # a cache of its own, in front of another decision
+"""
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Optional
+
+import backend.ai as ai
+from backend.deck import Deck, SUIT
+from backend.game import Game
+from backend.player import Player
+from backend.rules import Rules
+from metrics import Registry
+
+# Decisions kept by the process wide cache, a few megabytes
+CAPACITY = 100_000
+
+_SUIT_BITS = (1 << 13) - 1
+
+
+def canonical_mask(mask: int, live: int) -> int:
+    """The cards of a mask numbered from the lowest unplayed card of their suit.
+
+    Args:
+        mask (int): Mask of cards, all of them in `live`
+        live (int): Mask of the cards not played yet this round
+    """
+    canonical = 0
+    while mask:
+        low_bit = mask & -mask
+        index = low_bit.bit_length() - 1
+        suit_start = index - index % 13
+        # Unplayed cards of the suit below this one
+        below = (live >> suit_start) & (low_bit >> suit_start) - 1
+        canonical |= 1 << suit_start + below.bit_count()
+        mask ^= low_bit
+    return canonical
+
+
+def real_card(canonical_index: int, live: int) -> Deck.Card:
+    """The unplayed card a canonical card index stands for"""
+    suit_start = canonical_index - canonical_index % 13
+    remaining = (live >> suit_start) & _SUIT_BITS
+    for _ in range(canonical_index % 13):
+        remaining &= remaining - 1
+    return Deck.card_from_index(suit_start + (remaining & -remaining).bit_length() - 1)
+
+
+@lru_cache(maxsize=64)
+def _special_cards(rules: Rules) -> tuple[int, ...]:
+    """Masks of the cards not worth 0 or 1 points, their place in their suit matters"""
+    return tuple(1 << index for index, points in enumerate(rules.points) if points not in (0, 1))
+
+
+def play_position(game: Game, player: Player) -> tuple[tuple, int]:
+    """The canonical position of a card play decision.
+
+    Returns:
+        tuple[tuple, int]: The position, and the mask of the cards not played yet this round to turn the decision back
+        into a card with `real_card`
+    """
+    current_round = game.round
+    trick = current_round.current_trick  # type: ignore
+    live = 0
+    for seat in game.seats:
+        # The cards of the trick leave the hands once it is over, so they are still in there
+        live |= seat.hand_mask
+    rules = game.rules
+    position = (
+        rules,
+        trick.number == 0,
+        current_round.hearts_broken,  # type: ignore
+        tuple([(live >> start & _SUIT_BITS).bit_count() for start in (0, 13, 26, 39)]),
+        canonical_mask(player.hand_mask, live),
+        tuple([canonical_mask(1 << card.index(), live) for card in trick.cards[:trick.size]]),
+        tuple([canonical_mask(card, live) if card & live else 0 for card in _special_cards(rules)]),
+    )
+    return position, live
+
+
+class DecisionCache:
+    """Bot decisions by canonical position, the least recently used are dropped once the cache is full.
+
+    Safe to share between threads: lookups and updates hold a lock, a decision that is not cached is made without it.
+    """
+
+    def __init__(self, capacity: int = CAPACITY, metrics: Optional[Registry] = None) -> None:
+        """
+        Args:
+            capacity (int): Decisions kept
+            metrics (Optional[Registry]): Where to report hits, misses, evictions and the decisions kept
+        """
+        self.capacity = capacity
+        self.entries: OrderedDict[tuple, int] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.register(metrics if metrics is not None else Registry(enabled=False))
+
+    def register(self, metrics: Registry) -> None:
+        """Report hits, misses, evictions and the decisions kept to a registry, before the cache is used.
+        The process wide cache is made on import, the server registers it on the process's registry."""
+        self.hit_counters = {decision: metrics.counter(
+            "hearts_bot_cache_hits_total", "Bot decisions found in the cache", {"decision": decision})
+            for decision in ("play_card", "pass_cards")}
+        self.miss_counters = {decision: metrics.counter(
+            "hearts_bot_cache_misses_total", "Bot decisions made because they were not in the cache", {"decision": decision})
+            for decision in ("play_card", "pass_cards")}
+        self.eviction_counter = metrics.counter(
+            "hearts_bot_cache_evictions_total", "Decisions dropped from the full bot cache")
+        metrics.gauge("hearts_bot_cache_entries", "Decisions in the bot cache", function=lambda: len(self.entries))
+        metrics.gauge("hearts_bot_cache_hit_rate", "Share of bot decisions found in the cache", function=self.hit_rate)
+
+    def play_card(self, game: Game, player: Player, led_suit: Optional[SUIT], leading: bool,
+                  allowed_cards: list[Deck.Card],
+                  decide: Callable[[Player, Optional[SUIT], bool, list[Deck.Card]], Deck.Card] = ai.play_card
+                  ) -> Deck.Card:
+        """Choose the card a bot plays. Same arguments as `ai.play_card`, after the game the bot is playing.
+
+        Args:
+            decide (Callable): Makes the decision when it is not cached, `ai.play_card` by default
+        """
+        position, live = play_position(game, player)
+        key = (decide, position)
+        found = self._get(key, "play_card")
+        if found is not None:
+            return real_card(found, live)
+        card = decide(player, led_suit, leading, allowed_cards)
+        self._put(key, canonical_mask(1 << card.index(), live).bit_length() - 1)
+        return card
+
+    def pass_cards(self, game: Game, player: Player,
+                   decide: Callable[[Player], list[Deck.Card]] = ai.bot_pass_cards) -> list[Deck.Card]:
+        """Choose the 3 cards a bot passes. Same arguments as `ai.bot_pass_cards`, after the game the bot is playing.
+
+        Nothing has been played when cards are passed, so the position is the hand.
+
+        Args:
+            decide (Callable): Makes the decision when it is not cached, `ai.bot_pass_cards` by default
+        """
+        rules = game.rules
+        key = (decide, rules, rules.pass_offset(game.round_count), player.hand_mask)
+        found = self._get(key, "pass_cards")
+        if found is not None:
+            return Deck.mask_to_cards(found)
+        cards = decide(player)
+        self._put(key, Deck.cards_to_mask(cards))
+        return cards
+
+    def _get(self, key: tuple, decision: str) -> Optional[int]:
+        with self.lock:
+            found = self.entries.get(key)
+            if found is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        (self.miss_counters if found is None else self.hit_counters)[decision].inc()
+        return found
+
+    def _put(self, key: tuple, value: int) -> None:
+        with self.lock:
+            self.entries[key] = value
+            evicted = len(self.entries) > self.capacity
+            if evicted:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        if evicted:
+            self.eviction_counter.inc()
+
+    def hit_rate(self) -> float:
+        looked_up = self.hits + self.misses
+        return self.hits / looked_up if looked_up else 0.0
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(self.hit_rate(), 4)}
+
+
+# Shared by every game of the process that does not bring a cache of its own
+DECISIONS = DecisionCache()
+
+
+class CachedBot:
+    """Plays the bots of a game through a decision cache"""
+
+    def __init__(self, game: Game, cache: DecisionCache = DECISIONS,
+                 play_card: Callable[[Player, Optional[SUIT], bool, list[Deck.Card]], Deck.Card] = ai.play_card,
+                 pass_cards: Callable[[Player], list[Deck.Card]] = ai.bot_pass_cards) -> None:
+        """Make the cached decisions the game's bot hooks
+
+        Args:
+            play_card (Callable): Decides the cards played that are not cached, see `ai.play_card`
+            pass_cards (Callable): Decides the cards passed that are not cached, see `ai.bot_pass_cards`
+        """
+        self.game = game
+        self.cache = cache
+        self.decide_play = play_card
+        self.decide_pass = pass_cards
+        game.bot_play_card = self.play_card
+        game.bot_pass_cards = self.pass_cards
+
+    def play_card(self, player: Player, led_suit: Optional[SUIT], leading: bool,
+                  allowed_cards_to_play: list[Deck.Card]) -> Deck.Card:
+        return self.cache.play_card(self.game, player, led_suit, leading, allowed_cards_to_play, self.decide_play)
+
+    def pass_cards(self, player: Player) -> list[Deck.Card]:
+        return self.cache.pass_cards(self.game, player, self.decide_pass)
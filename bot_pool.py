@@ -0,0 +1,163 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, get_args
+
+from backend.deck import Deck, SUIT
+from backend.player import Player
+import backend.ai as ai
+from metrics import Registry
+
+# Sent to the workers instead of the led suit when the bot is leading
+NO_SUIT = -1
+
+
+def cheap_play_card(allowed_cards: list[Deck.Card]) -> Deck.Card:
+    """Fallback when a bot decision is not back in time: dump the lowest card we may play"""
+    return min(allowed_cards, key=lambda card: card.rank)
+
+
+def cheap_pass_cards(hand: list[Deck.Card]) -> list[Deck.Card]:
+    """Fallback when a bot decision is not back in time: pass the three highest cards"""
+    return sorted(hand, key=lambda card: card.rank)[-3:]
+
+
+def _play_card_worker(hand_mask: int, allowed_mask: int, led_suit: int, leading: bool) -> tuple[int, float, float]:
+    """Runs in a worker process. Rebuilds the bot from its card masks and returns the index of the card to play,
+    with the times the decision started and finished"""
+    started = time.monotonic()
+    bot = Player("Bot", am_bot=True)
+    bot.set_hand(Deck.mask_to_cards(hand_mask))
+    card = ai.play_card(bot,
+                        get_args(SUIT)[led_suit] if led_suit != NO_SUIT else None,
+                        leading,
+                        Deck.mask_to_cards(allowed_mask))
+    return card.index(), started, time.monotonic()
+
+
+def _pass_cards_worker(hand_mask: int) -> tuple[int, float, float]:
+    """Runs in a worker process. Returns the mask of the cards to pass, with the times the decision started and finished"""
+    started = time.monotonic()
+    bot = Player("Bot", am_bot=True)
+    bot.set_hand(Deck.mask_to_cards(hand_mask))
+    return Deck.cards_to_mask(ai.bot_pass_cards(bot)), started, time.monotonic()
+
+
+def _ready() -> None:
+    pass
+
+
+class BotPool:
+    """
+    Makes bot decisions in a pool of worker processes, so a slow bot does not hold the GIL while other tables are playing.
+
+    Only a few integers are sent to a worker for each decision: the bot's hand and allowed cards as card masks
+    and the led suit. A decision that is not back within the timeout, or that can not be queued because too many are
+    waiting, is made on the calling thread with a cheap policy instead.
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 max_pending: int = 64,
+                 timeout: float = 0.5,
+                 metrics: Optional[Registry] = None
+                 ) -> None:
+        """
+        Args:
+            workers (int): Number of worker processes
+            max_pending (int): Decisions that may be queued or running at once, further decisions use the cheap policy
+            timeout (float): Seconds to wait for a decision before using the cheap policy
+            metrics (Optional[Registry]): Where to report queue wait, compute time and fallbacks
+        """
+        # Worker processes are spawned rather than forked, forking a process that runs threads is not safe
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        # Decisions in flight for each table, so they can be cancelled when the table closes
+        self.pending: dict[object, set[Future]] = {}
+
+        metrics = metrics if metrics is not None else Registry(enabled=False)
+        self.queue_wait = {decision: metrics.histogram(
+            "hearts_bot_queue_wait_seconds", "Time bot decisions wait for a worker process", {"decision": decision})
+            for decision in ("play_card", "pass_cards")}
+        self.compute = {decision: metrics.histogram(
+            "hearts_bot_compute_seconds", "Time worker processes spend on bot decisions", {"decision": decision}, scale=1e9)
+            for decision in ("play_card", "pass_cards")}
+        self.fallbacks = metrics.counter(
+            "hearts_bot_fallbacks_total", "Bot decisions made with the cheap policy because the pool was late or full")
+
+    def start(self) -> None:
+        """Start every worker process now instead of on the first decisions, which would then miss their deadline"""
+        for future in [self.executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def play_card(self, table: object, player: Player, led_suit: Optional[SUIT], leading: bool, allowed_cards: list[Deck.Card]) -> Deck.Card:
+        """Choose the card a bot plays. Same arguments as `ai.play_card`, after the table the bot is seated at."""
+        result = self._decide(table, "play_card", _play_card_worker,
+                              (Deck.cards_to_mask(player.hand),
+                               Deck.cards_to_mask(allowed_cards),
+                               get_args(SUIT).index(led_suit) if led_suit else NO_SUIT,
+                               leading))
+        if result is None:
+            return cheap_play_card(allowed_cards)
+        return Deck.card_from_index(result)
+
+    def pass_cards(self, table: object, player: Player) -> list[Deck.Card]:
+        """Choose the 3 cards a bot passes. Same arguments as `ai.bot_pass_cards`, after the table the bot is seated at."""
+        result = self._decide(table, "pass_cards", _pass_cards_worker,
+                              (Deck.cards_to_mask(player.hand),))
+        if result is None:
+            return cheap_pass_cards(player.hand)
+        return Deck.mask_to_cards(result)
+
+    def cancel_table(self, table: object) -> None:
+        """Cancel the decisions of a table that is closing. Waiting callers get the cheap policy."""
+        with self.lock:
+            futures = self.pending.pop(table, set())
+        for future in futures:
+            future.cancel()
+
+    def _decide(self, table: object, decision: str, worker: Callable, args: tuple) -> Optional[int]:
+        """Run a decision in the pool.
+
+        Returns:
+            Optional[int]: What the worker returned, or None if the cheap policy has to be used
+        """
+        if not self.slots.acquire(blocking=False):
+            self.fallbacks.inc()
+            return None
+        submitted = time.monotonic()
+        try:
+            future = self.executor.submit(worker, *args)
+        except RuntimeError:  # The pool was shut down or a worker died
+            self.slots.release()
+            self.fallbacks.inc()
+            return None
+        # The slot is held until the worker is done, even if we stop waiting for it
+        future.add_done_callback(lambda _: self.slots.release())
+        with self.lock:
+            self.pending.setdefault(table, set()).add(future)
+        try:
+            result, started, finished = future.result(self.timeout)
+        except (TimeoutError, CancelledError, BrokenProcessPool):
+            future.cancel()
+            self.fallbacks.inc()
+            return None
+        finally:
+            with self.lock:
+                table_futures = self.pending.get(table)
+                if table_futures is not None:
+                    table_futures.discard(future)
+                    if not table_futures:
+                        del self.pending[table]
+        self.queue_wait[decision].observe(max(0.0, started - submitted))
+        self.compute[decision].observe(finished - started)
+        return result
@@ -1,6 +1,4 @@
 import socket
-import select
-import msvcrt
 
 from server import SERVER_PORT
 
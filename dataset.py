@@ -0,0 +1,219 @@
+"""
+Export the card play decisions of archived rounds as a training set for policy models.
+
+Every card played is one decision row: what the player could see (hand, the trick so far, hearts broken, scores),
+what they were allowed to play and what they chose. Rows are computed with NumPy from the round records of
+archive.py, 52 per round, without replaying games through the engine. Worker processes each turn a range of rounds
+into one preallocated `.npy` part, and only a few ranges are in flight at a time, so memory does not grow with the
+size of the archive.
+
+    python dataset.py games/ decisions/ --workers 4
+
+writes decisions/part-00000.npy, ... and decisions/manifest.json. Load a part with `np.load(path, mmap_mode="r")`.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Iterator, Sequence
+
+import numpy as np
+
+from archive import Archive
+from backend.deck import Deck
+from backend.rules import SUIT_MASKS, Rules
+
+DECISION_DTYPE = np.dtype([
+    ("game", "<u4"),
+    ("round", "u1"),
+    ("trick", "u1"),
+    ("seat", "u1"),
+    ("bot", "u1"),
+    # Card masks, see `Deck.cards_to_mask`
+    ("hand", "<u8"),
+    ("legal", "<u8"),
+    # Cards already in the trick in the order they were played, -1 for none
+    ("trick_cards", "i1", 3),
+    # Sorting value of the suit led (see `Deck.Card.suiteValues`), -1 when leading
+    ("led_suit", "i1"),
+    ("hearts_broken", "u1"),
+    ("chosen", "u1"),
+    # Total scores of each seat before the round, and points taken in the round so far
+    ("total_scores", "<i2", 4),
+    ("round_points", "<i2", 4),
+])
+
+# Cards of each suit, by sorting value
+_SUIT_MASKS = np.array(SUIT_MASKS, dtype=np.uint64)
+_HEARTS = Deck.Card.suiteValues["hearts"]
+_DECK = (1 << 52) - 1
+# Rounds numbers a record can have
+_ROUNDS = 256
+_CARD_BITS = np.left_shift(np.uint64(1), np.arange(52, dtype=np.uint64))
+
+
+def _rules_tables(rules: Sequence[Rules]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The rules of each settings id as arrays: the passing offset of every round, the points of every card, and the
+    cards a player out of clubs may play on the first trick"""
+    pass_offsets = np.array([[rule.pass_offset(round_index) or 0 for round_index in range(_ROUNDS)]
+                             for rule in rules], dtype=np.int64).reshape(len(rules), _ROUNDS)
+    points = np.array([rule.points for rule in rules], dtype=np.int16).reshape(len(rules), 52)
+    discards = np.array([rule.first_trick_discards & _DECK for rule in rules], dtype=np.uint64)
+    return pass_offsets, points, discards
+
+
+def decisions(records: np.ndarray, rules: Sequence[Rules]) -> np.ndarray:
+    """The card play decisions of a batch of rounds.
+
+    Args:
+        records (np.ndarray): Round records, see `archive.ROUND_DTYPE`
+        rules (Sequence[Rules]): The rules of each settings id, see `Archive.rules`
+
+    Returns:
+        np.ndarray: 52 DECISION_DTYPE rows per round, in the order the cards were played
+    """
+    count = len(records)
+    rows = np.zeros((count, 52), dtype=DECISION_DTYPE)
+    plays = records["plays"].astype(np.int64)
+    play_bits = _CARD_BITS[plays]
+    pass_offsets, card_points, first_trick_discards = _rules_tables(rules)
+    settings = records["settings"].astype(np.int64)
+
+    # Hands once the cards are passed, a seat gets the cards of the seat passing to it. Held cards stay, 0 seats away.
+    offsets = pass_offsets[settings, records["round"]]
+    senders = (np.arange(4) - offsets[:, None]) % 4
+    passed = records["passed"]
+    hands = records["dealt"] & ~passed | np.take_along_axis(passed, senders, axis=1)
+
+    # Seat of every play, each trick is led by the winner of the previous one
+    leaders = np.empty((count, 13), dtype=np.int64)
+    leaders[:, 0] = np.argmax(hands & np.uint64(1) != 0, axis=1)
+    leaders[:, 1:] = records["trick_winners"][:, :-1]
+    position = np.arange(52) % 4
+    seats = (np.repeat(leaders, 4, axis=1) + position) % 4
+
+    # A seat's hand at a decision is what it got less what it played before
+    own_plays = np.where(seats[:, :, None] == np.arange(4), play_bits[:, :, None], np.uint64(0))
+    played_before = np.bitwise_or.accumulate(own_plays, axis=1) ^ own_plays
+    hand = np.take_along_axis(hands, seats, axis=1) & ~np.take_along_axis(
+        played_before, seats[:, :, None], axis=2)[:, :, 0]
+
+    hearts = plays // 13 == _HEARTS
+    hearts_broken = (np.cumsum(hearts, axis=1) - hearts) > 0
+    trick_start = np.arange(52) - position
+    led_suit = np.where(position > 0, plays[:, trick_start] // 13, -1)
+    trick_cards = np.full((count, 52, 3), -1, dtype=np.int8)
+    for slot in range(3):
+        earlier = slot < position
+        trick_cards[:, earlier, slot] = plays[:, trick_start[earlier] + slot]
+
+    # The rules of `Rules.allowed_mask`
+    zero = np.uint64(0)
+    first_trick = np.arange(52) < 4
+    led_cards = hand & _SUIT_MASKS[np.maximum(led_suit, 0)]
+    following = np.where(led_cards != zero, led_cards, hand)
+    safe = hand & first_trick_discards[settings][:, None]
+    clubs = hand & _SUIT_MASKS[Deck.Card.suiteValues["clubs"]]
+    first_following = np.where(clubs != zero, clubs, np.where(safe != zero, safe, hand))
+    not_hearts = hand & ~_SUIT_MASKS[_HEARTS]
+    leading = np.where(hearts_broken | (not_hearts == zero), hand, not_hearts)
+    legal = np.where(position > 0,
+                     np.where(first_trick, first_following, following),
+                     np.where(first_trick, np.uint64(1), leading))
+
+    # Points each seat took in the tricks before the decision
+    trick_points = card_points[settings[:, None], plays].reshape(count, 13, 4).sum(axis=2)
+    won = records["trick_winners"][:, :, None] == np.arange(4)
+    points = np.cumsum(np.where(won, trick_points[:, :, None], 0), axis=1) - np.where(won, trick_points[:, :, None], 0)
+
+    rows["game"] = records["game"][:, None]
+    rows["round"] = records["round"][:, None]
+    rows["trick"] = np.arange(52) // 4
+    rows["seat"] = seats
+    rows["bot"] = (records["bots"][:, None] >> seats) & 1
+    rows["hand"] = hand
+    rows["legal"] = legal
+    rows["trick_cards"] = trick_cards
+    rows["led_suit"] = led_suit
+    rows["hearts_broken"] = hearts_broken
+    rows["chosen"] = plays
+    rows["total_scores"] = (records["total_scores"] - records["round_scores"])[:, None, :]
+    rows["round_points"] = np.repeat(points, 4, axis=1)
+    return rows.reshape(-1)
+
+
+def iter_decisions(archive: Archive, chunk_rounds: int = 8192) -> Iterator[np.ndarray]:
+    """Go through the decisions of an archive chunk by chunk, holding one chunk at a time"""
+    for _, records in archive.scan(chunk_rows=chunk_rounds):
+        yield decisions(records, archive.rules)
+
+
+def _export_part(archive_path: str, start: int, stop: int, path: str, chunk_rounds: int) -> int:
+    """Write the decisions of a range of rounds to a new `.npy` file. Runs in a worker process."""
+    archive = Archive(archive_path)
+    part = np.lib.format.open_memmap(path, mode="w+", dtype=DECISION_DTYPE, shape=((stop - start) * 52,))
+    for offset in range(start, stop, chunk_rounds):
+        records = archive.records[offset:min(offset + chunk_rounds, stop)]
+        part[(offset - start) * 52:(offset - start + len(records)) * 52] = decisions(records, archive.rules)
+    part.flush()
+    del part
+    return (stop - start) * 52
+
+
+def export(archive_path: str, out_dir: str, workers: int = 4, part_rounds: int = 1 << 18,
+           chunk_rounds: int = 8192) -> dict:
+    """Export every decision of an archive to `.npy` parts.
+
+    Args:
+        archive_path (str): The archive directory, see archive.py
+        out_dir (str): Where to write the parts and the manifest
+        workers (int): Worker processes
+        part_rounds (int): Rounds per part, a part has 52 rows per round
+        chunk_rounds (int): Rounds a worker holds in memory at once
+
+    Returns:
+        dict: The manifest, also written to manifest.json
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    total = len(Archive(archive_path))
+    ranges = [(start, min(start + part_rounds, total)) for start in range(0, total, part_rounds)]
+    parts = [{"file": f"part-{index:05d}.npy", "rows": (stop - start) * 52}
+             for index, (start, stop) in enumerate(ranges)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending: set[Future] = set()
+        for (start, stop), part in zip(ranges, parts):
+            # Parts are written in place, so a couple per worker keeps every worker busy
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(_export_part, archive_path, start, stop,
+                                        os.path.join(out_dir, part["file"]), chunk_rounds))
+        for future in pending:
+            future.result()
+    manifest = {"dtype": DECISION_DTYPE.descr, "rows": total * 52, "parts": parts}
+    with open(os.path.join(out_dir, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archive", help="archive directory, see archive.py")
+    parser.add_argument("out", help="directory to write the parts to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--part-rounds", type=int, default=1 << 18, help="rounds per part file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = export(args.archive, args.out, args.workers, args.part_rounds)
+    elapsed = time.perf_counter() - start
+    print(f"Exported {manifest['rows']} decisions in {len(manifest['parts'])} parts in {elapsed:.2f}s "
+          f"({manifest['rows'] / elapsed * 60 / 1e6:.1f}M rows per minute)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,520 @@
+"""
+Asyncio gateway serving games over WebSocket as JSON, and over the text protocol of server.py, from one TableManager.
+
+Every connection of either kind is a session in the same lobby (see matchmaking.py) and is seated at tables hosted by
+the same TableManager (see tables.py), so people using a browser and people using client.py play at the same tables.
+One thread runs everything: reading and writing the connections, seating the lobby and playing the games.
+
+WebSocket clients connect to ws://host:port/ws and send JSON messages:
+
+    {"type": "join", "name": "Alice"}
+    {"type": "play", "cards": [14]}             the card to play, by index (see `Deck.Card.index`)
+    {"type": "pass", "cards": [3, 20, 51]}      the 3 cards to pass
+    {"type": "leave"}                           a bot plays the seat from now on, answered by {"type": "left"}
+
+and get the messages of their table (see tables.py), after {"type": "welcome", "name": ...} and
+{"type": "seated", "table": ..., "seat": ..., "seats": [...]}, and {"type": "error", "message": ...} when a message
+is refused. A "decide" message is answered with "play" or "pass" before its deadline, or a bot decides. Once the game
+is over the connection may join again.
+
+GET /stats on the same port gives the tables, the lobby and the connections as JSON.
+
+    python gateway.py --port 2346 --text-port 2345
+serves WebSocket and HTTP on 2346 and the text protocol of server.py on 2345, so client.py and loadgen.py work with it.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from backend.deck import Deck
+from matchmaking import Matchmaker
+from metrics import Registry
+from server import PASS_TIMEOUT, Print, QUEUE_TIME_TARGET, SEATING_INTERVAL, TABLE_SIZE, TURN_TIMEOUT
+from tables import MAX_TABLES, Table, TableLimitError, TableManager
+
+GATEWAY_PORT = 2346
+# Decisions the tables make before the event loop gets to the connections again
+RUN_BUDGET = 512
+# Bytes that may wait to be written to a connection before it is dropped as too slow
+OUTBOUND_LIMIT = 256 * 1024
+# Largest request head and WebSocket message accepted
+MAX_REQUEST = 16 * 1024
+MAX_MESSAGE = 64 * 1024
+
+_WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+TEXT, BINARY, CLOSE, PING, PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+def accept_key(key: str) -> str:
+    """The Sec-WebSocket-Accept answer to a Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1(key.encode() + _WEBSOCKET_GUID).digest()).decode()
+
+
+def encode_frame(payload: bytes, opcode: int = TEXT, mask: bool = False) -> bytes:
+    """A final WebSocket frame. Clients mask what they send, servers do not."""
+    length = len(payload)
+    first = 0x80 | opcode
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack("!BB", first, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", first, mask_bit | 126, length)
+    else:
+        header = struct.pack("!BBQ", first, mask_bit | 127, length)
+    if not mask:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + _unmask(payload, key)
+
+
+def _unmask(payload: bytes, key: bytes) -> bytes:
+    length = len(payload)
+    stream = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "little") ^ int.from_bytes(stream, "little")).to_bytes(length, "little")
+
+
+async def read_message(reader: asyncio.StreamReader,
+                       on_ping: Optional[Callable[[bytes], None]] = None) -> tuple[int, bytes]:
+    """Read a WebSocket message, putting fragmented ones back together.
+
+    Control frames may come between the fragments of a message. Pings are handed to `on_ping` to answer and pongs are
+    dropped, without losing the fragments read so far. A close frame comes back as the message, the rest of the
+    message will never come.
+
+    Raises:
+        ConnectionError: If the message is too long
+        asyncio.IncompleteReadError: If the connection closes
+    """
+    opcode = None
+    parts = []
+    size = 0
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", await reader.readexactly(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", await reader.readexactly(8))
+        size += length
+        if size > MAX_MESSAGE:
+            raise ConnectionError("Message too long")
+        key = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if key is not None:
+            payload = _unmask(payload, key)
+        frame_opcode = first & 0x0F
+        if frame_opcode >= CLOSE:
+            size -= length
+            if frame_opcode == CLOSE:
+                return CLOSE, payload
+            if frame_opcode == PING and on_ping is not None:
+                on_ping(payload)
+            continue
+        if frame_opcode:
+            opcode = frame_opcode
+        parts.append(payload)
+        if first & 0x80:
+            return opcode or TEXT, b"".join(parts)
+
+
+class Session(ABC):
+    """Someone connected to the gateway, over either transport"""
+
+    def __init__(self, gateway: 'Gateway', writer: asyncio.StreamWriter) -> None:
+        self.gateway = gateway
+        self.writer = writer
+        self.name: Optional[str] = None
+        self.waiting = False
+        self.table: Optional[Table] = None
+        self.seat = 0
+        # Counts the decisions asked of the session, so a deadline only applies to the decision it was set for
+        self.asked = 0
+        self.deadline: Optional[asyncio.TimerHandle] = None
+        self.closed = False
+
+    @abstractmethod
+    def send(self, message: dict) -> None:
+        """Send a message of the gateway or of the session's table"""
+
+    def write(self, data: bytes) -> None:
+        if self.closed:
+            return
+        self.writer.write(data)
+        if self.writer.transport.get_write_buffer_size() > OUTBOUND_LIMIT:
+            # Too slow to keep up, a bot takes the seat. Not right away, the table may be in the middle of its turn
+            asyncio.get_running_loop().call_soon(self.close)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.gateway.disconnect(self)
+            self.writer.close()
+
+
+class WebSocketSession(Session):
+
+    def send(self, message: dict) -> None:
+        self.write(encode_frame(json.dumps(message, separators=(",", ":")).encode()))
+
+    def close(self) -> None:
+        if not self.closed:
+            self.writer.write(encode_frame(b"", CLOSE))
+        super().close()
+
+
+class TextSession(Session):
+    """Speaks the text protocol of server.py: colored lines, numbered card lists and INPUT prompts"""
+    printer = Print()
+
+    def __init__(self, gateway: 'Gateway', writer: asyncio.StreamWriter) -> None:
+        super().__init__(gateway, writer)
+        self.names: list[str] = []
+        # The cards of the numbered list being prompted, and the cards chosen to pass so far
+        self.options: list[Deck.Card] = []
+        self.kind: Optional[str] = None
+        self.chosen: list[int] = []
+
+    def prompt(self, header: str, message: str) -> None:
+        printer = self.printer
+        self.write(printer(header, color=printer.HEADER))
+        self.write(printer.display_hand(self.options))
+        self.write(printer(message, color=printer.CYAN))
+        self.write(b"INPUT")
+
+    def scores(self, scores: list[int]) -> None:
+        for name, score in zip(self.names, scores):
+            self.write(self.printer(f"{name}: {score}", color=self.printer.CYAN))
+
+    def send(self, message: dict) -> None:
+        printer = self.printer
+        kind = message["type"]
+        if kind == "welcome":
+            self.write(printer(f"Welcome, {message['name']}", color=printer.BLUE))
+        elif kind == "seated":
+            self.names = message["seats"]
+            self.write(printer.clear())
+            self.write(printer("Game starting!\n", color=printer.GREEN))
+        elif kind == "decide":
+            self.kind = message["kind"]
+            self.chosen = []
+            if self.kind == "pass":
+                self.options = [Deck.card_from_index(index) for index in message["hand"]]
+                self.write(printer(f"Passing {message['direction']}\n", color=printer.CYAN, bold=True, underline=True))
+                self.prompt("Your hand:", "Enter the card to pass by number in list: ")
+            else:
+                self.options = [Deck.card_from_index(index) for index in message["legal"]]
+                self.write(printer("Your turn to play", color=printer.GREEN))
+                self.prompt("Cards you can play:", "Enter the card to play by number in list: ")
+        elif kind == "card" and message["seat"] != self.seat:
+            self.write(printer(f"{self.names[message['seat']]}: {Deck.card_from_index(message['card'])}",
+                               color=printer.CYAN))
+        elif kind == "trick":
+            self.write(printer(f"{self.names[message['winner']]} took the trick", color=printer.CYAN))
+        elif kind == "hearts_broken":
+            self.write(printer("\nHearts has been broken!\n", bold=True, color=printer.GREEN))
+        elif kind == "round":
+            self.write(printer("Round has ended!\n", bold=True, color=printer.GREEN))
+            self.scores(message["scores"])
+        elif kind == "game_over":
+            self.write(printer("Game over!\n", bold=True, color=printer.GREEN))
+            self.scores(message["scores"])
+        elif kind == "closed":
+            # Like server.py, the connection ends with the game
+            self.close()
+        elif kind == "error":
+            self.write(printer(message["message"], color=printer.WARNING))
+
+    def receive(self, data: str) -> None:
+        if data.startswith("NAME: ") and self.name is None and not self.waiting:
+            self.gateway.join(self, data.split(":")[1].strip())
+        elif self.kind is not None:
+            if not data.isdigit() or int(data) >= len(self.options):
+                self.write(self.printer("Invalid input, enter a number in range: ", color=self.printer.FAIL))
+                self.write(b"INPUT")
+                return
+            card = self.options.pop(int(data)) if self.kind == "pass" else self.options[int(data)]
+            self.chosen.append(card.index())
+            if self.kind == "pass" and len(self.chosen) < 3:
+                self.prompt("Your hand:", "Enter the card to pass by number in list: ")
+                return
+            self.kind = None
+            self.write(self.printer.clear())
+            self.gateway.answer(self, self.chosen)
+
+
+class Gateway:
+    """The lobby, the tables and the sessions of one process"""
+
+    def __init__(self,
+                 table_size: int = TABLE_SIZE,
+                 queue_time_target: float = QUEUE_TIME_TARGET,
+                 max_tables: int = MAX_TABLES,
+                 turn_timeout: float = TURN_TIMEOUT,
+                 pass_timeout: float = PASS_TIMEOUT,
+                 metrics: Optional[Registry] = None
+                 ) -> None:
+        self.manager = TableManager(self._deliver, max_tables=max_tables, metrics=metrics, wakeup=self._wake)
+        self.matchmaker = Matchmaker(table_size=table_size, queue_time_target=queue_time_target)
+        self.turn_timeout = turn_timeout
+        self.pass_timeout = pass_timeout
+        # The session in each seat, by table and seat
+        self.seated: dict[tuple[int, int], Session] = {}
+        # Sessions of the table being opened, by name, until its start message tells their seats
+        self.seating: dict[str, Session] = {}
+        self.connections = 0
+        self.scheduled = False
+
+    def _wake(self) -> None:
+        if not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self._run)
+
+    def _run(self) -> None:
+        """Play the tables a slice at a time, so the connections are served in between"""
+        self.scheduled = False
+        self.manager.run(RUN_BUDGET)
+        if self.manager.ready:
+            self._wake()
+
+    def _deliver(self, table: Table, seat: Optional[int], message: dict) -> None:
+        """Send a message of a table to the sessions seated at it"""
+        kind = message["type"]
+        if kind == "start":
+            for index, name in enumerate(message["seats"]):
+                session = self.seating.pop(name, None)
+                if session is not None:
+                    session.table, session.seat, session.waiting = table, index, False
+                    self.seated[(table.table_id, index)] = session
+                    session.send({"type": "seated", "table": table.table_id, "seat": index,
+                                  "seats": message["seats"]})
+            return
+        if seat is not None:
+            session = self.seated.get((table.table_id, seat))
+            if session is not None:
+                if kind == "decide":
+                    self._start_deadline(session, message["kind"])
+                session.send(message)
+            return
+        sessions = [self.seated.get((table.table_id, index)) for index in range(len(table.game.players))]
+        if kind == "closed":
+            for index in range(len(sessions)):
+                self.seated.pop((table.table_id, index), None)
+        for session in sessions:
+            if session is not None:
+                if kind == "closed":
+                    session.table = None
+                    session.name = None
+                    self._cancel_deadline(session)
+                session.send(message)
+
+    def _start_deadline(self, session: Session, kind: str) -> None:
+        session.asked += 1
+        asked = session.asked
+        table = session.table
+
+        def expired() -> None:
+            session.deadline = None
+            if session.asked == asked and session.table is table and table.waiting_seat == session.seat:  # type: ignore
+                session.send({"type": "error", "message": "Time is up, a bot decided for you"})
+                self.manager.decide_for(table)  # type: ignore
+        session.deadline = asyncio.get_running_loop().call_later(
+            self.pass_timeout if kind == "pass" else self.turn_timeout, expired)
+
+    def _cancel_deadline(self, session: Session) -> None:
+        if session.deadline is not None:
+            session.deadline.cancel()
+            session.deadline = None
+
+    def join(self, session: Session, name: str) -> None:
+        name = name.strip().capitalize()
+        if session.name is not None:
+            session.send({"type": "error", "message": "Already joined"})
+            return
+        if not name or name.startswith("Bot"):
+            session.send({"type": "error", "message": "Choose another name"})
+            return
+        try:
+            self.matchmaker.join(name, session)
+        except ValueError:
+            session.send({"type": "error", "message": "Name already taken"})
+            return
+        session.name = name
+        session.waiting = True
+        session.send({"type": "welcome", "name": name})
+
+    def answer(self, session: Session, cards: list) -> None:
+        if session.table is None:
+            session.send({"type": "error", "message": "You are not at a table"})
+            return
+        try:
+            self.manager.answer(session.table, session.seat, cards)
+        except ValueError as error:
+            session.send({"type": "error", "message": str(error)})
+            return
+        self._cancel_deadline(session)
+
+    def disconnect(self, session: Session) -> None:
+        """The session is gone, its place in the lobby is given up and a bot takes its seat"""
+        self._cancel_deadline(session)
+        if session.waiting and session.name is not None:
+            self.matchmaker.leave(session.name)
+            session.waiting = False
+        session.name = None
+        table = session.table
+        if table is not None:
+            session.table = None
+            self.seated.pop((table.table_id, session.seat), None)
+            if table.table_id in self.manager.tables:
+                self.manager.leave(table, session.seat)
+
+    def seat_lobby(self) -> None:
+        """Open tables for the people the matchmaker has grouped, as long as there is room for them"""
+        if len(self.manager.tables) >= self.manager.max_tables:
+            return
+        for entries in self.matchmaker.seat_ready():
+            entries = [entry for entry in entries if not entry.connection.closed]
+            if not entries:
+                continue
+            self.seating = {entry.name: entry.connection for entry in entries}
+            try:
+                self.manager.open_table([entry.name for entry in entries])
+            except TableLimitError:
+                # Back to the lobby until a table finishes
+                for entry in entries:
+                    self.matchmaker.join(entry.name, entry.connection)
+            self.seating = {}
+
+    async def seat_forever(self) -> None:
+        while True:
+            await asyncio.sleep(SEATING_INTERVAL)
+            self.seat_lobby()
+
+    def stats(self) -> dict:
+        return {"connections": self.connections, "tables": self.manager.stats(),
+                "lobby": self.matchmaker.snapshot()}
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve a WebSocket upgrade on /ws, or a plain HTTP request"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        request, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in header_lines:
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        parts = request.split(" ")
+        path = parts[1] if len(parts) == 3 else ""
+        if path == "/ws" and headers.get("upgrade", "").lower() == "websocket" and "sec-websocket-key" in headers:
+            writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n").encode())
+            await self.serve_websocket(reader, writer)
+            return
+        if path == "/stats":
+            status, body, content_type = "200 OK", json.dumps(self.stats()).encode(), "application/json"
+        else:
+            status, body, content_type = "404 Not Found", b"Not found\n", "text/plain"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     "Connection: close\r\n\r\n".encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = WebSocketSession(self, writer)
+        self.connections += 1
+        try:
+            while not session.closed:
+                opcode, payload = await read_message(reader, lambda payload: writer.write(encode_frame(payload, PONG)))
+                if opcode == CLOSE:
+                    break
+                if opcode != TEXT:
+                    continue
+                try:
+                    message = json.loads(payload)
+                    kind = message["type"]
+                except (ValueError, KeyError, TypeError):
+                    session.send({"type": "error", "message": "Messages are JSON objects with a type"})
+                    continue
+                if kind == "join":
+                    self.join(session, str(message.get("name", "")))
+                elif kind in ("play", "pass"):
+                    self.answer(session, message.get("cards"))
+                elif kind == "leave":
+                    self.disconnect(session)
+                    session.send({"type": "left"})
+                else:
+                    session.send({"type": "error", "message": f"Unknown message type {kind}"})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            session.close()
+
+    async def serve_text(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = TextSession(self, writer)
+        self.connections += 1
+        try:
+            while not session.closed:
+                data = await reader.read(1024)
+                if not data or data == b"EXIT":
+                    break
+                session.receive(data.decode(errors="replace").strip())
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            session.close()
+
+    async def serve(self, host: str, port: int, text_port: Optional[int] = None) -> list[asyncio.AbstractServer]:
+        """Start listening. The servers are returned to close them, seating runs until the loop stops."""
+        servers = [await asyncio.start_server(self.handle_http, host, port, limit=MAX_REQUEST, backlog=1024)]
+        if text_port is not None:
+            servers.append(await asyncio.start_server(self.serve_text, host, text_port, backlog=1024))
+        asyncio.get_running_loop().create_task(self.seat_forever())
+        return servers
+
+
+async def serve_forever(host: str, port: int, text_port: Optional[int], table_size: int) -> None:
+    gateway = Gateway(table_size=table_size)
+    servers = await gateway.serve(host, port, text_port)
+    print(f"Serving WebSocket on ws://{host}:{servers[0].sockets[0].getsockname()[1]}/ws" +
+          (f" and the text protocol on port {text_port}" if text_port is not None else ""))
+    started = time.monotonic()
+    while True:
+        await asyncio.sleep(60)
+        stats = gateway.stats()
+        print(f"{time.monotonic() - started:.0f}s: {stats['connections']} connections, "
+              f"{stats['tables']['hosted']} tables, {stats['lobby']['queue_depth']} waiting")
+
+
+def main():
+    from loadgen import raise_file_limit
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=GATEWAY_PORT)
+    parser.add_argument("--text-port", type=int, help="also serve the text protocol of server.py on this port")
+    parser.add_argument("--table-size", type=int, default=TABLE_SIZE, help="people seated at each table")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    try:
+        asyncio.run(serve_forever(args.host, args.port, args.text_port, args.table_size))
+    except KeyboardInterrupt:
+        print("Gateway shutting down...")
+
+
+if __name__ == '__main__':
+    main()
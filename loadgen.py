@@ -0,0 +1,268 @@
+"""
+Headless client fleet for load testing the server.
+
+Opens many connections to `server.py` from one process, joins with unique names and answers every INPUT prompt
+with a legal choice taken from the numbered card list the server sends before the prompt. With --websocket the
+clients talk JSON over WebSocket to gateway.py instead, and answer every decision with one of its legal cards.
+
+    python loadgen.py --clients 2000 --ramp 500 --duration 60
+    python loadgen.py --websocket --clients 2000 --duration 60
+
+Reports the connection rate, per-turn round trip latency percentiles and games completed per second.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import time
+from typing import Optional
+
+from gateway import CLOSE, GATEWAY_PORT, PONG, TEXT, accept_key, encode_frame, read_message
+from server import SERVER_PORT
+
+ANSI_ESCAPE = re.compile(rb'\x1b\[[0-9;]*[A-Za-z]')
+OPTION = re.compile(rb'^\s*(\d+): ', re.MULTILINE)
+PROMPT = b"INPUT"
+GAME_OVER = b"Game over!"
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class FleetStats:
+    def __init__(self) -> None:
+        self.connect_times: list[float] = []
+        self.connect_failures = 0
+        self.round_trips: list[float] = []
+        self.games_completed = 0
+        self.dropped = 0
+        self.started = time.perf_counter()
+        self.first_connect: Optional[float] = None
+        self.last_connect: Optional[float] = None
+
+    def record_connect(self, elapsed: float) -> None:
+        now = time.perf_counter()
+        if self.first_connect is None:
+            self.first_connect = now
+        self.last_connect = now
+        self.connect_times.append(elapsed)
+
+    def report(self, table_size: int) -> dict[str, float]:
+        elapsed = time.perf_counter() - self.started
+        connect_window = (self.last_connect or 0) - (self.first_connect or 0)
+        games = self.games_completed / table_size
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "connections": len(self.connect_times),
+            "connect_failures": self.connect_failures,
+            "connections_per_s": round(len(self.connect_times) / connect_window, 1) if connect_window > 0 else float(len(self.connect_times)),
+            "connect_p50_ms": round(percentile(self.connect_times, 50) * 1000, 3),
+            "connect_p99_ms": round(percentile(self.connect_times, 99) * 1000, 3),
+            "turns": len(self.round_trips),
+            "turn_rtt_p50_ms": round(percentile(self.round_trips, 50) * 1000, 3),
+            "turn_rtt_p90_ms": round(percentile(self.round_trips, 90) * 1000, 3),
+            "turn_rtt_p99_ms": round(percentile(self.round_trips, 99) * 1000, 3),
+            "turn_rtt_max_ms": round(max(self.round_trips, default=0) * 1000, 3),
+            "games_completed": games,
+            "games_per_s": round(games / elapsed, 3) if elapsed > 0 else 0.0,
+            "dropped_connections": self.dropped,
+        }
+
+
+async def play_one_game(host: str, port: int, name: str, stats: FleetStats, rng: random.Random) -> bool:
+    """Connect, join and answer prompts until the server closes the connection.
+
+    Returns:
+        bool: True if the game was played to the end
+    """
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.connect_failures += 1
+        return False
+    stats.record_connect(time.perf_counter() - start)
+
+    writer.write(f"NAME: {name}".encode())
+    await writer.drain()
+    buffer = b""
+    option_count = 0
+    answered_at: Optional[float] = None
+    finished = False
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            buffer += ANSI_ESCAPE.sub(b"", data)
+            if GAME_OVER in buffer:
+                finished = True
+            while PROMPT in buffer:
+                if answered_at is not None:
+                    # From our answer until the server asks for the next decision
+                    stats.round_trips.append(
+                        time.perf_counter() - answered_at)
+                before, _, buffer = buffer.partition(PROMPT)
+                options = [int(index) for index in OPTION.findall(before)]
+                if options:
+                    option_count = max(options) + 1
+                writer.write(str(rng.randrange(max(option_count, 1))).encode())
+                await writer.drain()
+                answered_at = time.perf_counter()
+            # Only the text since the last prompt is needed to answer the next one
+            if len(buffer) > 65536:
+                buffer = buffer[-8192:]
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+    if finished:
+        stats.games_completed += 1
+    else:
+        stats.dropped += 1
+    return finished
+
+
+async def play_one_game_websocket(host: str, port: int, name: str, stats: FleetStats, rng: random.Random) -> bool:
+    """Connect to gateway.py over WebSocket, join and answer decisions until the table closes.
+
+    Returns:
+        bool: True if the game was played to the end
+    """
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode())
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (OSError, asyncio.IncompleteReadError):
+        stats.connect_failures += 1
+        return False
+    if accept_key(key).encode() not in head:
+        stats.connect_failures += 1
+        writer.close()
+        return False
+    stats.record_connect(time.perf_counter() - start)
+
+    def send(message: dict) -> None:
+        writer.write(encode_frame(json.dumps(message).encode(), mask=True))
+    send({"type": "join", "name": name})
+    answered_at: Optional[float] = None
+    finished = False
+    try:
+        while True:
+            opcode, payload = await read_message(reader, lambda payload: writer.write(encode_frame(payload, PONG, mask=True)))
+            if opcode == CLOSE:
+                break
+            if opcode != TEXT:
+                continue
+            message = json.loads(payload)
+            if message["type"] == "game_over":
+                finished = True
+            elif message["type"] == "closed":
+                break
+            elif message["type"] == "decide":
+                if answered_at is not None:
+                    # From our answer until the gateway asks for the next decision
+                    stats.round_trips.append(time.perf_counter() - answered_at)
+                if message["kind"] == "play":
+                    send({"type": "play", "cards": [rng.choice(message["legal"])]})
+                else:
+                    send({"type": "pass", "cards": rng.sample(message["hand"], 3)})
+                answered_at = time.perf_counter()
+        writer.write(encode_frame(b"", CLOSE, mask=True))
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+    if finished:
+        stats.games_completed += 1
+    else:
+        stats.dropped += 1
+    return finished
+
+
+async def client_loop(host: str, port: int, client_id: int, stats: FleetStats, deadline: float, rng: random.Random,
+                      websocket: bool = False) -> None:
+    """Play at least one game, then keep playing games until the deadline"""
+    play = play_one_game_websocket if websocket else play_one_game
+    generation = 0
+    while True:
+        finished = await play(host, port, f"load{client_id}g{generation}", stats, rng)
+        generation += 1
+        if time.perf_counter() >= deadline:
+            break
+        if not finished:
+            await asyncio.sleep(0.1)
+
+
+async def run_fleet(host: str, port: int, clients: int, ramp: float, duration: float, seed: int,
+                    websocket: bool = False) -> FleetStats:
+    stats = FleetStats()
+    deadline = time.perf_counter() + duration
+    rng = random.Random(seed)
+    tasks = []
+    ramp_start = time.perf_counter()
+    for client_id in range(clients):
+        tasks.append(asyncio.create_task(
+            client_loop(host, port, client_id, stats, deadline, rng, websocket)))
+        if ramp > 0:
+            # Sleep until this client's slot so a busy event loop does not slow the ramp down
+            await asyncio.sleep(max(0.0, ramp_start + (client_id + 1) / ramp - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def raise_file_limit() -> None:
+    """Every connection needs a file descriptor, raise the soft limit as far as we are allowed to"""
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help=f"defaults to {SERVER_PORT}, or {GATEWAY_PORT} with --websocket")
+    parser.add_argument("--websocket", action="store_true",
+                        help="play through gateway.py over WebSocket instead of the text protocol")
+    parser.add_argument("--clients", type=int, default=100,
+                        help="number of concurrent connections")
+    parser.add_argument("--ramp", type=float, default=500,
+                        help="new connections per second while starting up, 0 for all at once")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds to keep starting new games")
+    parser.add_argument("--table-size", type=int, default=1,
+                        help="humans per table on the server, used to count games")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    port = args.port or (GATEWAY_PORT if args.websocket else SERVER_PORT)
+    stats = asyncio.run(run_fleet(args.host, port, args.clients,
+                        args.ramp, args.duration, args.seed, args.websocket))
+    report = stats.report(args.table_size)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:>22}: {value}")
+
+
+if __name__ == '__main__':
+    main()
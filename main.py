@@ -41,7 +41,7 @@ def main():
         print('Passing', api.get_passing_direction())
         print("Player: ", player)
         player_state = api.get_player_state(player)
-        player_hand = player_state['hand']
+        player_hand = list(player_state['hand'])
         print("Hand: ", dict(enumerate(player_hand)))
         chosen_cards = []
         for i in range(3):
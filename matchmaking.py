@@ -0,0 +1,240 @@
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+# Seats at a table. Whatever is not taken by a human is filled by a bot when the game is created.
+SEATS_PER_TABLE = 4
+
+
+class QueueEntry:
+    """A player waiting in the lobby to be seated at a table."""
+
+    def __init__(self, name: str, connection: Any, skill: int, latency_ms: int, enqueued_at: float) -> None:
+        self.name = name
+        self.connection = connection
+        self.skill = skill
+        self.latency_ms = latency_ms
+        self.enqueued_at = enqueued_at
+        # Set when the player leaves the queue. Entries are removed lazily from their bucket.
+        self.cancelled = False
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+class MatchmakingStats:
+    """Counters for the matchmaker. Time-to-seat samples are kept in a bounded window for percentiles."""
+
+    def __init__(self, window: int = 4096) -> None:
+        self.joined = 0
+        self.left = 0
+        self.seated = 0
+        self.tables_formed = 0
+        self.bot_seats = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits: deque[float] = deque(maxlen=window)
+
+    def record_seat(self, wait: float) -> None:
+        self.seated += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+        self.recent_waits.append(wait)
+
+    def wait_percentile(self, percentile: float) -> float:
+        """Get a percentile of the recent time-to-seat samples.
+
+        Args:
+            percentile (float): A number between 0 and 100
+
+        Returns:
+            float: The wait in seconds, 0 if nobody has been seated yet
+        """
+        if not self.recent_waits:
+            return 0.0
+        ordered = sorted(self.recent_waits)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class Matchmaker:
+    """
+    Lobby that groups waiting players into tables.
+
+    Players are bucketed by skill and latency so that a table is only formed from similar players.
+    Seating is done in batches by calling `seat_ready` periodically rather than after every join,
+    so a join is a constant time append no matter how many people are waiting.
+    A player who has waited longer than `queue_time_target` is seated with the closest players
+    from any bucket, and the empty seats are filled with bots.
+    """
+
+    def __init__(self,
+                 table_size: int = SEATS_PER_TABLE,
+                 skill_bucket_width: int = 200,
+                 latency_bucket_width: int = 100,
+                 queue_time_target: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic
+                 ) -> None:
+        """
+        Args:
+            table_size (int): The number of humans to seat at a full table (1-4), the rest of the seats are bots
+            skill_bucket_width (int): Players whose skill differs by less than this are matched together
+            latency_bucket_width (int): Players whose latency (ms) differs by less than this are matched together
+            queue_time_target (float): Seconds after which a player is seated with whoever is available
+            clock (Callable[[], float]): Time source, monotonic seconds
+        """
+        if not isinstance(table_size, int) or not 1 <= table_size <= SEATS_PER_TABLE:
+            raise ValueError(
+                f"Table size must be between 1 and {SEATS_PER_TABLE}")
+        if skill_bucket_width <= 0 or latency_bucket_width <= 0:
+            raise ValueError("Bucket widths must be positive")
+
+        self.table_size = table_size
+        self.skill_bucket_width = skill_bucket_width
+        self.latency_bucket_width = latency_bucket_width
+        self.queue_time_target = queue_time_target
+        self.clock = clock
+
+        self.buckets: dict[tuple[int, int], deque[QueueEntry]] = {}
+        # Buckets that received players since the last seating pass
+        self.dirty_buckets: set[tuple[int, int]] = set()
+        self.waiting: dict[str, QueueEntry] = {}
+        self.stats = MatchmakingStats()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.waiting)
+
+    def bucket_key(self, skill: int, latency_ms: int) -> tuple[int, int]:
+        return skill // self.skill_bucket_width, latency_ms // self.latency_bucket_width
+
+    def join(self, name: str, connection: Any = None, skill: int = 0, latency_ms: int = 0) -> QueueEntry:
+        """Add a player to the queue.
+
+        Args:
+            name (str): The player's name, unique among the waiting players
+            connection (Any): Whatever the frontend uses to talk to the player
+            skill (int): The player's rating
+            latency_ms (int): The player's measured round trip time
+
+        Returns:
+            QueueEntry: The queue entry for the player
+        """
+        if name in self.waiting:
+            raise ValueError("Name already taken")
+        entry = QueueEntry(name, connection, skill,
+                           latency_ms, self.clock())
+        key = self.bucket_key(skill, latency_ms)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = deque()
+        bucket.append(entry)
+        self.dirty_buckets.add(key)
+        self.waiting[name] = entry
+        self.stats.joined += 1
+        return entry
+
+    def leave(self, name: str) -> Optional[QueueEntry]:
+        """Remove a player from the queue, if they are still waiting.
+
+        Args:
+            name (str): The player's name
+
+        Returns:
+            Optional[QueueEntry]: The removed entry or None if the player was not waiting
+        """
+        entry = self.waiting.pop(name, None)
+        if entry is not None:
+            entry.cancelled = True
+            self.stats.left += 1
+        return entry
+
+    def seat_ready(self, now: Optional[float] = None) -> list[list[QueueEntry]]:
+        """Form as many tables as possible from the waiting players.
+
+        Full tables are formed within a bucket first. Then any player who waited longer than the queue time target
+        is seated with the nearest waiting players from the other buckets, with bots filling any empty seats.
+
+        Args:
+            now (Optional[float]): The current time, defaults to the matchmaker clock
+
+        Returns:
+            list[list[QueueEntry]]: The players of each new table, oldest first
+        """
+        if now is None:
+            now = self.clock()
+        tables: list[list[QueueEntry]] = []
+
+        for key in self.dirty_buckets:
+            bucket = self.buckets[key]
+            while len(bucket) >= self.table_size:
+                table = []
+                while bucket and len(table) < self.table_size:
+                    entry = bucket.popleft()
+                    if not entry.cancelled:
+                        table.append(entry)
+                if len(table) < self.table_size:
+                    bucket.extendleft(reversed(table))
+                    break
+                tables.append(table)
+        self.dirty_buckets.clear()
+
+        # Only the leftovers of each bucket (fewer than a table each) are looked at here
+        deadline = now - self.queue_time_target
+        leftovers = []
+        for key, bucket in self.buckets.items():
+            live = [entry for entry in bucket if not entry.cancelled]
+            if len(live) != len(bucket):
+                self.buckets[key] = deque(live)
+            leftovers.extend((entry, key) for entry in live)
+        leftovers.sort(key=lambda item: item[0].enqueued_at)
+        taken: set[int] = set()
+        for entry, key in leftovers:
+            if entry.enqueued_at > deadline:
+                break
+            if id(entry) in taken:
+                continue
+            candidates = sorted(
+                (item for item in leftovers if id(item[0]) not in taken and item[0] is not entry),
+                key=lambda item: (abs(item[1][0] - key[0]) + abs(item[1][1] - key[1]), item[0].enqueued_at))
+            table = [entry] + [item[0]
+                               for item in candidates[:self.table_size - 1]]
+            taken.update(id(seated) for seated in table)
+            tables.append(table)
+
+        if taken:
+            for key in list(self.buckets):
+                self.buckets[key] = deque(
+                    entry for entry in self.buckets[key] if id(entry) not in taken)
+
+        for key in [key for key, bucket in self.buckets.items() if not bucket]:
+            del self.buckets[key]
+
+        for table in tables:
+            for entry in table:
+                del self.waiting[entry.name]
+                self.stats.record_seat(now - entry.enqueued_at)
+            self.stats.tables_formed += 1
+            self.stats.bot_seats += SEATS_PER_TABLE - len(table)
+        return tables
+
+    def snapshot(self) -> dict[str, float]:
+        """Get the matchmaking metrics
+
+        Returns:
+            dict[str, float]: queue depth, counters and time-to-seat statistics in seconds
+        """
+        stats = self.stats
+        return {
+            "queue_depth": self.queue_depth,
+            "joined": stats.joined,
+            "left": stats.left,
+            "seated": stats.seated,
+            "tables_formed": stats.tables_formed,
+            "bot_seats": stats.bot_seats,
+            "time_to_seat_mean": stats.total_wait / stats.seated if stats.seated else 0.0,
+            "time_to_seat_max": stats.max_wait,
+            "time_to_seat_p50": stats.wait_percentile(50),
+            "time_to_seat_p95": stats.wait_percentile(95),
+        }
@@ -0,0 +1,303 @@
+import threading
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+# Each power of two is split into 2 ** PRECISION_BITS linear sub-buckets, so a recorded value is off by at most ~6%
+PRECISION_BITS = 4
+_SUB_BUCKETS = 1 << PRECISION_BITS
+# Values below this are counted exactly
+_EXACT_LIMIT = _SUB_BUCKETS * 2
+# Largest power of two a value is bucketed by, larger values are counted in the last bucket
+_MAX_SHIFT = 40
+_BUCKET_COUNT = _EXACT_LIMIT + _MAX_SHIFT * _SUB_BUCKETS
+
+
+def _bucket_index(value: int) -> int:
+    if value < _EXACT_LIMIT:
+        return max(value, 0)
+    shift = value.bit_length() - PRECISION_BITS - 1
+    if shift > _MAX_SHIFT:
+        return _BUCKET_COUNT - 1
+    return _EXACT_LIMIT + (shift - 1) * _SUB_BUCKETS + (value >> shift) - _SUB_BUCKETS
+
+
+def _bucket_upper_bound(index: int) -> int:
+    """The largest value that is counted in a bucket"""
+    if index < _EXACT_LIMIT:
+        return index
+    shift = (index - _EXACT_LIMIT) // _SUB_BUCKETS + 1
+    sub_bucket = (index - _EXACT_LIMIT) % _SUB_BUCKETS + _SUB_BUCKETS
+    return ((sub_bucket + 1) << shift) - 1
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    __slots__ = ("value", "lock")
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value", "function")
+
+    def __init__(self, function: Optional[Callable[[], float]] = None) -> None:
+        self.value = 0.0
+        # When set, the gauge is read from this function when it is collected
+        self.function = function
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def read(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    """
+    Fixed memory log-linear histogram in the style of HdrHistogram.
+    Values are recorded as integers in units of 1 / `scale`, e.g. microseconds for a histogram of seconds with scale 1e6.
+    """
+    __slots__ = ("counts", "count", "total", "max", "scale", "lock")
+
+    def __init__(self, scale: float = 1.0) -> None:
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.scale = scale
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        scaled = int(value * self.scale)
+        index = _bucket_index(scaled)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += scaled
+            if scaled > self.max:
+                self.max = scaled
+
+    def percentile(self, percent: float) -> float:
+        """Get a percentile of the recorded values, accurate to the bucket precision.
+
+        Args:
+            percent (float): 0-100
+
+        Returns:
+            float: The value, in the histogram's units
+        """
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, round(self.count * percent / 100))
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return min(_bucket_upper_bound(index), self.max) / self.scale
+        return self.max / self.scale
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.total / self.scale,
+            "max": self.max / self.scale,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+    def cumulative_buckets(self) -> list[tuple[float, int]]:
+        """Cumulative counts at each power of two, up to the largest recorded value, for the Prometheus `le` buckets"""
+        with self.lock:
+            counts = list(self.counts)
+            highest = self.max
+        result = []
+        seen = 0
+        bound_index = _EXACT_LIMIT - 1
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if index == bound_index or index == len(counts) - 1:
+                result.append((_bucket_upper_bound(index) / self.scale, seen))
+                if _bucket_upper_bound(index) >= highest:
+                    break
+                bound_index += _SUB_BUCKETS
+        return result
+
+
+class _NullMetric:
+    """Stands in for every metric of a disabled registry"""
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+_NULL_METRIC = _NullMetric()
+
+
+class Registry:
+    """
+    Collection of named metrics that can be read in process with `snapshot` or scraped in the Prometheus text format.
+    A disabled registry hands out a shared do-nothing metric, and `timed` returns hooks unchanged, so instrumented
+    code costs nothing when metrics are off.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # name -> (type, help, {labels: metric})
+        self.families: dict[str, tuple[str, str, dict[tuple[tuple[str, str], ...], object]]] = {}
+
+    def _get(self, kind: str, name: str, help: str, labels: Optional[dict[str, str]], factory: Callable[[], object]):
+        if not self.enabled:
+            return _NULL_METRIC
+        label_key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = (kind, help, {})
+            elif family[0] != kind:
+                raise ValueError(f"{name} is already registered as a {family[0]}")
+            metric = family[2].get(label_key)
+            if metric is None:
+                metric = family[2][label_key] = factory()
+        return metric
+
+    def counter(self, name: str, help: str, labels: Optional[dict[str, str]] = None) -> Counter:
+        return self._get("counter", name, help, labels, Counter)
+
+    def gauge(self, name: str, help: str, labels: Optional[dict[str, str]] = None, function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._get("gauge", name, help, labels, lambda: Gauge(function))
+
+    def histogram(self, name: str, help: str, labels: Optional[dict[str, str]] = None, scale: float = 1e6) -> Histogram:
+        """Get or create a histogram. The default scale records seconds with microsecond resolution."""
+        return self._get("histogram", name, help, labels, lambda: Histogram(scale))
+
+    def timed(self, histogram: Histogram, function: Callable) -> Callable:
+        """Wrap a function so its duration is observed by the histogram. The signature of the function is kept."""
+        if not self.enabled:
+            return function
+
+        if iscoroutinefunction(function):
+            @wraps(function)
+            async def timed_coroutine(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return timed_coroutine
+
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return timed_function
+
+    def snapshot(self) -> dict[str, object]:
+        """Read every metric.
+
+        Returns:
+            dict[str, object]: Metric name (with labels) to its value, or to a summary dict for histograms
+        """
+        result: dict[str, object] = {}
+        with self.lock:
+            families = [(name, family[0], list(family[2].items()))
+                        for name, family in self.families.items()]
+        for name, kind, metrics in families:
+            for label_key, metric in metrics:
+                key = name + _format_labels(label_key)
+                if kind == "counter":
+                    result[key] = metric.value  # type: ignore
+                elif kind == "gauge":
+                    result[key] = metric.read()  # type: ignore
+                else:
+                    result[key] = metric.summary()  # type: ignore
+        return result
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            families = [(name, family[0], family[1], list(family[2].items()))
+                        for name, family in self.families.items()]
+        for name, kind, help, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for label_key, metric in metrics:
+                if kind == "counter":
+                    lines.append(
+                        f"{name}{_format_labels(label_key)} {metric.value}")  # type: ignore
+                elif kind == "gauge":
+                    lines.append(
+                        f"{name}{_format_labels(label_key)} {metric.read()}")  # type: ignore
+                else:
+                    for bound, cumulative in metric.cumulative_buckets():  # type: ignore
+                        bucket_labels = _format_labels(
+                            label_key, 'le="%g"' % bound)
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    bucket_labels = _format_labels(label_key, 'le="+Inf"')
+                    lines.append(
+                        f"{name}_bucket{bucket_labels} {metric.count}")  # type: ignore
+                    lines.append(
+                        f"{name}_sum{_format_labels(label_key)} {metric.total / metric.scale}")  # type: ignore
+                    lines.append(
+                        f"{name}_count{_format_labels(label_key)} {metric.count}")  # type: ignore
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve the metrics in the Prometheus text format on http://host:port/metrics from a daemon thread"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=http_server.serve_forever,
+                         daemon=True).start()
+        return http_server
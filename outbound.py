@@ -0,0 +1,301 @@
+import selectors
+import socket
+import threading
+from collections import deque
+from typing import Literal, Optional
+
+# What to do with a client whose outbound queue is over its limit
+# - coalesce: keep only the newest queued frame of each key
+# - drop: drop the oldest keyed (spectator) frames
+# - disconnect: close the connection straight away
+# If coalescing or dropping does not bring the queue under the limit, the client is disconnected.
+SLOW_CONSUMER_POLICY = Literal["coalesce", "drop", "disconnect"]
+
+
+class SlowConsumerError(ConnectionError):
+    pass
+
+
+class OutboundCounters:
+    """Counters shared by every connection of a server"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.frames_queued = 0
+        self.frames_dropped = 0
+        self.frames_coalesced = 0
+        self.slow_consumer_disconnects = 0
+        # The largest number of bytes that were waiting to be written to a single connection
+        self.high_water_bytes = 0
+        self.open_connections = 0
+
+    def snapshot(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "bytes_sent": self.bytes_sent,
+                "frames_queued": self.frames_queued,
+                "frames_dropped": self.frames_dropped,
+                "frames_coalesced": self.frames_coalesced,
+                "slow_consumer_disconnects": self.slow_consumer_disconnects,
+                "high_water_bytes": self.high_water_bytes,
+                "open_connections": self.open_connections,
+            }
+
+
+class Connection:
+    """
+    A client socket with a bounded outbound queue.
+
+    `send` never blocks: it writes what the socket accepts right away and leaves the rest to the `OutboundPump`,
+    so a slow client can not hold up the game thread or the other players at the table.
+    Frames can be given a key to mark them as spectator frames that may be coalesced or dropped.
+    """
+
+    def __init__(self,
+                 sock: socket.socket,
+                 pump: Optional['OutboundPump'] = None,
+                 max_bytes: int = 64 * 1024,
+                 policy: SLOW_CONSUMER_POLICY = "coalesce",
+                 counters: Optional[OutboundCounters] = None
+                 ) -> None:
+        """
+        Args:
+            sock (socket.socket): A connected socket, it is switched to non-blocking mode when a pump is given
+            pump (Optional[OutboundPump]): Writes queued data when the socket becomes writable. Without one, sends block
+            max_bytes (int): Queued bytes above which the slow consumer policy kicks in
+            policy (SLOW_CONSUMER_POLICY): What to do with a slow consumer
+            counters (Optional[OutboundCounters]): Counters to update
+        """
+        self.socket = sock
+        self.pump = pump
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.counters = counters if counters is not None else OutboundCounters()
+        if pump is not None:
+            sock.setblocking(False)
+
+        self.lock = threading.Lock()
+        self.frames: deque[tuple[memoryview, Optional[str]]] = deque()
+        self.queued_bytes = 0
+        self.high_water_bytes = 0
+        # Bytes the socket accepted, the counters add up every connection
+        self.bytes_sent = 0
+        self.closed = False
+        with self.counters.lock:
+            self.counters.open_connections += 1
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def recv(self, size: int) -> bytes:
+        return self.socket.recv(size)
+
+    def send(self, data: bytes, key: Optional[str] = None) -> None:
+        """Queue data for the client and write as much of it as the socket accepts.
+
+        Args:
+            data (bytes): The frame to send
+            key (Optional[str]): Set for spectator frames. The slow consumer policy may coalesce or drop them
+
+        Raises:
+            ConnectionError: If the connection is closed or was closed for being too slow
+        """
+        if self.pump is None:
+            if self.closed:
+                raise ConnectionError("Connection is closed")
+            self.socket.sendall(data)
+            self._count_sent(len(data))
+            return
+
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Connection is closed")
+            self.frames.append((memoryview(data), key))
+            self.queued_bytes += len(data)
+            if self.queued_bytes > self.high_water_bytes:
+                self.high_water_bytes = self.queued_bytes
+            with self.counters.lock:
+                self.counters.frames_queued += 1
+                if self.queued_bytes > self.counters.high_water_bytes:
+                    self.counters.high_water_bytes = self.queued_bytes
+            self._write()
+            if self.queued_bytes > self.max_bytes:
+                self._shed_load()
+            pending = bool(self.frames)
+        if pending:
+            self.pump.want_write(self)
+
+    def flush(self) -> bool:
+        """Write queued data without blocking. Called by the pump when the socket is writable.
+
+        Returns:
+            bool: True if data is still waiting to be written
+        """
+        with self.lock:
+            if self.closed:
+                return False
+            try:
+                self._write()
+            except OSError:
+                self._close()
+                return False
+            return bool(self.frames)
+
+    def close(self) -> None:
+        with self.lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        with self.counters.lock:
+            self.counters.open_connections -= 1
+        self.frames.clear()
+        self.queued_bytes = 0
+        self.socket.close()
+
+    def _write(self) -> None:
+        sent_total = 0
+        try:
+            while self.frames:
+                frame, key = self.frames[0]
+                sent = self.socket.send(frame)
+                sent_total += sent
+                if sent < len(frame):
+                    self.frames[0] = (frame[sent:], key)
+                    break
+                self.frames.popleft()
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self.queued_bytes -= sent_total
+            self._count_sent(sent_total)
+
+    def _count_sent(self, sent: int) -> None:
+        if sent:
+            self.bytes_sent += sent
+            with self.counters.lock:
+                self.counters.bytes_sent += sent
+
+    def _shed_load(self) -> None:
+        """Apply the slow consumer policy. Called with the lock held."""
+        frames = self.frames
+        # A partly written frame must be finished, or the client would see half a message
+        head = frames.popleft() if frames and self._is_partial(frames[0][0]) else None
+        removed = 0
+        if self.policy == "coalesce":
+            newest: dict[str, int] = {}
+            for index, (_, key) in enumerate(frames):
+                if key is not None:
+                    newest[key] = index
+            kept = deque(frame for index, frame in enumerate(frames)
+                         if frame[1] is None or newest[frame[1]] == index)
+            removed = len(frames) - len(kept)
+            counter = "frames_coalesced"
+        elif self.policy == "drop":
+            kept = deque()
+            over = self.queued_bytes - self.max_bytes
+            for frame in frames:
+                if frame[1] is not None and over > 0:
+                    over -= len(frame[0])
+                    removed += 1
+                else:
+                    kept.append(frame)
+            counter = "frames_dropped"
+        else:
+            kept = frames
+        if head is not None:
+            kept.appendleft(head)
+        self.frames = kept
+        if removed:
+            self.queued_bytes = sum(len(frame) for frame, _ in kept)
+            with self.counters.lock:
+                setattr(self.counters, counter,
+                        getattr(self.counters, counter) + removed)
+
+        if self.queued_bytes > self.max_bytes:
+            with self.counters.lock:
+                self.counters.slow_consumer_disconnects += 1
+            self._close()
+            raise SlowConsumerError("Client is not reading fast enough")
+
+    def _is_partial(self, frame: memoryview) -> bool:
+        return frame.obj is not None and len(frame) != len(frame.obj)
+
+
+class OutboundPump:
+    """Single thread that finishes the writes of every connection whose socket was not ready to take all of its data"""
+
+    def __init__(self) -> None:
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+        self.lock = threading.Lock()
+        self.pending: list[Connection] = []
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = False
+
+    def want_write(self, connection: Connection) -> None:
+        """Ask the pump to write the rest of a connection's queue. Safe to call from any thread."""
+        with self.lock:
+            self.pending.append(connection)
+        try:
+            self.wakeup_sender.send(b'\0')
+        except BlockingIOError:  # A wakeup is already pending
+            pass
+
+    def run_once(self, timeout: Optional[float] = None) -> None:
+        for key, _ in self.selector.select(timeout):
+            if key.fileobj is self.wakeup_receiver:
+                try:
+                    while self.wakeup_receiver.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                continue
+            connection: Connection = key.fileobj  # type: ignore
+            if not connection.flush():
+                self.selector.unregister(connection)
+
+        # Forget connections that were closed while they were waiting
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj is not self.wakeup_receiver and key.fileobj.closed:  # type: ignore
+                self.selector.unregister(key.fileobj)
+
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for connection in pending:
+            if connection.closed:
+                continue
+            try:
+                key = self.selector.get_key(connection)
+            except KeyError:
+                key = None
+            if key is not None:
+                if key.fileobj is connection:  # Already waiting to be written
+                    continue
+                # A connection that was closed since the last pass had the same file descriptor
+                self.selector.unregister(key.fileobj)
+            self.selector.register(connection, selectors.EVENT_WRITE)
+
+    def start(self) -> None:
+        self.wakeup_sender.setblocking(False)
+
+        def run():
+            while not self.stopped:
+                self.run_once(1.0)
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped = True
+        try:
+            self.wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+        if self.thread is not None:
+            self.thread.join()
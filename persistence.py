@@ -0,0 +1,263 @@
+"""
+Durable state of the tables being played, kept in a SQLite database so the server can resume its games after a crash.
+
+A table is stored as its seats (player names and resume tokens) and the binary log of its game, see
+backend/game_log.py, which holds the deal, passes, plays and scores. Games append to their log once per trick.
+The appends are queued and a single writer thread commits everything that is waiting in one transaction, so a game
+thread never waits for the disk and the number of commits does not grow with the number of tables.
+
+    python persistence.py --tables 50 --games 4
+benchmarks the writes per second when that many tables play at once.
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from metrics import Registry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tables (
+    id INTEGER PRIMARY KEY,
+    seats TEXT NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_id INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS log_records_table ON log_records (table_id, seq);
+"""
+
+_OPEN = 0
+_APPEND = 1
+_FINISH = 2
+
+
+class RecoveredTable(NamedTuple):
+    table_id: int
+    # Name and resume token of each player, in seat order
+    seats: list[tuple[str, str]]
+    log: bytes
+
+
+class TableLog:
+    """
+    The game log of one table, to be set with `API.set_game_log`.
+    Keeps the whole log in memory and queues every write for the database.
+    """
+
+    def __init__(self, store: 'TableStore', table_id: int, log: bytes = b"") -> None:
+        self.store = store
+        self.table_id = table_id
+        self.data = bytearray(log)
+
+    def write(self, data: bytes) -> int:
+        self.data += data
+        self.store.queue.put((_APPEND, self.table_id, bytes(data)))
+        return len(data)
+
+    def tell(self) -> int:
+        return len(self.data)
+
+    def getvalue(self) -> bytes:
+        return bytes(self.data)
+
+
+class TableStore:
+    """The tables being played, in a SQLite database in WAL mode with a single writer thread"""
+
+    def __init__(self, path: str, max_batch: int = 4096, metrics: Optional[Registry] = None) -> None:
+        """Open or create the database.
+
+        Args:
+            path (str): The database file
+            max_batch (int): Most queued writes committed in one transaction
+            metrics (Optional[Registry]): Where to report commits
+        """
+        self.path = path
+        self.max_batch = max_batch
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        with sqlite3.connect(path) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            (last_id,) = connection.execute("SELECT MAX(id) FROM tables").fetchone()
+        connection.close()
+        self.next_id = (last_id or 0) + 1
+        self.id_lock = threading.Lock()
+
+        metrics = metrics if metrics is not None else Registry(enabled=False)
+        self.commit_seconds = metrics.histogram(
+            "hearts_state_commit_seconds", "Time to commit a batch of table state writes")
+        self.writes = metrics.counter(
+            "hearts_state_writes_total", "Table state writes committed")
+        self.commits = metrics.counter(
+            "hearts_state_commits_total", "Transactions committed to the table state database")
+        metrics.gauge("hearts_state_queue_depth", "Table state writes waiting for the writer thread",
+                      function=self.queue.qsize)
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        """Commit what is queued and stop the writer thread"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def flush(self) -> None:
+        """Wait until every queued write is committed"""
+        self.queue.join()
+
+    def open_table(self, seats: list[tuple[str, str]]) -> TableLog:
+        """Start storing a new table.
+
+        Args:
+            seats (list[tuple[str, str]]): Name and resume token of each player, in seat order
+
+        Returns:
+            TableLog: The table's game log
+        """
+        with self.id_lock:
+            table_id = self.next_id
+            self.next_id += 1
+        self.queue.put((_OPEN, table_id, json.dumps(seats)))
+        return TableLog(self, table_id)
+
+    def resume_table(self, table: RecoveredTable) -> TableLog:
+        """Carry on storing a table that was recovered, its log continues after what is already stored"""
+        return TableLog(self, table.table_id, table.log)
+
+    def finish(self, table_id: int) -> None:
+        """Forget a table whose game is over or was abandoned"""
+        self.queue.put((_FINISH, table_id, None))
+
+    def unfinished(self) -> list[RecoveredTable]:
+        """The tables that were still being played when the server stopped, read before the writer starts"""
+        tables = []
+        with sqlite3.connect(self.path) as connection:
+            for table_id, seats in connection.execute("SELECT id, seats FROM tables ORDER BY id").fetchall():
+                log = b''.join(data for (data,) in connection.execute(
+                    "SELECT data FROM log_records WHERE table_id = ? ORDER BY seq", (table_id,)))
+                tables.append(RecoveredTable(table_id, [tuple(seat) for seat in json.loads(seats)], log))
+        connection.close()
+        return tables
+
+    def _run(self) -> None:
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        # Commits survive the server crashing without waiting for fsync, only a power loss may lose the last few
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch.remove(None)
+            opened = [(table_id, value, time.time()) for operation, table_id, value in batch if operation == _OPEN]
+            appended = [(table_id, value) for operation, table_id, value in batch if operation == _APPEND]
+            finished = [(table_id,) for operation, table_id, _ in batch if operation == _FINISH]
+            start = time.perf_counter()
+            try:
+                # A table is finished after its last append, so the deletes go last
+                connection.execute("BEGIN")
+                connection.executemany("INSERT INTO tables (id, seats, started) VALUES (?, ?, ?)", opened)
+                connection.executemany("INSERT INTO log_records (table_id, data) VALUES (?, ?)", appended)
+                connection.executemany("DELETE FROM log_records WHERE table_id = ?", finished)
+                connection.executemany("DELETE FROM tables WHERE id = ?", finished)
+                connection.execute("COMMIT")
+                self.commit_seconds.observe(time.perf_counter() - start)
+                self.commits.inc()
+                self.writes.inc(len(batch))
+            except sqlite3.Error as e:
+                print("Error writing table state:", repr(e))
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+            finally:
+                for _ in range(len(batch) + (not running)):
+                    self.queue.task_done()
+        connection.close()
+
+
+def _play_games(store: Optional[TableStore], games: int, seed: int) -> None:
+    """Play games between one player and three bots on this thread, storing them when there is a store"""
+    # Imported here, the store itself does not depend on the game
+    from api import scripted_api
+    rng = random.Random(seed)
+    for _ in range(games):
+        api = scripted_api(rng=rng)
+        table_log = None
+        if store is not None:
+            table_log = store.open_table([("Alice", "")])
+            api.set_game_log(table_log, batch="trick")  # type: ignore
+        api.start_game()
+        if table_log is not None:
+            store.finish(table_log.table_id)  # type: ignore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=50, help="tables playing at once")
+    parser.add_argument("--games", type=int, default=4, help="games played by each table")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for stored in (False, True):
+            metrics = Registry()
+            store = None
+            if stored:
+                store = TableStore(os.path.join(directory, "tables.db"), metrics=metrics)
+                store.start()
+            threads = [threading.Thread(target=_play_games, args=(store, args.games, seed))
+                       for seed in range(args.tables)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            played = time.perf_counter() - start
+            if store is None:
+                results["seconds_without_store"] = round(played, 3)
+                continue
+            store.close()
+            elapsed = time.perf_counter() - start
+            snapshot = metrics.snapshot()
+            writes = snapshot["hearts_state_writes_total"]
+            commits = snapshot["hearts_state_commits_total"]
+            results.update({
+                "tables": args.tables,
+                "games": args.tables * args.games,
+                "seconds_with_store": round(played, 3),
+                "writes": writes,
+                "commits": commits,
+                "writes_per_second": round(writes / elapsed),
+                "writes_per_commit": round(writes / max(commits, 1), 1),
+                "commit_p99_ms": round(snapshot["hearts_state_commit_seconds"]["p99"] * 1000, 3),
+            })
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for key, value in results.items():
+            print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Learned bot policies: small multilayer perceptrons evaluated with NumPy, no deep learning framework needed.
+
+A policy file is an `.npz` with the weights of two networks. "play_w0", "play_b0", "play_w1", ... score the 52 cards
+from the features of a card play decision (see `play_features`), "pass_w0", ... score them from the features of a
+passing decision (see `pass_features`). The hidden layers are ReLU and the last one gives a score per card. The best
+scoring cards the player may play, or holds, are chosen, so a network never makes an illegal move. Without "pass_"
+weights the bots pass like `backend.ai`.
+
+Play features are computed from rows with the fields of `dataset.DECISION_DTYPE`, the same way for the rows of an
+exported dataset and for decisions in games being played, so a network plays with the features it was trained on.
+
+Decisions are cheapest in batches, one matrix multiply per layer for every bot waiting on a decision:
+
+    policy = Policy.load("policy.npz")
+    play_batched(games, policy)               # many bot-only games, decisions batched across them
+    PolicyBot(policy, game)                   # one game, one decision at a time
+    await asyncio.gather(*[game.play_game_async() for game in BatchedBots(policy).attach_all(games)])
+
+    python policy.py --games 200 --policy policy.npz
+plays bot-only games with a policy (random weights without --policy) and reports the decisions per second.
+"""
+import argparse
+import asyncio
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+from backend.deck import Deck, SUIT
+from backend.game import Game, bot_game
+from backend.player import Player
+
+# Scores are scaled by this in the features, the points of a round
+POINTS_SCALE = 26.0
+# Index of each passing direction in the pass features
+PASS_DIRECTIONS = ("left", "right", "across")
+
+# The fields of a decision row the play features are made from, a subset of `dataset.DECISION_DTYPE`
+STATE_DTYPE = np.dtype([
+    ("seat", "u1"),
+    ("hand", "<u8"),
+    ("legal", "<u8"),
+    ("trick_cards", "i1", 3),
+    ("led_suit", "i1"),
+    ("hearts_broken", "u1"),
+    ("total_scores", "<i2", 4),
+    ("round_points", "<i2", 4),
+])
+PASS_DTYPE = np.dtype([
+    ("seat", "u1"),
+    ("hand", "<u8"),
+    # Index in PASS_DIRECTIONS
+    ("direction", "u1"),
+    ("total_scores", "<i2", 4),
+])
+
+# hand, the 3 cards of the trick so far, the led suit, hearts broken, total scores and round points
+PLAY_FEATURES = 52 + 3 * 52 + 4 + 1 + 4 + 4
+# hand, passing direction and total scores
+PASS_FEATURES = 52 + len(PASS_DIRECTIONS) + 4
+
+_BITS = np.arange(52, dtype=np.uint64)
+# Seats from a player around the table, starting with their own
+_AROUND = np.arange(4)
+
+
+def _card_bits(masks: np.ndarray) -> np.ndarray:
+    """Card masks (see `Deck.cards_to_mask`) as a row of 52 booleans each"""
+    return (masks[:, None] >> _BITS) & np.uint64(1) != 0
+
+
+def _around(scores: np.ndarray, seats: np.ndarray) -> np.ndarray:
+    """Scores by seat, turned to start with each row's own seat"""
+    return np.take_along_axis(scores, (seats[:, None].astype(np.int64) + _AROUND) % 4, axis=1) / POINTS_SCALE
+
+
+def play_features(rows: np.ndarray) -> np.ndarray:
+    """Features of card play decisions.
+
+    Args:
+        rows (np.ndarray): Rows with the fields of STATE_DTYPE, like the rows of dataset.py
+
+    Returns:
+        np.ndarray: PLAY_FEATURES float32 values per row
+    """
+    count = len(rows)
+    features = np.zeros((count, PLAY_FEATURES), dtype=np.float32)
+    features[:, :52] = _card_bits(rows["hand"])
+    trick_cards = rows["trick_cards"].astype(np.int64)
+    for slot in range(3):
+        played = trick_cards[:, slot] >= 0
+        features[np.flatnonzero(played), 52 + 52 * slot + trick_cards[played, slot]] = 1
+    led = rows["led_suit"].astype(np.int64)
+    following = led >= 0
+    features[np.flatnonzero(following), 208 + led[following]] = 1
+    features[:, 212] = rows["hearts_broken"]
+    seats = rows["seat"]
+    features[:, 213:217] = _around(rows["total_scores"], seats)
+    features[:, 217:221] = _around(rows["round_points"], seats)
+    return features
+
+
+def pass_features(rows: np.ndarray) -> np.ndarray:
+    """Features of passing decisions, from rows with the fields of PASS_DTYPE"""
+    features = np.zeros((len(rows), PASS_FEATURES), dtype=np.float32)
+    features[:, :52] = _card_bits(rows["hand"])
+    features[np.arange(len(rows)), 52 + rows["direction"].astype(np.int64)] = 1
+    features[:, 55:59] = _around(rows["total_scores"], rows["seat"])
+    return features
+
+
+class MLP:
+    """A multilayer perceptron with ReLU hidden layers and a linear output layer"""
+
+    def __init__(self, layers: list[tuple[np.ndarray, np.ndarray]]) -> None:
+        """
+        Args:
+            layers (list[tuple[np.ndarray, np.ndarray]]): The weights (inputs by outputs) and biases of each layer
+
+        Raises:
+            ValueError: If the layers do not fit together
+        """
+        if not layers:
+            raise ValueError("A network needs at least one layer")
+        self.layers = [(np.ascontiguousarray(weights, dtype=np.float32), np.asarray(bias, dtype=np.float32))
+                       for weights, bias in layers]
+        for (weights, bias), (next_weights, _) in zip(self.layers, self.layers[1:] + [(None, None)]):
+            if weights.ndim != 2 or bias.shape != (weights.shape[1],):
+                raise ValueError(f"Layer weights {weights.shape} do not fit the biases {bias.shape}")
+            if next_weights is not None and next_weights.shape[0] != weights.shape[1]:
+                raise ValueError(f"Layer outputs {weights.shape[1]} do not fit the next inputs {next_weights.shape[0]}")
+        self.inputs = self.layers[0][0].shape[0]
+        self.outputs = self.layers[-1][0].shape[1]
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> Optional['MLP']:
+        """The network stored as `{prefix}w0`, `{prefix}b0`, ... in a mapping of arrays, None if there is none"""
+        layers = []
+        while f"{prefix}w{len(layers)}" in arrays:
+            layers.append((arrays[f"{prefix}w{len(layers)}"], arrays[f"{prefix}b{len(layers)}"]))
+        return cls(layers) if layers else None
+
+    def to_arrays(self, prefix: str) -> dict[str, np.ndarray]:
+        arrays = {}
+        for index, (weights, bias) in enumerate(self.layers):
+            arrays[f"{prefix}w{index}"] = weights
+            arrays[f"{prefix}b{index}"] = bias
+        return arrays
+
+    def __call__(self, inputs: np.ndarray) -> np.ndarray:
+        """The outputs for a batch of inputs, one row each"""
+        values = inputs
+        for weights, bias in self.layers[:-1]:
+            values = values @ weights
+            values += bias
+            np.maximum(values, 0, out=values)
+        weights, bias = self.layers[-1]
+        values = values @ weights
+        values += bias
+        return values
+
+
+class Policy:
+    """Chooses cards for bots with a network for card play and, optionally, one for passing"""
+
+    def __init__(self, play: MLP, passing: Optional[MLP] = None) -> None:
+        if (play.inputs, play.outputs) != (PLAY_FEATURES, 52):
+            raise ValueError(f"The play network must map {PLAY_FEATURES} features to 52 cards")
+        if passing is not None and (passing.inputs, passing.outputs) != (PASS_FEATURES, 52):
+            raise ValueError(f"The pass network must map {PASS_FEATURES} features to 52 cards")
+        self.play = play
+        self.passing = passing
+
+    @classmethod
+    def load(cls, path: str) -> 'Policy':
+        with np.load(path) as arrays:
+            play = MLP.from_arrays(arrays, "play_")
+            if play is None:
+                raise ValueError(f"{path} has no play network")
+            return cls(play, MLP.from_arrays(arrays, "pass_"))
+
+    def save(self, path: str) -> None:
+        arrays = self.play.to_arrays("play_")
+        if self.passing is not None:
+            arrays.update(self.passing.to_arrays("pass_"))
+        np.savez(path, **arrays)
+
+    @classmethod
+    def random(cls, seed: int = 0, hidden: tuple[int, ...] = (128,)) -> 'Policy':
+        """A policy with random weights, a starting point for training and a workload for benchmarks"""
+        rng = np.random.default_rng(seed)
+
+        def network(inputs: int) -> MLP:
+            sizes = (inputs, *hidden, 52)
+            return MLP([(rng.normal(0, (2 / fan_in) ** 0.5, (fan_in, fan_out)), np.zeros(fan_out))
+                        for fan_in, fan_out in zip(sizes, sizes[1:])])
+        return cls(network(PLAY_FEATURES), network(PASS_FEATURES))
+
+    def choose_cards(self, rows: np.ndarray) -> np.ndarray:
+        """The index of the card to play for each row of STATE_DTYPE, always one of its legal cards"""
+        scores = self.play(play_features(rows))
+        scores[~_card_bits(rows["legal"])] = -np.inf
+        return scores.argmax(axis=1)
+
+    def choose_passes(self, rows: np.ndarray) -> np.ndarray:
+        """The indices of the 3 cards to pass for each row of PASS_DTYPE, always cards of its hand"""
+        if self.passing is None:
+            raise ValueError("The policy has no pass network")
+        scores = self.passing(pass_features(rows))
+        scores[~_card_bits(rows["hand"])] = -np.inf
+        return np.argpartition(-scores, 3, axis=1)[:, :3]
+
+
+def _state(game: Game, player: Player, led_suit: Optional[SUIT], leading: bool, allowed: list[Deck.Card]) -> tuple:
+    """A card play decision of a game as a row of STATE_DTYPE"""
+    current_round = game.round
+    trick = current_round.current_trick  # type: ignore
+    seats = game.seats
+    trick_cards = [card.index() for card in trick.cards[:trick.size]] + [-1] * (3 - trick.size)
+    return (player.seat, player.hand_mask, Deck.cards_to_mask(allowed), trick_cards,
+            -1 if leading else Deck.Card.suiteValues[led_suit],  # type: ignore
+            current_round.hearts_broken,  # type: ignore
+            [seat.total_score for seat in seats], [seat.round_score for seat in seats])
+
+
+def _pass_state(game: Game, player: Player) -> tuple:
+    """A passing decision of a game as a row of PASS_DTYPE"""
+    return (player.seat, player.hand_mask, PASS_DIRECTIONS.index(game.rules.pass_direction(game.round_count)),
+            [seat.total_score for seat in game.seats])
+
+
+class PolicyBot:
+    """Plays the bots of a game with a policy, one decision at a time"""
+
+    def __init__(self, policy: Policy, game: Game) -> None:
+        """Make the policy the game's bot hooks"""
+        self.policy = policy
+        self.game = game
+        game.bot_play_card = self.play_card
+        if policy.passing is not None:
+            game.bot_pass_cards = self.pass_cards
+
+    def play_card(self, player: Player, led_suit: Optional[SUIT], leading: bool,
+                  allowed_cards_to_play: list[Deck.Card]) -> Deck.Card:
+        rows = np.array([_state(self.game, player, led_suit, leading, allowed_cards_to_play)], dtype=STATE_DTYPE)
+        return Deck.card_from_index(int(self.policy.choose_cards(rows)[0]))
+
+    def pass_cards(self, player: Player) -> list[Deck.Card]:
+        rows = np.array([_pass_state(self.game, player)], dtype=PASS_DTYPE)
+        return [Deck.card_from_index(int(index)) for index in self.policy.choose_passes(rows)[0]]
+
+
+class BatchedBots:
+    """Plays the bots of many games with a policy, evaluating the decisions of every game waiting on one at once.
+
+    The bot hooks are async: a decision is queued and the queue is evaluated once the event loop has run everything
+    else that is ready, so games played concurrently with `Game.play_game_async` share each matrix multiply.
+    """
+
+    def __init__(self, policy: Policy) -> None:
+        self.policy = policy
+        self.plays: list[tuple[tuple, asyncio.Future]] = []
+        self.passes: list[tuple[tuple, asyncio.Future]] = []
+        self.scheduled = False
+        # Decisions made, and the batches they were made in
+        self.decisions = 0
+        self.batches = 0
+
+    def attach(self, game: Game) -> Game:
+        """Make the batched policy the game's bot hooks"""
+        async def play_card(player: Player, led_suit: Optional[SUIT], leading: bool,
+                            allowed_cards_to_play: list[Deck.Card]) -> Deck.Card:
+            return Deck.card_from_index(await self._queue(
+                self.plays, _state(game, player, led_suit, leading, allowed_cards_to_play)))
+
+        async def pass_cards(player: Player) -> list[Deck.Card]:
+            return [Deck.card_from_index(index) for index in await self._queue(self.passes, _pass_state(game, player))]
+
+        game.bot_play_card = play_card
+        if self.policy.passing is not None:
+            game.bot_pass_cards = pass_cards
+        return game
+
+    def attach_all(self, games: Iterable[Game]) -> list[Game]:
+        return [self.attach(game) for game in games]
+
+    def _queue(self, queue: list, row: tuple) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue.append((row, future))
+        if not self.scheduled:
+            self.scheduled = True
+            loop.call_soon(self._evaluate)
+        return future
+
+    def _evaluate(self) -> None:
+        self.scheduled = False
+        plays, self.plays = self.plays, []
+        passes, self.passes = self.passes, []
+        if plays:
+            chosen = self.policy.choose_cards(np.array([row for row, _ in plays], dtype=STATE_DTYPE))
+            for (_, future), index in zip(plays, chosen.tolist()):
+                future.set_result(index)
+        if passes:
+            chosen = self.policy.choose_passes(np.array([row for row, _ in passes], dtype=PASS_DTYPE))
+            for (_, future), indices in zip(passes, chosen.tolist()):
+                future.set_result(indices)
+        self.decisions += len(plays) + len(passes)
+        self.batches += bool(plays) + bool(passes)
+
+
+def play_batched(games: list[Game], policy: Policy) -> BatchedBots:
+    """Play games to the end with their bots' decisions made by a policy in batches across the games.
+
+    Returns:
+        BatchedBots: What played the bots, with how many decisions and batches it took
+    """
+    bots = BatchedBots(policy)
+
+    async def play() -> None:
+        await asyncio.gather(*[game.play_game_async() for game in bots.attach_all(games)])
+    asyncio.run(play())
+    return bots
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=200, help="games played at once")
+    parser.add_argument("--first-seed", type=int, default=0, help="the games deal from consecutive seeds")
+    parser.add_argument("--policy", help="policy .npz, random weights without one")
+    args = parser.parse_args()
+
+    policy = Policy.load(args.policy) if args.policy else Policy.random()
+    games = [bot_game(seed) for seed in range(args.first_seed, args.first_seed + args.games)]
+    start = time.perf_counter()
+    bots = play_batched(games, policy)
+    elapsed = time.perf_counter() - start
+    print(f"{bots.decisions} decisions in {bots.batches} batches in {elapsed:.2f}s "
+          f"({bots.decisions / elapsed:.0f} decisions per second)")
+
+
+if __name__ == '__main__':
+    main()
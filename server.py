@@ -1,14 +1,57 @@
 import socket
-import select
+import selectors
+import time
 from typing import Optional
 from api import API
 from backend.player import Player
 from backend.deck import Deck, SUIT
 from backend.round import Round
+from matchmaking import Matchmaker, QueueEntry
+from timer_wheel import TimerHandle, TimerWheel
+from sessions import SessionRegistry, encode_snapshot, snapshot_line
+from outbound import Connection, OutboundCounters, OutboundPump
+from metrics import Registry
+from bot_pool import BotPool
+from bot_cache import DECISIONS
+from functools import partial
+from backend.game_log import append_framed
+from persistence import RecoveredTable, TableLog, TableStore
+import io
 import threading
 
 SERVER_PORT = 2345
 SERVER_IP = "0.0.0.0"
+# Humans seated at each table, bots fill the remaining seats
+TABLE_SIZE = 1
+# Seconds a player waits for a full table before being seated with bots
+QUEUE_TIME_TARGET = 10.0
+# Seconds between batched seating passes of the lobby
+SEATING_INTERVAL = 0.25
+# Seconds a player has to play a card or to choose all 3 cards to pass before a bot decides for them
+TURN_TIMEOUT = 30.0
+PASS_TIMEOUT = 60.0
+# Deadline for players who missed their last deadline, so an idle player only briefly holds up the table
+AWAY_TIMEOUT = 3.0
+# Seconds the seat of a disconnected player is held for them to resume, a bot plays for them meanwhile
+RESUME_GRACE = 120.0
+# Bytes that may wait to be written to a client before the slow consumer policy applies, see outbound.py
+OUTBOUND_LIMIT = 64 * 1024
+SLOW_CONSUMER_POLICY = "coalesce"
+# Local port that serves the metrics in the Prometheus text format, None turns metrics off
+METRICS_PORT: Optional[int] = 9345
+# Worker processes that make bot decisions, 0 makes them on the game threads.
+# A round trip to a worker costs far more than what the bots in backend.ai do today, turn this on once they think harder
+BOT_WORKERS = 0
+# Seconds to wait for a bot decision from the workers before a cheap policy decides instead
+BOT_DECISION_TIMEOUT = 0.5
+# File every finished game's binary log is appended to, see backend/game_log.py. None turns game logging off
+GAME_LOG_PATH: Optional[str] = None
+# Games finish on their own threads, only one of them may append to the log file at a time
+game_log_lock = threading.Lock()
+# SQLite database the tables being played are kept in, so their games resume when the server restarts. None turns it off
+STATE_DB_PATH: Optional[str] = "hearts_tables.db"
+# Seconds a table recovered after a restart waits for its players to resume before bots play for the missing ones
+RECOVERY_WAIT = 60.0
 
 
 class Print:
@@ -68,152 +111,436 @@ def socket_to_name(clients_names, current_socket):
     return sender_name
 
 
-class ThreadError(Exception):
-    def __init__(self, message, error, thread):
-        super().__init__(message)
-        self.error = error
-        self.thread = thread
-
-
 def main():
     print("Setting up server...")
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.bind((SERVER_IP, SERVER_PORT))
     server_socket.listen()
     print("Listening for clients...")
-    staging_room_players = {}
-    client_threading_map = {}
-    all_players = {}
-    games = []
-    NUM_PLAYERS = 1
-
-    def close_on_error(thread: Optional[threading.Thread] = None):
-        game = all_players[current_socket]
-        if game:
-            for player in game.players:
-                if game.players[player] != current_socket:
-                    game.players[player].send(Game.printer(
-                        "A player has left the game, destroying game", color=Game.printer.FAIL))
-                    game.players[player].close()
-                    del all_players[player]
-
-            games.remove(thread)  # type: ignore
-
-        current_socket.close()
-        del all_players[current_socket]
-        client_sockets.remove(current_socket)
-
-    while True:
+    selector = selectors.DefaultSelector()
+    selector.register(server_socket, selectors.EVENT_READ)
+    matchmaker = Matchmaker(table_size=TABLE_SIZE,
+                            queue_time_target=QUEUE_TIME_TARGET)
+    # Sockets in the lobby, mapped to the name they joined with (None until they send one)
+    lobby: dict[Connection, Optional[str]] = {}
+    games: list[threading.Thread] = []
+    timers = TimerWheel()
+    timers.start()
+    sessions = SessionRegistry()
+    outbound_counters = OutboundCounters()
+    pump = OutboundPump()
+    pump.start()
+
+    metrics = Registry(enabled=METRICS_PORT is not None)
+    DECISIONS.register(metrics)
+    metrics.gauge("hearts_active_tables", "Games being played",
+                  function=lambda: len(games))
+    metrics.gauge("hearts_lobby_queue_depth", "Players waiting to be seated",
+                  function=lambda: matchmaker.queue_depth)
+    for stat in outbound_counters.snapshot():
+        metrics.gauge(f"hearts_outbound_{stat}", f"Outbound {stat.replace('_', ' ')}, see outbound.py",
+                      function=lambda stat=stat: outbound_counters.snapshot()[stat])
+    lobby_wait = metrics.histogram(
+        "hearts_lobby_wait_seconds", "Time from joining the lobby to being seated")
+    games_started = metrics.counter(
+        "hearts_games_started_total", "Games started")
+    if METRICS_PORT is not None:
+        metrics.serve(METRICS_PORT)
+        print(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    store = None
+    recovered = []
+    if STATE_DB_PATH is not None:
+        store = TableStore(STATE_DB_PATH, metrics=metrics)
+        recovered = store.unfinished()
+        store.start()
+    bot_pool = None
+    if BOT_WORKERS:
+        bot_pool = BotPool(BOT_WORKERS, timeout=BOT_DECISION_TIMEOUT,
+                           metrics=metrics)
+        bot_pool.start()
+
+    def leave_lobby(client_socket: Connection):
+        name = lobby.pop(client_socket, None)
+        if name is not None:
+            matchmaker.leave(name)
+        selector.unregister(client_socket)
+        client_socket.close()
+
+    def run_game(players: dict[str, Connection], recovered: Optional[RecoveredTable] = None):
+        game = Game(players, timers, sessions, metrics, bot_pool, store, recovered)
+        games_started.inc()
         try:
-            client_sockets, _, _ = select.select(
-                [server_socket] + list(all_players.keys()), [], [])
-            for current_socket in client_sockets:
+            game.start()
+        except TableAbandonedError:
+            print("Every player left, closing table")
+        except Exception as e:
+            print("Error in game thread:", repr(e))
+            game.broadcast(Game.printer(
+                "Something went wrong, destroying game", color=Game.printer.FAIL))
+        finally:
+            game.close()
+            games.remove(threading.current_thread())
+
+    def start_table(table: list[QueueEntry]):
+        players = {}
+        now = time.monotonic()
+        for entry in table:
+            lobby_wait.observe(now - entry.enqueued_at)
+            # The game thread owns the socket from now on
+            del lobby[entry.connection]
+            selector.unregister(entry.connection)
+            players[entry.name] = entry.connection
+        game_thread = threading.Thread(
+            target=run_game, args=(players,), daemon=True)
+        games.append(game_thread)
+        game_thread.start()
+
+    for table in recovered:
+        print(f"Resuming table {table.table_id}")
+        game_thread = threading.Thread(
+            target=run_game, args=({name: EmptySeat() for name, _ in table.seats}, table), daemon=True)
+        games.append(game_thread)
+        game_thread.start()
+
+    next_seating = time.monotonic()
+    try:
+        while True:
+            timeout = max(0.0, next_seating - time.monotonic())
+            for key, _ in selector.select(timeout):
+                current_socket: Connection = key.fileobj  # type: ignore
                 if current_socket == server_socket:
-                    client_socket, _ = server_socket.accept()
+                    new_socket, _ = server_socket.accept()
+                    # Prompts are made of several small writes, don't let Nagle's algorithm hold them back
+                    new_socket.setsockopt(
+                        socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                     print("New client connected")
-                    all_players[client_socket] = None
-                else:
+                    client_socket = Connection(
+                        new_socket, pump, OUTBOUND_LIMIT, SLOW_CONSUMER_POLICY, outbound_counters)  # type: ignore
+                    lobby[client_socket] = None
+                    selector.register(client_socket, selectors.EVENT_READ)
+                    continue
+                try:
+                    data = current_socket.recv(1024).decode()
+                except OSError:
+                    data = ''
+                if not data or data == 'EXIT':
+                    print("Client disconnected")
+                    leave_lobby(current_socket)
+                elif data.startswith("NAME: ") and lobby[current_socket] is None:
+                    name = data.split(":")[1].strip().capitalize()
                     try:
-                        data = current_socket.recv(1024).decode()
-                    except ConnectionError:
-                        print("Client disconnected")
-                        # Get the thread that the client is in
-                        thread = client_threading_map.get(current_socket)
-                        close_on_error(thread)
+                        matchmaker.join(name, current_socket)
+                    except ValueError:
+                        current_socket.send(Game.printer(
+                            "Name already taken", color=Game.printer.WARNING))
                         continue
-                    if data.startswith("NAME: "):
-                        name = data.split(":")[1].strip().capitalize()
-                        if name in staging_room_players:
-                            current_socket.send(Game.printer(
-                                "Name already taken", color=Game.printer.Warning))
-                            continue
-                        staging_room_players[name] = current_socket
-                        for player in staging_room_players.values():
-                            if player != current_socket:
-                                player.send(Game.printer(
-                                    f"{name} has joined", color=Game.printer.BLUE))
-                            else:
-                                player.send(Game.printer(
-                                    f"Welcome, {name}", color=Game.printer.BLUE))
-                    elif data == 'EXIT':
-                        current_socket.close()
-                        del all_players[current_socket]
+                    lobby[current_socket] = name
+                    current_socket.send(Game.printer(
+                        f"Welcome, {name}", color=Game.printer.BLUE))
+                elif data.startswith("RESUME: ") and lobby[current_socket] is None:
+                    session = sessions.lookup(data.split(":")[1].strip())
+                    if session is None:
+                        current_socket.send(Game.printer(
+                            "Unknown or expired session", color=Game.printer.WARNING))
                         continue
-                    if not data:
-                        print("Client disconnected")
-                        # Get the thread that the client is in
-                        thread = client_threading_map.get(current_socket)
-                        close_on_error(thread)
-                    else:
-                        print("Received data from client\n", data)
-
-            def thread_target_wrapper(players, shared_data):
-                try:
-                    create_game(players)
-                except Exception as e:
-                    shared_data['exception'] = ThreadError(
-                        "Error in game thread", e, threading.current_thread()
-                    )
-
-            def create_game(players):
-                game = Game(players)  # dict forces copy
-                for player in players:
-                    players[player].send(Game.printer.clear())
-                    players[player].send(Game.printer(
-                        "Game starting!\n", color=Game.printer.GREEN))
-                    all_players[players[player]] = game
-
-                game.api.start_game()
-            if NUM_PLAYERS == len(staging_room_players):
-                shared_data = {}
-                game_thread = threading.Thread(target=thread_target_wrapper, args=(
-                    dict(staging_room_players), shared_data))  # dict forces copy
-                games.append(game_thread)
-                for player in staging_room_players:
-                    client_threading_map[staging_room_players[player]
-                                         ] = game_thread
-
-                staging_room_players.clear()
-                game_thread.start()
-
-                if 'exception' in shared_data:
-                    raise shared_data['exception']
-        except ThreadError as e:
-            e.thread.join()
-            if not issubclass(type(e.error), (ConnectionError)):
-                raise e.error
-            close_on_error(e.thread)
+                    name, game = session
+                    # The game thread owns the socket from now on
+                    del lobby[current_socket]
+                    selector.unregister(current_socket)
+                    game.resume(name, current_socket)
+                else:
+                    print("Received data from client\n", data)
+
+            # Seat everyone who is ready in one batch instead of after every join
+            now = time.monotonic()
+            if now >= next_seating:
+                for table in matchmaker.seat_ready(now):
+                    start_table(table)
+                next_seating = now + SEATING_INTERVAL
+    finally:
+        # The worker processes would otherwise outlive the server, e.g. after a KeyboardInterrupt
+        if bot_pool is not None:
+            bot_pool.shutdown()
+
+
+class TableAbandonedError(Exception):
+    pass
+
+
+class EmptySeat:
+    """Stands in for the connection of a player who has not come back to a table recovered after a restart"""
+    bytes_sent = 0
+
+    def send(self, data: bytes, key: Optional[str] = None):
+        raise OSError("Nobody is connected")
+
+    def close(self):
+        pass
 
 
 class Game:
     printer = Print()
 
-    def __init__(self, players: dict[str, socket.socket]):
+    def __init__(self, players: dict[str, Connection], timers: Optional[TimerWheel] = None, sessions: Optional[SessionRegistry] = None, metrics: Optional[Registry] = None, bot_pool: Optional[BotPool] = None, store: Optional[TableStore] = None, recovered: Optional[RecoveredTable] = None):
         self.api = API()
 
         self.players = players
         for player in self.players:
             self.api.add_player(player)
 
-        self.api.set_play_card_hook(self.play_card_hook)
-        self.api.set_get_pass_cards_hook(self.get_pass_cards_hook)
+        # Hooks are wrapped to time them, a disabled registry hands them back as they are
+        self.metrics = metrics if metrics is not None else Registry(enabled=False)
+
+        def hook_timer(hook: str):
+            return self.metrics.histogram("hearts_hook_seconds", "Time spent in API hooks, including waiting for players", {"hook": hook})
+
+        def bot_timer(decision: str):
+            # Nanosecond resolution, the built in bots decide in well under a microsecond
+            return self.metrics.histogram("hearts_bot_decision_seconds", "Time bots take to decide", {"decision": decision}, scale=1e9)
+        # Bots decide in the pool's worker processes when there is one, see bot_pool.py.
+        # Otherwise they decide on this thread, through the process wide cache of bot_cache.py
+        self.bot_pool = bot_pool
+        self.bot_play_card = self.metrics.timed(
+            bot_timer("play_card"), partial(bot_pool.play_card, self) if bot_pool else self.cached_play_card)
+        self.bot_pass_cards = self.metrics.timed(
+            bot_timer("pass_cards"), partial(bot_pool.pass_cards, self) if bot_pool else self.cached_pass_cards)
+        self.table_bytes = self.metrics.histogram(
+            "hearts_table_bytes_sent", "Bytes sent to the players of a table over a game", scale=1)
+        self.bot_takeovers = self.metrics.counter(
+            "hearts_bot_takeovers_total", "Turns a bot played for a player who ran out of time")
+        # Bytes each connection of the table had sent before it was seated, see `Connection.bytes_sent`
+        self.sent_before: dict[Connection, int] = {}
+        for player_socket in players.values():
+            self.sent_before[player_socket] = player_socket.bytes_sent
+        # The game is logged in memory and appended to GAME_LOG_PATH when the table closes.
+        # With a store the log is also written to it after every trick, it is opened once the resume tokens are known
+        self.store = store
+        self.recovered = recovered
+        self.game_log: Optional[io.BytesIO | TableLog] = None
+        if store is None and GAME_LOG_PATH is not None:
+            self.game_log = io.BytesIO()
+            self.api.set_game_log(self.game_log)
+
+        self.api.set_play_card_hook(self.metrics.timed(
+            hook_timer("play_card"), self.play_card_hook))
+        self.api.set_get_pass_cards_hook(self.metrics.timed(
+            hook_timer("pass_cards"), self.get_pass_cards_hook))
+        self.api.set_bot_play_card_hook(self.bot_play_card)
+        self.api.set_bot_pass_cards_hook(self.bot_pass_cards)
         self.api.set_hearts_broken_hook(self.hearts_broken_hook)
         self.api.set_round_end_hook(self.round_end_hook)
-        self.api.set_trick_end_hook(self.trick_end_hook)
+        self.api.set_trick_end_hook(self.metrics.timed(
+            hook_timer("trick_end_hook"), self.trick_end_hook))
         self.api.set_card_played_hook(self.card_played_hook)
+        self.api.set_end_game_hook(self.end_game_hook)
+
+        # Turn deadlines are driven by the shared timer wheel, which wakes this game through a socket pair
+        self.timers = timers
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+        # Players who missed a deadline. A bot plays for them on a short deadline until they answer again
+        self.away: set[str] = set()
+
+        self.sessions = sessions
+        # Resume token of each player
+        self.tokens: dict[str, str] = {}
+        # Players whose connection dropped, mapped to the timer of their grace period. A bot plays for them meanwhile
+        self.disconnected: dict[str, Optional[TimerHandle]] = {}
+        # Disconnected players who did not come back within the grace period
+        self.abandoned: set[str] = set()
+        # Filled from other threads and handled by the game thread in `process_events`
+        self.lock = threading.Lock()
+        self.pending_resumes: list[tuple[str, Connection]] = []
+        self.expired_grace: set[str] = set()
+
+    def start(self):
+        """Hand out resume tokens and play the game. Blocks until the game is over."""
+        if self.recovered is not None:
+            self.restore()
+        else:
+            for name in self.players:
+                if self.sessions is not None:
+                    self.tokens[name] = self.sessions.register(name, self)
+                    self.send(name, f"SESSION: {self.tokens[name]}\n".encode())
+                self.send(name, Game.printer.clear())
+                self.send(name, Game.printer(
+                    "Game starting!\n", color=Game.printer.GREEN))
+            if self.store is not None:
+                self.game_log = self.store.open_table(
+                    [(name, self.tokens.get(name, "")) for name in self.players])
+                self.api.set_game_log(self.game_log, batch="trick")  # type: ignore
+
+        self.api.start_game()
+
+    def restore(self):
+        """Bring back a table from before a restart. Players keep their resume tokens and are given time to come back."""
+        table: RecoveredTable = self.recovered  # type: ignore
+        if self.sessions is not None:
+            for name, token in table.seats:
+                self.tokens[name] = self.sessions.register(name, self, token or None)
+        self.game_log = self.store.resume_table(table)  # type: ignore
+        self.api.set_game_log(self.game_log, batch="trick")  # type: ignore
+        self.api.restore_game(table.log)
+        for name in self.players:
+            self.drop(name)
+        deadline = time.monotonic() + RECOVERY_WAIT
+        while self.disconnected and time.monotonic() < deadline:
+            if self.selector.select(deadline - time.monotonic()):
+                self.wakeup_receiver.recv(1024)
+                self.process_events()
+
+    def close(self):
+        if isinstance(self.game_log, TableLog):
+            self.store.finish(self.game_log.table_id)  # type: ignore
+        if self.bot_pool is not None:
+            self.bot_pool.cancel_table(self)
+        if GAME_LOG_PATH is not None and self.game_log is not None and self.game_log.tell():
+            with game_log_lock, open(GAME_LOG_PATH, 'ab') as log_file:  # type: ignore
+                append_framed(log_file, self.game_log.getvalue())
+        if self.sessions is not None:
+            for token in self.tokens.values():
+                self.sessions.remove(token)
+        for handle in self.disconnected.values():
+            if handle:
+                handle.cancel()
+        for player_socket in self.players.values():
+            player_socket.close()
+        # Once the connections are closed, what was still queued for them is never sent
+        self.table_bytes.observe(sum(player_socket.bytes_sent - before
+                                     for player_socket, before in self.sent_before.items()))
+        with self.lock:
+            for _, player_socket in self.pending_resumes:
+                player_socket.close()
+            self.pending_resumes.clear()
+        self.selector.close()
+        self.wakeup_receiver.close()
+        self.wakeup_sender.close()
+
+    def send(self, name: str, data: bytes, key: Optional[str] = None):
+        """Send data to a player without blocking. A player whose connection fails, or who can not keep up, is handed to a bot until they resume.
+
+        Args:
+            name (str): The player
+            data (bytes): The message
+            key (Optional[str]): Set for spectator updates that a slow client may miss, see `Connection.send`
+        """
+        if name in self.disconnected:
+            return
+        try:
+            self.players[name].send(data, key)
+        except OSError:
+            self.drop(name)
+
+    def broadcast(self, data: bytes, skip: Optional[str] = None, key: Optional[str] = None):
+        for name in self.players:
+            if name != skip:
+                self.send(name, data, key)
+
+    def drop(self, name: str):
+        """Hold the seat of a player whose connection was lost for the grace period"""
+        if name in self.disconnected:
+            return
+        self.players[name].close()
+        self.away.discard(name)
+        self.disconnected[name] = self.timers.schedule(
+            RESUME_GRACE, lambda: self.grace_expired(name)) if self.timers else None
+        self.broadcast(Game.printer(
+            f"{name} lost connection, a bot is playing for them", color=Game.printer.WARNING), key="presence")
+
+    def grace_expired(self, name: str):
+        # Called on the timer wheel thread
+        with self.lock:
+            self.expired_grace.add(name)
+        self.wake()
+
+    def resume(self, name: str, player_socket: Connection):
+        """Put a reconnected player back in their seat. Safe to call from any thread."""
+        with self.lock:
+            self.pending_resumes.append((name, player_socket))
+        self.wake()
+
+    def process_events(self):
+        """Handle reconnects and expired grace periods. Only called on the game thread."""
+        with self.lock:
+            resumes, self.pending_resumes = self.pending_resumes, []
+            expired, self.expired_grace = self.expired_grace, set()
+
+        for name, player_socket in resumes:
+            if name in self.abandoned:
+                try:
+                    player_socket.send(Game.printer(
+                        "Your session has expired", color=Game.printer.FAIL))
+                except OSError:
+                    pass
+                player_socket.close()
+                continue
+            handle = self.disconnected.pop(name, None)
+            if handle:
+                handle.cancel()
+            if self.players[name] is not player_socket:
+                # A newer connection replaces an old one that is still open
+                self.players[name].close()
+            self.players[name] = player_socket
+            self.sent_before.setdefault(player_socket, player_socket.bytes_sent)
+            self.send_snapshot(name)
+            self.broadcast(Game.printer(
+                f"{name} is back", color=Game.printer.GREEN), skip=name, key="presence")
+
+        for name in expired:
+            if name in self.disconnected:
+                self.abandoned.add(name)
+                if self.sessions is not None:
+                    self.sessions.remove(self.tokens[name])
+        if self.abandoned and self.abandoned.issuperset(self.players):
+            raise TableAbandonedError("Every player has left the table")
+
+    def send_snapshot(self, name: str):
+        """Send a reconnected player their view of the game, compactly encoded followed by a readable version"""
+        game = self.api.game
+        seats = game.seats  # type: ignore
+        seat_names = [player.name for player in seats]
+        seat = seat_names.index(name)
+        state = self.api.get_current_state()['players']
+        player_state = self.api.get_player_state(seats[seat])
+        trick = self.api.get_current_trick()
+        snapshot = encode_snapshot(
+            game.round_count,  # type: ignore
+            seat,
+            seat_names,
+            [(state[seat_name]['total_score'], state[seat_name]['round_score'])
+             for seat_name in seat_names],
+            player_state,
+            [(seat_names.index(player_name), card) for player_name, card in trick])
+        self.send(name, snapshot_line(snapshot))
+
+        self.send(name, Game.printer.clear())
+        self.send(name, Game.printer(
+            f"Welcome back, {name}\n", bold=True, color=Game.printer.GREEN))
+        self.send(name, Game.printer("Scores:", color=Game.printer.CYAN))
+        for seat_name in seat_names:
+            self.send(name, Game.printer(
+                f"{seat_name}: {state[seat_name]['total_score']}", color=Game.printer.CYAN))
+        if trick:
+            self.send(name, Game.printer("\nCurrent trick:",
+                      color=Game.printer.HEADER))
+            for player_name, card in trick:
+                self.send(name, Game.printer(
+                    f"{player_name}: {card}", color=Game.printer.CYAN))
+        self.send(name, Game.printer("\nYour hand:", color=Game.printer.HEADER))
+        self.send(name, Game.printer.display_hand(player_state['hand']))
 
     def round_end_hook(self):
-        for user in self.players:
-            self.players[user].send(Game.printer.clear())
-            self.players[user].send(Game.printer(
-                "Round has ended!\n", bold=True, color=Game.printer.GREEN))
-            self.players[user].send(Game.printer(
-                "\n\nScores:\n", bold=True, color=Game.printer.CYAN))
-            state = self.api.get_current_state()
-            player_state = state['players']
-            for player in player_state:
-                self.players[user].send(
-                    Game.printer(f"{player}: {player_state[player]['total_score']}", color=Game.printer.CYAN))
+        player_state = self.api.get_current_state()['players']
+        scores = b''.join(Game.printer(f"{player}: {player_state[player]['total_score']}", color=Game.printer.CYAN)
+                          for player in player_state)
+        self.broadcast(Game.printer.clear())
+        self.broadcast(Game.printer(
+            "Round has ended!\n", bold=True, color=Game.printer.GREEN))
+        self.broadcast(Game.printer(
+            "\n\nScores:\n", bold=True, color=Game.printer.CYAN))
+        self.broadcast(scores)
 
     def play_card_hook(self, player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
         """Method to get the card to play from the player. This method will be called for each player in the trick.
@@ -226,76 +553,182 @@ class Game:
             Returns:
                 Deck.Card: The validated card the player wants to play
             """
-        player_socket = self.players[player.name]
+        self.process_events()
         # Get the cards that the player is allowed to play
         allowed_cards = self.api.get_allowed_cards(
             player, led_suit, is_leading)
-        player_socket.send(Game.printer(
+        if player.name in self.disconnected:
+            return self.bot_play_card(player, led_suit, is_leading, allowed_cards)
+        self.send(player.name, Game.printer(
             "Your turn to play", color=Game.printer.GREEN))
-        player_socket.send(Game.printer(
-            "Cards you can play:", color=Game.printer.HEADER))
-        player_socket.send(Game.printer.display_hand(allowed_cards))
-
-        return allowed_cards[self.get_valid_user_input(
-            player_socket, "Enter the card to play by number in list: ", len(allowed_cards))]
-
-    def get_valid_user_input(self, player_socket: socket.socket, message: str, upper_bound: int) -> int:
-        player_socket.send(Game.printer(message, color=Game.printer.CYAN))
-        player_socket.send("INPUT".encode())
-        card = player_socket.recv(1024).decode().strip()
-        if card.isdigit() and int(card) < upper_bound:
-            return int(card)
-        else:
-            while True:
-                player_socket.send(
-                    Game.printer("Invalid input, enter a number in range: ", color=Game.printer.FAIL))
-                player_socket.send("INPUT".encode())
-                card = player_socket.recv(1024).decode().strip()
-                if card.isdigit() and int(card) < upper_bound:
-                    return int(card)
+
+        deadline = self.start_deadline(
+            AWAY_TIMEOUT if player.name in self.away else TURN_TIMEOUT)
+        try:
+            choice = self.get_valid_user_input(
+                player.name, "Enter the card to play by number in list: ", "Cards you can play:", allowed_cards, deadline)
+        finally:
+            if deadline:
+                deadline.cancel()
+
+        if choice is None:
+            card = self.bot_play_card(
+                player, led_suit, is_leading, allowed_cards)
+            self.bot_took_over(player, f"{card} was played for you")
+            return card
+        self.away.discard(player.name)
+        return allowed_cards[choice]
+
+    def cached_play_card(self, player: Player, led_suit: Optional[SUIT], is_leading: bool, allowed_cards: list[Deck.Card]) -> Deck.Card:
+        return DECISIONS.play_card(self.api.game, player, led_suit, is_leading, allowed_cards)  # type: ignore
+
+    def cached_pass_cards(self, player: Player) -> list[Deck.Card]:
+        return DECISIONS.pass_cards(self.api.game, player)  # type: ignore
+
+    def start_deadline(self, timeout: float) -> Optional[TimerHandle]:
+        if self.timers is None:
+            return None
+        return self.timers.schedule(timeout, self.wake)
+
+    def wake(self):
+        try:
+            self.wakeup_sender.send(b'\0')
+        except OSError:  # The game has already been closed
+            pass
+
+    def bot_took_over(self, player: Player, message: str):
+        if player.name in self.disconnected:
+            return
+        self.bot_takeovers.inc()
+        self.away.add(player.name)
+        self.send(player.name, Game.printer(
+            f"Time is up, {message}. Answer the next prompt to take back control", color=Game.printer.WARNING))
+
+    def wait_for_input(self, name: str, deadline: Optional[TimerHandle], timeout: Optional[float] = None) -> Optional[str]:
+        """Wait until the player sends something, the deadline expires or the timeout passes.
+        Reconnects and expired grace periods are handled while waiting.
+
+        Returns:
+            Optional[str]: The data sent by the player or None if nothing was sent in time or the player disconnected
+        """
+        while True:
+            if name in self.disconnected:
+                return None
+            player_socket = self.players[name]
+            self.selector.register(player_socket, selectors.EVENT_READ)
+            try:
+                events = self.selector.select(timeout)
+            finally:
+                self.selector.unregister(player_socket)
+            if not events:
+                return None
+            for key, _ in events:
+                if key.fileobj is player_socket:
+                    try:
+                        data = player_socket.recv(1024).decode()
+                    except ConnectionError:
+                        data = ''
+                    if not data:
+                        self.drop(name)
+                        return None
+                    return data.strip()
+            self.wakeup_receiver.recv(1024)
+            self.process_events()
+            if deadline is not None and deadline.fired:
+                return None
+
+    def get_valid_user_input(self, name: str, message: str, header: str, options: list[Deck.Card], deadline: Optional[TimerHandle] = None) -> Optional[int]:
+        """Show the player a numbered list of cards and prompt them for a number until they send a valid one or the deadline expires.
+
+        Returns:
+            Optional[int]: The index of the chosen card or None if the deadline expired or the player disconnected
+        """
+        # Drop answers that arrived after a previous deadline so they are not taken as the answer to this prompt
+        while self.wait_for_input(name, None, timeout=0) is not None:
+            pass
+        prompted_socket = None
+        while name not in self.disconnected:
+            if self.players[name] is not prompted_socket:
+                # Prompt again if the player reconnected while we were waiting
+                prompted_socket = self.players[name]
+                self.send(name, Game.printer(header, color=Game.printer.HEADER))
+                self.send(name, Game.printer.display_hand(options))
+                self.send(name, Game.printer(
+                    message, color=Game.printer.CYAN))
+                self.send(name, "INPUT".encode())
+            card = self.wait_for_input(name, deadline)
+            if card is None:
+                if self.players[name] is not prompted_socket:
+                    continue
+                return None
+            if card.isdigit() and int(card) < len(options):
+                return int(card)
+            self.send(name,
+                      Game.printer("Invalid input, enter a number in range: ", color=Game.printer.FAIL))
+            self.send(name, "INPUT".encode())
+        return None
 
     def get_pass_cards_hook(self, player: Player) -> list[Deck.Card]:
         """Method to get the cards to pass from the player. This method will be called for each player at the beginning of the round."""
-        player_socket = self.players[player.name]
-        player_socket.send(Game.printer(
-            f'Passing {self.api.get_passing_direction()}\n', color=self.printer.CYAN, bold=True, underline=True))
+        self.process_events()
         player_state = self.api.get_player_state(player)
-        player_hand = player_state['hand']
+        # A copy, the chosen cards are taken out of it
+        player_hand = list(player_state['hand'])
 
         chosen_cards = []
-        for i in range(3):
-
-            player_socket.send(
-                Game.printer("Your hand:", color=Game.printer.HEADER))
-            player_socket.send(
-                Game.printer.display_hand(player_hand))
-
-            card_index = self.get_valid_user_input(
-                player_socket, "Enter the card to pass by number in list: ", len(
-                    player_hand)
-            )
-            chosen_cards.append(player_hand[card_index])
-            player_hand.pop(card_index)
-        player_socket.send(Game.printer.clear())
+        if player.name not in self.disconnected:
+            self.send(player.name, Game.printer(
+                f'Passing {self.api.get_passing_direction()}\n', color=self.printer.CYAN, bold=True, underline=True))
+            deadline = self.start_deadline(
+                AWAY_TIMEOUT if player.name in self.away else PASS_TIMEOUT)
+            try:
+                for i in range(3):
+                    card_index = self.get_valid_user_input(
+                        player.name, "Enter the card to pass by number in list: ", "Your hand:", player_hand, deadline)
+                    if card_index is None:
+                        break
+                    chosen_cards.append(player_hand[card_index])
+                    player_hand.pop(card_index)
+            finally:
+                if deadline:
+                    deadline.cancel()
+
+        if len(chosen_cards) < 3:
+            # Let the bot choose the rest of the cards from what is left of the hand
+            stand_in = Player(player.name, am_bot=True)
+            stand_in.set_hand(player_hand)
+            bot_cards = self.bot_pass_cards(stand_in)[
+                :3 - len(chosen_cards)]
+            chosen_cards.extend(bot_cards)
+            self.bot_took_over(
+                player, f"{', '.join(str(card) for card in bot_cards)} will be passed for you")
+        else:
+            self.away.discard(player.name)
+        self.send(player.name, Game.printer.clear())
         return chosen_cards
 
     def trick_end_hook(self, trick: 'Round.Trick') -> None:
         trick_outcome = str(trick)
         for player in self.players:
-            self.players[player].send(Game.printer.clear())
-            self.players[player].send(
-                Game.printer(f"\n{'-'*10}\n\n{trick_outcome}\n\n{'-'*10}\n", color=Game.printer.CYAN))
+            self.send(player, Game.printer.clear(), key="trick")
+            self.send(player,
+                      Game.printer(f"\n{'-'*10}\n\n{trick_outcome}\n\n{'-'*10}\n", color=Game.printer.CYAN), key="trick")
 
     def card_played_hook(self, player: Player, card: Deck.Card) -> None:
-        for p in self.players:
-            if p != player.name:
-                self.players[p].send(Game.printer(
-                    f"{player.name}: {card}", color=Game.printer.CYAN))
+        self.broadcast(Game.printer(
+            f"{player.name}: {card}", color=Game.printer.CYAN), skip=player.name, key="trick")
+
+    def end_game_hook(self):
+        player_state = self.api.get_current_state()['players']
+        self.broadcast(Game.printer(
+            "Game over!\n", bold=True, color=Game.printer.GREEN))
+        for player in player_state:
+            self.broadcast(Game.printer(
+                f"{player}: {player_state[player]['total_score']}", color=Game.printer.CYAN))
 
     def hearts_broken_hook(self):
-        for player in self.players:
-            self.players[player].send(Game.printer(
-                "\nHearts has been broken!\n", bold=True, color=Game.printer.GREEN))
+        self.broadcast(Game.printer(
+            "\nHearts has been broken!\n", bold=True, color=Game.printer.GREEN), key="hearts")
 
 
 if __name__ == '__main__':
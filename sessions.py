@@ -0,0 +1,137 @@
+import base64
+import secrets
+import struct
+import threading
+from typing import Any, Optional
+
+from backend.deck import Deck
+
+SNAPSHOT_VERSION = 1
+
+# version, round count, seat of the receiving player, number of seats
+_HEADER = struct.Struct("<BHBB")
+# total score, round score
+_SEAT_SCORES = struct.Struct("<hh")
+# hand, cards taken and passed cards as 52 bit card masks, number of cards in the current trick
+_CARDS = struct.Struct("<QQQB")
+# seat, card index
+_PLAY = struct.Struct("<BB")
+
+
+class SessionRegistry:
+    """
+    Maps the resume tokens handed out to players when a game starts to the game they are seated at,
+    so a player who loses their connection can be put back in their seat.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.sessions: dict[str, tuple[str, Any]] = {}
+
+    def register(self, name: str, game: Any, token: Optional[str] = None) -> str:
+        """Create a session for a seated player.
+
+        Args:
+            name (str): The player's name
+            game (Any): The game the player is seated at
+            token (Optional[str]): The token the player already has, when their table was recovered after a restart
+
+        Returns:
+            str: The resume token
+        """
+        token = token or secrets.token_hex(8)
+        with self.lock:
+            self.sessions[token] = (name, game)
+        return token
+
+    def lookup(self, token: str) -> Optional[tuple[str, Any]]:
+        """Get the player name and game of a session, or None if the token is unknown or expired"""
+        with self.lock:
+            return self.sessions.get(token)
+
+    def remove(self, token: str) -> None:
+        with self.lock:
+            self.sessions.pop(token, None)
+
+
+def encode_snapshot(round_count: int,
+                    seat: int,
+                    seat_names: list[str],
+                    scores: list[tuple[int, int]],
+                    player_state: dict,
+                    trick: list[tuple[int, 'Deck.Card']]
+                    ) -> bytes:
+    """Pack what a player can see of the game into a few dozen bytes. The size does not depend on how long the game has been going.
+
+    Args:
+        round_count (int): The number of rounds played
+        seat (int): The seat of the player the snapshot is for
+        seat_names (list[str]): The name of the player in each seat
+        scores (list[tuple[int, int]]): The total and round score of each seat
+        player_state (dict): The player's state as returned by `API.get_player_state`
+        trick (list[tuple[int, Deck.Card]]): The seat and card of each play in the current trick
+
+    Returns:
+        bytes: The snapshot
+    """
+    parts = [_HEADER.pack(SNAPSHOT_VERSION, round_count,
+                          seat, len(seat_names))]
+    for name, (total_score, round_score) in zip(seat_names, scores):
+        # Names are cut to 255 bytes on a character boundary, so they still decode
+        encoded_name = name.encode()[:255].decode(errors="ignore").encode()
+        parts.append(bytes([len(encoded_name)]) + encoded_name)
+        parts.append(_SEAT_SCORES.pack(total_score, round_score))
+    parts.append(_CARDS.pack(Deck.cards_to_mask(player_state['hand']),
+                             Deck.cards_to_mask(player_state['cards_taken']),
+                             Deck.cards_to_mask(
+                                 player_state['passed_cards'] or []),
+                             len(trick)))
+    for trick_seat, card in trick:
+        parts.append(_PLAY.pack(trick_seat, card.index()))
+    return b''.join(parts)
+
+
+def decode_snapshot(data: bytes) -> dict:
+    """Unpack a snapshot made by `encode_snapshot`
+
+    Args:
+        data (bytes): The snapshot
+
+    Returns:
+        dict: round_count, seat, players (name, total_score and round_score of each seat), hand, cards_taken, passed_cards and trick
+    """
+    version, round_count, seat, seat_count = _HEADER.unpack_from(data)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {version}")
+    offset = _HEADER.size
+    players = []
+    for _ in range(seat_count):
+        name_length = data[offset]
+        name = data[offset + 1:offset + 1 + name_length].decode()
+        offset += 1 + name_length
+        total_score, round_score = _SEAT_SCORES.unpack_from(data, offset)
+        offset += _SEAT_SCORES.size
+        players.append({"name": name, "total_score": total_score,
+                       "round_score": round_score})
+    hand, cards_taken, passed_cards, trick_length = _CARDS.unpack_from(
+        data, offset)
+    offset += _CARDS.size
+    trick = []
+    for _ in range(trick_length):
+        trick_seat, card_index = _PLAY.unpack_from(data, offset)
+        offset += _PLAY.size
+        trick.append((trick_seat, Deck.card_from_index(card_index)))
+    return {
+        "round_count": round_count,
+        "seat": seat,
+        "players": players,
+        "hand": Deck.mask_to_cards(hand),
+        "cards_taken": Deck.mask_to_cards(cards_taken),
+        "passed_cards": Deck.mask_to_cards(passed_cards),
+        "trick": trick,
+    }
+
+
+def snapshot_line(snapshot: bytes) -> bytes:
+    """Frame a snapshot for the text protocol"""
+    return b"SNAPSHOT: " + base64.b64encode(snapshot) + b"\n"
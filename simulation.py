@@ -0,0 +1,276 @@
+"""
+Bot-only simulations spread over worker processes, on one machine or many, with no broker in between.
+
+A simulation is a range of game seeds: game `seed` deals its cards from `random.Random(seed)`, so a game plays the same
+wherever it runs. The coordinator splits the range into work units and hands them out over TCP, one unit at a time to
+each worker. A worker plays the games of its unit and sends back only their summary (see aggregation.py). A unit
+whose worker disconnects, or does not report within the lease, is handed to another worker, and every unit is counted
+once, so the results do not depend on how many workers took part or on which of them were lost.
+
+    python simulation.py coordinator --games 1000000 --port 2400
+    python simulation.py worker --host 10.0.0.5 --port 2400
+runs a coordinator and, on each machine, one worker per core.
+
+    python simulation.py local --games 20000 --workers 4
+runs the coordinator and 4 worker processes on this machine.
+
+Messages are JSON objects, each after its length as a 4 byte little endian integer.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import time
+from collections import deque
+from typing import Callable, NamedTuple, Optional
+
+from aggregation import GameSummary
+from backend.game import Game, bot_game
+
+SERVER_PORT = 2400
+# Games in a work unit, a few seconds of work for a worker
+UNIT_GAMES = 500
+# Seconds a worker has to report on a unit before the unit is handed to another worker
+LEASE = 120.0
+
+_FRAME = struct.Struct("<I")
+# Largest message accepted, results are a few kilobytes
+_MAX_MESSAGE = 1 << 20
+
+
+def play_game(seed: int, settings: Optional[dict] = None, summary: Optional[GameSummary] = None) -> Game:
+    """Play a game between four bots, see `backend.ai`, adding it to the summary if there is one"""
+    game = bot_game(seed, settings=settings)
+    if summary is not None:
+        summary.watch(game)
+    game.play_game()
+    return game
+
+
+def simulate(first_seed: int, games: int, settings: Optional[dict] = None) -> GameSummary:
+    """Play the games with seeds `first_seed` to `first_seed + games - 1`"""
+    summary = GameSummary()
+    for seed in range(first_seed, first_seed + games):
+        play_game(seed, settings, summary)
+    return summary
+
+
+class Unit(NamedTuple):
+    unit_id: int
+    first_seed: int
+    games: int
+
+
+def _encode(message: dict) -> bytes:
+    data = json.dumps(message).encode()
+    return _FRAME.pack(len(data)) + data
+
+
+async def _read_message(reader: asyncio.StreamReader) -> dict:
+    (length,) = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    if length > _MAX_MESSAGE:
+        raise ConnectionError("Message too long")
+    return json.loads(await reader.readexactly(length))
+
+
+class Coordinator:
+    """Hands out the work units of a simulation and adds up their results"""
+
+    def __init__(self, games: int, first_seed: int = 0, unit_games: int = UNIT_GAMES,
+                 settings: Optional[dict] = None, lease: float = LEASE) -> None:
+        """
+        Args:
+            games (int): Games to play
+            first_seed (int): Seed of the first game, the others follow it
+            unit_games (int): Games in a work unit
+            settings (Optional[dict]): Settings of the games, see `backend.rules.DEFAULT_SETTINGS`
+            lease (float): Seconds a worker has to report on a unit
+        """
+        self.settings = settings or {}
+        self.lease = lease
+        self.units = [Unit(unit_id, seed, min(unit_games, first_seed + games - seed))
+                      for unit_id, seed in enumerate(range(first_seed, first_seed + games, unit_games))]
+        self.waiting: deque[Unit] = deque(self.units)
+        # Units handed out and not reported yet, with when their lease ends
+        self.leased: dict[int, float] = {}
+        self.done: set[int] = set()
+        self.stats = GameSummary()
+        self.reassigned = 0
+        self.workers_seen = 0
+        self.finished = asyncio.Event()
+        self.connections: set[asyncio.StreamWriter] = set()
+
+    def _next_unit(self) -> Optional[Unit]:
+        if self.waiting:
+            unit = self.waiting.popleft()
+        else:
+            # Nothing left to hand out, take over a unit whose worker is late
+            now = time.monotonic()
+            late = [unit_id for unit_id, deadline in self.leased.items() if deadline < now]
+            if not late:
+                return None
+            unit = self.units[late[0]]
+            self.reassigned += 1
+        self.leased[unit.unit_id] = time.monotonic() + self.lease
+        return unit
+
+    def _lost(self, unit: Unit) -> None:
+        """A worker went away with a unit, the next worker to ask gets it"""
+        if unit.unit_id not in self.done and self.leased.pop(unit.unit_id, None) is not None:
+            self.waiting.appendleft(unit)
+            self.reassigned += 1
+
+    def _report(self, unit_id: int, stats: GameSummary) -> None:
+        if unit_id in self.done:
+            return  # The unit was late and another worker reported it first
+        self.done.add(unit_id)
+        self.leased.pop(unit_id, None)
+        self.stats.merge(stats)
+        if len(self.done) == len(self.units):
+            self.finished.set()
+
+    async def _serve_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections.add(writer)
+        unit = None
+        try:
+            hello = await _read_message(reader)
+            if hello.get("type") != "hello":
+                return
+            self.workers_seen += 1
+            while not self.finished.is_set():
+                unit = self._next_unit()
+                if unit is None:
+                    # Every unit is out, wait in case one of them is lost
+                    await asyncio.sleep(0.1)
+                    continue
+                writer.write(_encode({"type": "unit", "unit": unit.unit_id, "first_seed": unit.first_seed,
+                                      "games": unit.games, "settings": self.settings}))
+                await writer.drain()
+                reply = await _read_message(reader)
+                if reply.get("type") != "result" or reply.get("unit") != unit.unit_id:
+                    raise ConnectionError(f"Unexpected reply from a worker: {reply.get('type')}")
+                self._report(unit.unit_id, GameSummary.from_dict(reply["stats"]))
+                unit = None
+            writer.write(_encode({"type": "done"}))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, KeyError, TypeError):
+            pass
+        finally:
+            if unit is not None:
+                self._lost(unit)
+            self.connections.discard(writer)
+            writer.close()
+
+    async def run(self, host: str = "0.0.0.0", port: int = SERVER_PORT,
+                  ready: Optional[Callable[[int], None]] = None) -> GameSummary:
+        """Serve workers until every unit is reported.
+
+        Args:
+            host (str): Address to listen on
+            port (int): Port to listen on, 0 for any free port
+            ready (Optional[Callable[[int], None]]): Called with the port once workers can connect
+
+        Returns:
+            GameSummary: The totals of every game
+        """
+        if not self.units:
+            return self.stats
+        server = await asyncio.start_server(self._serve_worker, host, port)
+        async with server:
+            if ready is not None:
+                ready(server.sockets[0].getsockname()[1])
+            await self.finished.wait()
+            # Workers still connected are told there is nothing left
+            await asyncio.sleep(0.2)
+            for writer in list(self.connections):
+                writer.close()
+        return self.stats
+
+
+def _receive(connection: socket.socket, size: int) -> Optional[bytes]:
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def run_worker(host: str, port: int, name: Optional[str] = None) -> int:
+    """Play work units from a coordinator until it has none left.
+
+    Returns:
+        int: The units played
+    """
+    units = 0
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(_encode({"type": "hello", "worker": name or f"{socket.gethostname()}:{os.getpid()}"}))
+        while True:
+            header = _receive(connection, _FRAME.size)
+            if header is None:
+                return units  # The coordinator is gone
+            (length,) = _FRAME.unpack(header)
+            message = json.loads(_receive(connection, length) or b"{}")
+            if message.get("type") != "unit":
+                return units
+            stats = simulate(message["first_seed"], message["games"], message.get("settings"))
+            connection.sendall(_encode({"type": "result", "unit": message["unit"], "stats": stats.to_dict()}))
+            units += 1
+
+
+def run_local(games: int, workers: int, first_seed: int = 0, unit_games: int = UNIT_GAMES,
+              settings: Optional[dict] = None) -> GameSummary:
+    """Run a simulation with a coordinator and worker processes on this machine"""
+    coordinator = Coordinator(games, first_seed, unit_games, settings)
+    context = multiprocessing.get_context("spawn")
+    processes: list = []
+
+    def start_workers(port: int) -> None:
+        for index in range(workers):
+            process = context.Process(target=run_worker, args=("127.0.0.1", port, f"local{index}"), daemon=True)
+            process.start()
+            processes.append(process)
+    try:
+        return asyncio.run(coordinator.run("127.0.0.1", 0, start_workers))
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["coordinator", "worker", "local"])
+    parser.add_argument("--host", default="127.0.0.1", help="coordinator address, for workers")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--unit-games", type=int, default=UNIT_GAMES)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes, for local")
+    parser.add_argument("--end-game-score", type=int, help="play to this score instead of the default")
+    args = parser.parse_args()
+
+    if args.mode == "worker":
+        print(f"Played {run_worker(args.host, args.port)} units")
+        return
+    settings = {} if args.end_game_score is None else {'END_GAME_SCORE': args.end_game_score}
+    start = time.perf_counter()
+    if args.mode == "local":
+        stats = run_local(args.games, args.workers, args.first_seed, args.unit_games, settings)
+    else:
+        coordinator = Coordinator(args.games, args.first_seed, args.unit_games, settings)
+        stats = asyncio.run(coordinator.run("0.0.0.0", args.port,
+                                            lambda port: print(f"Waiting for workers on port {port}")))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({**stats.report(), "seconds": round(elapsed, 3),
+                      "games_per_second": round(stats.games / elapsed, 1)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""
+Hosts many games in one thread, without a thread or a new set of game objects per table.
+
+A table's game is driven through its steps (see backend/hooks.py) by the TableManager, one decision at a time: tables
+with a decision to make take turns in a round robin, so a table full of bots gets no more of the thread than a table
+of people. A table waiting on a person is parked until `TableManager.answer` gets their cards. What happens at a table
+is sent to a listener as JSON ready messages, which the transport delivers to the people seated there:
+
+    {"type": "start", "table": 3, "seats": ["Alice", "Bot 1", "Bot 2", "Bot 3"]}
+    {"type": "decide", "kind": "play", "hand": [0, 14, ...], "legal": [14], "trick": [12], "lead": 3}
+    {"type": "card", "seat": 0, "card": 14}
+    {"type": "trick", "winner": 3, "points": 0}
+    {"type": "round", "round": 1, "scores": [4, 0, 12, 0]}
+    {"type": "game_over", "scores": [52, 10, 3, 13]}
+    {"type": "closed"}
+
+Cards are their indices, see `Deck.Card.index`. A finished table keeps its game, deck and players in a pool and the
+next table opened reuses them with `Game.seat_players` and `Game.reset_game`. At most `max_tables` tables are hosted at
+once, opening another raises TableLimitError so the caller can keep the players waiting.
+"""
+import sys
+from collections import deque
+from types import FunctionType, ModuleType
+from typing import Any, Callable, Optional
+
+from backend.deck import Deck, SUIT
+from backend.exceptions import BadPlayerListError
+from backend.hooks import ignore
+from backend.game import Game
+from backend.player import Player
+from backend.round import Round
+from backend.rules import Rules
+from metrics import Registry
+import backend.ai as ai
+
+# Tables hosted at once
+MAX_TABLES = 1000
+# Finished tables kept to be reused
+POOL_SIZE = 64
+# Tables sampled to estimate the memory of a table
+MEMORY_SAMPLE = 16
+
+# Called with the table, the seat the message is for (None for everyone at the table) and the message
+Listener = Callable[['Table', Optional[int], dict], None]
+
+
+class TableLimitError(Exception):
+    pass
+
+
+def _human_play_card(player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
+    raise RuntimeError("People's decisions are made through TableManager.answer")
+
+
+def _human_pass_cards(player: Player) -> list[Deck.Card]:
+    raise RuntimeError("People's decisions are made through TableManager.answer")
+
+
+class Table:
+    """A game hosted by a TableManager. The game and its players are kept when the table is reused."""
+    __slots__ = ("table_id", "game", "steps", "result", "waiting", "legal", "queued", "games_played")
+
+    def __init__(self, game: Game) -> None:
+        self.table_id = 0
+        self.game = game
+        self.steps: Any = None
+        # What to send the game on its next turn
+        self.result: Any = None
+        # The decision of a person the table is waiting on, as the hook and its arguments, and the cards allowed
+        self.waiting: Optional[tuple[Callable, tuple]] = None
+        self.legal = 0
+        # In the manager's ready queue, a table is only in it once
+        self.queued = False
+        self.games_played = 0
+
+    @property
+    def names(self) -> list[str]:
+        return [player.name for player in self.game.seats]
+
+    def seat_of(self, name: str) -> int:
+        return self.names.index(name)
+
+    @property
+    def waiting_seat(self) -> Optional[int]:
+        return self.waiting[1][0].seat if self.waiting is not None else None
+
+
+class TableManager:
+    """Hosts tables and schedules their decisions"""
+
+    def __init__(self,
+                 listener: Listener = ignore,
+                 max_tables: int = MAX_TABLES,
+                 pool_size: int = POOL_SIZE,
+                 settings: Optional[dict] = None,
+                 bot_play_card: Callable[[Player, Optional[SUIT], bool, list[Deck.Card]], Deck.Card] = ai.play_card,
+                 bot_pass_cards: Callable[[Player], list[Deck.Card]] = ai.bot_pass_cards,
+                 metrics: Optional[Registry] = None,
+                 wakeup: Optional[Callable[[], None]] = None
+                 ) -> None:
+        """
+        Args:
+            listener (Listener): Gets the messages of every table
+            max_tables (int): Tables hosted at once, see `open_table`
+            pool_size (int): Finished tables kept to be reused
+            settings (Optional[dict]): Settings of the games, see `backend.rules.DEFAULT_SETTINGS`
+            bot_play_card (Callable): Decides the cards bots play, see `backend.ai.play_card`
+            bot_pass_cards (Callable): Decides the cards bots pass, see `backend.ai.bot_pass_cards`
+            metrics (Optional[Registry]): Where to report the tables hosted, reuse and memory
+            wakeup (Optional[Callable[[], None]]): Called when a table has a decision to make and none had, so an
+                event loop knows to call `run`
+        """
+        self.listener = listener
+        self.max_tables = max_tables
+        self.pool_size = pool_size
+        self.rules = Rules.compile(settings or {})
+        self.bot_play_card = bot_play_card
+        self.bot_pass_cards = bot_pass_cards
+        self.wakeup = wakeup
+        self.tables: dict[int, Table] = {}
+        self.pool: list[Table] = []
+        # Tables with a decision to make, in the order they get their turn
+        self.ready: deque[Table] = deque()
+        self.next_id = 1
+        self.opened = 0
+        self.reused = 0
+        self.rejected = 0
+
+        metrics = metrics if metrics is not None else Registry(enabled=False)
+        metrics.gauge("hearts_tables_hosted", "Tables being played", function=lambda: len(self.tables))
+        metrics.gauge("hearts_tables_pooled", "Finished tables kept to be reused", function=lambda: len(self.pool))
+        self.opened_counter = metrics.counter("hearts_tables_opened_total", "Tables opened")
+        metrics.gauge("hearts_tables_reuse_ratio", "Share of the tables opened that reused a finished one",
+                      function=lambda: self.reuse_rate)
+        self.rejected_counter = metrics.counter(
+            "hearts_tables_rejected_total", "Tables not opened because the limit was reached")
+        metrics.gauge("hearts_table_bytes", "Estimated bytes held by a table being played",
+                      function=self.table_bytes)
+
+    @property
+    def reuse_rate(self) -> float:
+        return self.reused / self.opened if self.opened else 0.0
+
+    def open_table(self, names: list[str]) -> Table:
+        """Seat people at a table, bots take the other seats, and start their game.
+
+        Raises:
+            TableLimitError: If `max_tables` tables are being played
+            BadPlayerListError: If there are more than 4 names or two of them are the same
+        """
+        if len(self.tables) >= self.max_tables:
+            self.rejected += 1
+            self.rejected_counter.inc()
+            raise TableLimitError(f"{self.max_tables} tables are being played")
+        table = self.pool.pop() if self.pool else self._new_table()
+        game = table.game
+        try:
+            game.seat_players(names)
+        except BadPlayerListError:
+            self.pool.append(table)
+            raise
+        self.reused += table.games_played > 0
+        game.rules = self.rules
+        game.reset_game()
+        table.table_id = self.next_id
+        self.next_id += 1
+        table.steps = game.steps()
+        table.result = None
+        self.tables[table.table_id] = table
+        self.opened += 1
+        self.opened_counter.inc()
+        self.listener(table, None, {"type": "start", "table": table.table_id, "seats": table.names})
+        self._make_ready(table)
+        return table
+
+    def _new_table(self) -> Table:
+        """A table with a game whose hooks tell the listener what happens"""
+        table: Table = None  # type: ignore
+
+        def emit(message: dict) -> None:
+            self.listener(table, None, message)
+
+        def card_played(player: Player, card: Deck.Card) -> None:
+            emit({"type": "card", "seat": player.seat, "card": card.index()})
+
+        def hearts_broken() -> None:
+            emit({"type": "hearts_broken"})
+
+        def trick_end(trick: Round.Trick) -> None:
+            emit({"type": "trick", "winner": trick.winner.seat,  # type: ignore
+                  "points": table.game.rules.trick_points(trick.cards)})
+
+        def round_end() -> None:
+            emit({"type": "round", "round": table.game.round_count,
+                  "scores": [player.total_score for player in table.game.seats]})
+
+        def end_game() -> None:
+            emit({"type": "game_over", "scores": [player.total_score for player in table.game.seats]})
+
+        game = Game([], _human_play_card, _human_pass_cards, hearts_broken, round_end, trick_end, card_played,
+                    end_game, ignore, bot_play_card=self.bot_play_card, bot_pass_cards=self.bot_pass_cards)
+        table = Table(game)
+        return table
+
+    def _make_ready(self, table: Table) -> None:
+        if table.queued:
+            return
+        if not self.ready and self.wakeup is not None:
+            self.wakeup()
+        table.queued = True
+        self.ready.append(table)
+
+    def run(self, budget: Optional[int] = None) -> int:
+        """Give tables with a decision to make their turn, one decision each, until none is left or the budget is spent.
+
+        Returns:
+            int: The turns given
+        """
+        turns = 0
+        while self.ready and (budget is None or turns < budget):
+            table = self.ready.popleft()
+            table.queued = False
+            # Tables closed since they were queued have nothing to do
+            if table.steps is not None and table.waiting is None:
+                self._turn(table)
+                turns += 1
+        return turns
+
+    def _turn(self, table: Table) -> None:
+        """Play a table up to its next decision. A bot decides at once and the table waits for its next turn, a
+        person is asked and the table waits for the answer."""
+        game = table.game
+        steps = table.steps
+        result, table.result = table.result, None
+        while True:
+            try:
+                hook, args = steps.send(result)
+            except StopIteration:
+                self._close(table)
+                return
+            if hook is _human_play_card or hook is _human_pass_cards:
+                self._ask(table, hook, args)
+                return
+            result = hook(*args)
+            if hook is game.bot_play_card or hook is game.bot_pass_cards:
+                table.result = result
+                table.queued = True
+                self.ready.append(table)
+                return
+
+    def _ask(self, table: Table, hook: Callable, args: tuple) -> None:
+        game = table.game
+        player: Player = args[0]
+        table.waiting = (hook, args)
+        message: dict = {"type": "decide", "hand": [card.index() for card in player.hand]}
+        if hook is _human_pass_cards:
+            table.legal = player.hand_mask
+            message.update(kind="pass", direction=game.rules.pass_direction(game.round_count))
+        else:
+            _, led_suit, is_leading = args
+            current_round: Round = game.round  # type: ignore
+            trick: Round.Trick = current_round.current_trick  # type: ignore
+            table.legal = game.rules.allowed_mask(player.hand_mask, current_round.hearts_broken,
+                                                  current_round.trick_count == 0, led_suit, is_leading)
+            message.update(kind="play", legal=[index for index in range(52) if table.legal >> index & 1],
+                           trick=[card.index() for card in trick.cards[:trick.size]], lead=trick.lead)
+        self.listener(table, player.seat, message)
+
+    def answer(self, table: Table, seat: int, cards: list[int]) -> None:
+        """Make the decision a table is waiting on: the card to play or the 3 cards to pass, by index.
+
+        Raises:
+            ValueError: If the table is not waiting on the seat or the cards are not allowed
+        """
+        if table.waiting_seat != seat or table.table_id not in self.tables:
+            raise ValueError("It is not your turn")
+        hook, _ = table.waiting  # type: ignore
+        count = 3 if hook is _human_pass_cards else 1
+        mask = 0
+        for index in cards:
+            if not isinstance(index, int) or not 0 <= index < 52:
+                raise ValueError("Cards are indices from 0 to 51")
+            mask |= 1 << index
+        if len(cards) != count or bin(mask).count("1") != count:
+            raise ValueError(f"Choose {count} different cards")
+        if mask & ~table.legal:
+            raise ValueError("You may not play that card" if count == 1 else "You may only pass cards in your hand")
+        chosen = [Deck.card_from_index(index) for index in cards]
+        self._resume(table, chosen[0] if count == 1 else chosen)
+
+    def decide_for(self, table: Table) -> None:
+        """Let a bot make the decision the table is waiting on, for someone who ran out of time or left"""
+        if table.waiting is None:
+            return
+        hook, args = table.waiting
+        if hook is _human_pass_cards:
+            self._resume(table, self.bot_pass_cards(args[0]))
+        else:
+            self._resume(table, self.bot_play_card(*args, Deck.mask_to_cards(table.legal)))
+
+    def _resume(self, table: Table, result: Any) -> None:
+        table.waiting = None
+        table.result = result
+        self._make_ready(table)
+
+    def leave(self, table: Table, seat: int) -> None:
+        """A person left, a bot plays their seat from now on. The table closes when nobody is left."""
+        game = table.game
+        game.seats[seat].am_bot = True
+        if all(player.am_bot for player in game.players):
+            table.steps.close()
+            self._close(table)
+        elif table.waiting_seat == seat:
+            self.decide_for(table)
+
+    def _close(self, table: Table) -> None:
+        self.listener(table, None, {"type": "closed"})
+        del self.tables[table.table_id]
+        table.waiting = None
+        table.steps = None
+        table.games_played += 1
+        if len(self.pool) < self.pool_size:
+            self.pool.append(table)
+
+    def table_bytes(self) -> float:
+        """Bytes held by a table being played, on average over a sample of them. The cards, the rules and what the
+        tables share are not counted."""
+        sample = list(self.tables.values())[:MEMORY_SAMPLE] or self.pool[:MEMORY_SAMPLE]
+        if not sample:
+            return 0.0
+        return sum(_deep_size(table) for table in sample) / len(sample)
+
+    def stats(self) -> dict:
+        return {"hosted": len(self.tables), "pooled": len(self.pool), "opened": self.opened, "reused": self.reused,
+                "reuse_rate": self.reuse_rate, "rejected": self.rejected, "table_bytes": self.table_bytes()}
+
+
+# Objects shared between tables, or by the whole process
+_SHARED = (TableManager, Deck.Card, Rules, type, ModuleType)
+
+
+def _deep_size(root: object) -> int:
+    """Bytes of an object and of everything it holds that is not shared with other tables"""
+    seen: set[int] = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, FunctionType):
+            # Only the hooks made for a table are its own, they hold it in their closures
+            if obj.__closure__:
+                total += sys.getsizeof(obj)
+                stack.extend(cell.cell_contents for cell in obj.__closure__)
+            continue
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        else:
+            slots = [slot for cls in type(obj).__mro__ for slot in getattr(cls, "__slots__", ())]
+            stack.extend(getattr(obj, slot) for slot in slots if hasattr(obj, slot))
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+    return total
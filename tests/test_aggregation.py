@@ -0,0 +1,53 @@
+import json
+import unittest
+from aggregation import GameSummary, Histogram, Moments
+from simulation import play_game
+
+
+class AggregationTests(unittest.TestCase):
+
+    def test_moments(self):
+        values = [3, -10, 26, 0, 7]
+        moments = Moments()
+        for value in values:
+            moments.add(value)
+        mean = sum(values) / len(values)
+        self.assertEqual(moments.mean(), mean)
+        self.assertAlmostEqual(moments.variance(), sum((value - mean) ** 2 for value in values) / 4)
+        self.assertIsNone(Moments().mean())
+
+    def test_histogram(self):
+        histogram = Histogram(0, 10)
+        for value in [-5, 1, 2, 2, 3, 50]:
+            histogram.add(value)
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(1), 10)
+        with self.assertRaises(ValueError):
+            histogram.merge(Histogram(0, 11))
+
+    def test_rounds_add_up_to_games(self):
+        summary = GameSummary()
+        games = [play_game(seed, summary=summary) for seed in range(4)]
+        self.assertEqual(summary.games, 4)
+        self.assertEqual(summary.rounds, sum(game.round_count for game in games))
+        for seat in range(4):
+            self.assertEqual(summary.round_points[seat].total, summary.game_points[seat].total)
+            self.assertEqual(summary.game_points[seat].total, sum(game.seats[seat].total_score for game in games))
+        # The queen of spades is taken once a round
+        self.assertEqual(sum(summary.queens), summary.rounds)
+        self.assertEqual(sum(moments.count for moments in summary.by_direction.values()), summary.rounds * 4)
+        self.assertEqual(sum(summary.round_histogram.counts), summary.rounds * 4)
+
+    def test_merge_is_exact(self):
+        whole = GameSummary()
+        parts = [GameSummary(), GameSummary()]
+        for seed in range(6):
+            play_game(seed, summary=whole)
+            play_game(seed, summary=parts[seed % 2])
+        merged = GameSummary()
+        for part in reversed(parts):
+            merged.merge(GameSummary.from_dict(json.loads(json.dumps(part.to_dict()))))
+        self.assertEqual(merged, whole)
+        self.assertEqual(merged.report(), whole.report())
@@ -0,0 +1,81 @@
+import importlib.util
+import shutil
+import tempfile
+import unittest
+from backend.deck import Deck
+from backend.game_log import GameReplay
+from tests.test_game_log import play_logged_game
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class ArchiveTests(unittest.TestCase):
+
+    def setUp(self):
+        from archive import Archive
+        self.path = tempfile.mkdtemp()
+        self.logs = [play_logged_game(seed)[1] for seed in range(3)]
+        self.archive = Archive(self.path)
+        self.added = self.archive.append_logs(self.logs)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_records_match_the_replay(self):
+        replays = [GameReplay(log) for log in self.logs]
+        self.assertEqual(self.added, sum(len(replay.rounds) for replay in replays))
+        self.assertEqual(self.archive.players, ["Alice", "Bob", "Bot 1", "Bot 2"])
+        self.assertEqual(len(self.archive.settings), 1)
+        self.assertTrue((self.archive.records["settings"] == 0).all())
+
+        game = replays[0].final_game()
+        records = self.archive.records[self.archive.records["game"] == 0]
+        self.assertEqual(list(records["total_scores"][-1]),
+                         [player.total_score for player in game.players + game.bots])
+        self.assertEqual(list(records["round_scores"].sum(axis=0)), list(records["total_scores"][-1]))
+        self.assertTrue((records["bots"] == 0b1100).all())
+        # Every card is dealt once and taken once
+        for column in ("dealt", "taken"):
+            self.assertTrue((records[column].sum(axis=1) == (1 << 52) - 1).all())
+
+    def test_indexes(self):
+        from archive import bot_took_passed_queen, hearts_broken_on
+        self.archive.build_indexes()
+        records = self.archive.records
+        rows = hearts_broken_on(self.archive, 2)
+        self.assertEqual(list(rows), list((records["hearts_broken_trick"] == 1).nonzero()[0]))
+        self.assertEqual(len(self.archive.player_rows("Alice")), len(self.archive))
+        self.assertEqual(len(self.archive.player_rows("Carol")), 0)
+
+        queen = Deck.Card("spades", 12).index()
+        passed = self.archive.lookup("passed_card", queen)
+        self.assertTrue(all((records["passed"][row] >> queen & 1).any() for row in passed))
+
+        expected = [row for row, record in enumerate(records)
+                    if any(record["bots"] >> seat & 1 and record["passed"][seat] >> queen & 1
+                           and record["queen_seat"] == seat for seat in range(4))]
+        self.assertEqual(list(bot_took_passed_queen(self.archive)), expected)
+
+    def test_reopen_and_stale_indexes(self):
+        from archive import Archive
+        self.archive.build_indexes()
+        self.archive.append_logs(self.logs[:1] + [play_logged_game(9, {'PASS_CYCLE': ('hold',)})[1]])
+        reopened = Archive(self.path)
+        self.assertEqual(int(reopened.records["game"].max()), 4)
+        # The rounds of the new settings are told apart
+        self.assertEqual([rules.pass_cycle for rules in reopened.rules],
+                         [("left", "right", "across", "hold"), ("hold",)])
+        held = reopened.records[reopened.records["settings"] == 1]
+        self.assertTrue((held["passed"] == 0).all() and (held["game"] == 4).all())
+        with self.assertRaises(ValueError):
+            reopened.lookup("player", 0)
+
+    def test_scan_yields_views(self):
+        chunks = list(self.archive.scan(("game", "round_scores"), chunk_rows=5))
+        self.assertEqual(sum(len(chunk) for _, chunk in chunks), len(self.archive))
+        self.assertFalse(chunks[0][1].flags.owndata)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import gc
+import socket
+import unittest
+import weakref
+from typing import Optional
+import api as api_module
+from api import API
+from backend.deck import Deck, SUIT
+from backend.player import Player
+from metrics import Registry
+from outbound import Connection
+import server
+
+
+class AsyncHookTests(unittest.TestCase):
+
+    def setUp(self):
+        self.api = API()
+        for name in ("Alice", "Bob"):
+            self.api.add_player(name)
+        self.tricks = 0
+
+    def set_async_hooks(self):
+        async def play_card(player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
+            await asyncio.sleep(0)
+            return self.api.get_allowed_cards(player, led_suit, is_leading)[0]
+
+        async def pass_cards(player: Player) -> list[Deck.Card]:
+            await asyncio.sleep(0)
+            return player.hand[:3]
+
+        async def trick_end(trick):
+            self.tricks += 1
+
+        self.api.set_play_card_hook(play_card)
+        self.api.set_get_pass_cards_hook(pass_cards)
+        self.api.set_trick_end_hook(trick_end)
+
+    def test_async_game(self):
+        self.set_async_hooks()
+        asyncio.run(self.api.start_game_async())
+        scores = [player.total_score for player in self.api.game.players]  # type: ignore
+        self.assertGreaterEqual(max(scores), 50, "The game should be played to the end")
+        self.assertEqual(self.tricks, 13 * self.api.game.round_count)  # type: ignore
+
+    def test_sync_start_rejects_async_hooks(self):
+        self.set_async_hooks()
+        with self.assertRaises(ValueError):
+            self.api.start_game()
+
+    def test_async_hooks_are_validated(self):
+        async def play_card(player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
+            return player.hand[-1]
+
+        async def pass_cards(player: Player) -> list[Deck.Card]:
+            return player.hand[:3]
+        self.api.set_play_card_hook(play_card)
+        self.api.set_get_pass_cards_hook(pass_cards)
+        with self.assertRaises(ValueError, msg="An illegal card from an async hook should be rejected"):
+            asyncio.run(self.api.start_game_async())
+
+        async def wrong(player: Player) -> Deck.Card:
+            return player.hand[0]
+        with self.assertRaises(ValueError):
+            self.api.set_play_card_hook(wrong)  # type: ignore
+
+    def test_signature_is_inspected_once(self):
+        class Frontend:
+            def play_card(self, player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
+                return player.hand[0]
+        frontend = Frontend()
+        self.api.set_play_card_hook(frontend.play_card)
+        misses = api_module._check_signature.cache_info().misses
+        API().set_play_card_hook(Frontend().play_card)
+        self.assertEqual(api_module._check_signature.cache_info().misses, misses,
+                         "Hooks of the same function should use the cached check")
+
+    def test_checked_hooks_do_not_keep_tables_alive(self):
+        tables = []
+        for _ in range(2):
+            server_side, client_side = socket.socketpair()
+            table = server.Game({"Alice": Connection(server_side)}, metrics=Registry())
+            table.close()
+            client_side.close()
+            tables.append(weakref.ref(table))
+        misses = api_module._check_signature.cache_info().misses
+        del table
+        gc.collect()
+        self.assertEqual([table() for table in tables], [None, None], "Closed tables should be collected")
+        server_side, client_side = socket.socketpair()
+        server.Game({"Alice": Connection(server_side)}, metrics=Registry()).close()
+        client_side.close()
+        self.assertEqual(api_module._check_signature.cache_info().misses, misses,
+                         "The timed hooks of a new table should use the cached check")
+
+
+if __name__ == '__main__':
+    unittest.main()
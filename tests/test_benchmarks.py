@@ -0,0 +1,34 @@
+import random
+import unittest
+
+import benchmarks
+from backend.game import bot_game
+
+
+class BenchmarkTests(unittest.TestCase):
+
+    def test_bot_only_game_finishes(self):
+        random.seed(1)
+        game = bot_game()
+        game.play_game()
+        self.assertGreaterEqual(max(bot.total_score for bot in game.bots), game.settings['END_GAME_SCORE'])
+
+    def test_workloads_are_seeded(self):
+        first = [(trick, [card.index() for card in player.hand], led_suit)
+                 for trick, player, _, _, led_suit, _ in benchmarks._card_decisions(7)]
+        second = [(trick, [card.index() for card in player.hand], led_suit)
+                  for trick, player, _, _, led_suit, _ in benchmarks._card_decisions(7)]
+        self.assertEqual(first, second)
+
+    def test_run_and_compare(self):
+        results = benchmarks.run_benchmarks(["deck_deal", "trick_winner"], min_time=0.001)
+        self.assertEqual(set(results), {"deck_deal", "trick_winner"})
+        self.assertGreater(results["trick_winner"]["median_us"], 0)
+        baseline = {name: {**result, "median_us": result["median_us"] / 2} for name, result in results.items()}
+        del baseline["deck_deal"]
+        self.assertEqual(list(benchmarks.compare(results, baseline, 0.25)), ["trick_winner"])
+        self.assertEqual(benchmarks.compare(results, baseline, 1.5), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from backend.deck import Deck
+from backend.game import bot_game
+from bot_cache import CachedBot, DecisionCache, canonical_mask, real_card
+from metrics import Registry
+
+
+def mask(*cards: tuple[str, int]) -> int:
+    return Deck.cards_to_mask([Deck.Card(suit, rank) for suit, rank in cards])  # type: ignore
+
+
+class BotCacheTests(unittest.TestCase):
+
+    def test_equivalent_ranks_are_one_position(self):
+        everything = (1 << 52) - 1
+        six_played = everything & ~mask(("clubs", 6))
+        seven_played = everything & ~mask(("clubs", 7))
+        self.assertEqual(canonical_mask(mask(("clubs", 5), ("clubs", 7)), six_played),
+                         canonical_mask(mask(("clubs", 5), ("clubs", 6)), seven_played))
+        # Turned back into the card of each position
+        seven = canonical_mask(mask(("clubs", 7)), six_played).bit_length() - 1
+        self.assertEqual(real_card(seven, six_played), Deck.Card("clubs", 7))
+        self.assertEqual(real_card(seven, seven_played), Deck.Card("clubs", 6))
+
+    def test_cached_bots_play_the_same_games(self):
+        registry = Registry()
+        cache = DecisionCache(metrics=registry)
+        for seed in range(20):
+            plain = bot_game(seed)
+            plain.play_game()
+            cached = bot_game(seed)
+            CachedBot(cached, cache)
+            cached.play_game()
+            self.assertEqual([player.total_score for player in plain.seats],
+                             [player.total_score for player in cached.seats])
+        self.assertGreater(cache.hits, 0)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['hearts_bot_cache_hits_total{decision="play_card"}'] +
+                         snapshot['hearts_bot_cache_hits_total{decision="pass_cards"}'], cache.hits)
+        self.assertEqual(snapshot["hearts_bot_cache_hit_rate"], cache.hit_rate())
+
+    def test_register_a_cache_made_earlier(self):
+        cache = DecisionCache()
+        registry = Registry()
+        cache.register(registry)
+        game = bot_game(3)
+        CachedBot(game, cache)
+        game.play_game()
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['hearts_bot_cache_misses_total{decision="play_card"}'] +
+                         snapshot['hearts_bot_cache_misses_total{decision="pass_cards"}'], cache.misses)
+        self.assertEqual(snapshot["hearts_bot_cache_entries"], len(cache.entries))
+
+    def test_hits_skip_the_decision(self):
+        decided = []
+
+        def pass_cards(player):
+            decided.append(player.hand_mask)
+            return player.hand[-3:]
+        cache = DecisionCache(capacity=2)
+        game = bot_game(0)
+        for player, hand in zip(game.seats, game.deck.deal()):
+            player.set_hand(hand)
+        bot = CachedBot(game, cache, pass_cards=pass_cards)
+        first, second, third = game.seats[:3]
+        self.assertEqual(bot.pass_cards(first), first.hand[-3:])
+        bot.pass_cards(second)
+        self.assertEqual(bot.pass_cards(first), first.hand[-3:])
+        self.assertEqual(len(decided), 2)
+        # The least recently used position makes room
+        bot.pass_cards(third)
+        bot.pass_cards(first)
+        bot.pass_cards(second)
+        self.assertEqual(len(decided), 4)
+        self.assertEqual(cache.stats()["evictions"], 2)
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+from backend.deck import Deck
+from backend.player import Player
+from bot_pool import BotPool, cheap_play_card
+from metrics import Registry
+
+
+class BotPoolTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.registry = Registry()
+        cls.pool = BotPool(workers=1, timeout=5, metrics=cls.registry)
+        cls.pool.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def setUp(self):
+        self.bot = Player("Bot 1", am_bot=True)
+        self.bot.set_hand(Deck().cards[::4])
+
+    def test_decisions_match_the_bot(self):
+        allowed = [card for card in self.bot.hand if card.suit == "spades"]
+        self.assertEqual(self.pool.play_card(
+            "table", self.bot, "spades", False, allowed), allowed[0])
+        passed = self.pool.pass_cards("table", self.bot)
+        self.assertEqual(len(passed), 3)
+        self.assertTrue(all(card in self.bot.hand for card in passed))
+        snapshot = self.registry.snapshot()
+        self.assertGreaterEqual(
+            snapshot['hearts_bot_queue_wait_seconds{decision="play_card"}']["count"], 1)
+        self.assertGreaterEqual(
+            snapshot['hearts_bot_compute_seconds{decision="pass_cards"}']["count"], 1)
+
+    def test_cancel_table(self):
+        # Keep the only worker busy so the decision stays queued
+        busy = self.pool.executor.submit(time.sleep, 0.5)
+        results = []
+        decision = threading.Thread(target=lambda: results.append(
+            self.pool.play_card("closing", self.bot, None, True, self.bot.hand)))
+        decision.start()
+        while "closing" not in self.pool.pending:
+            time.sleep(0.01)
+        self.pool.cancel_table("closing")
+        decision.join(1)
+        self.assertFalse(decision.is_alive(),
+                         "Cancelling the table should release the waiting caller")
+        self.assertEqual(results, [cheap_play_card(self.bot.hand)])
+        busy.result()
+
+    def test_deadline_falls_back(self):
+        pool = BotPool(workers=1, timeout=0)
+        try:
+            card = pool.play_card("table", self.bot, None, True, self.bot.hand)
+            self.assertEqual(card, cheap_play_card(self.bot.hand),
+                             "The cheap policy should decide when the pool is too slow")
+        finally:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
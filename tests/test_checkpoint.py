@@ -0,0 +1,111 @@
+import random
+import unittest
+from typing import Optional
+from api import scripted_api
+from backend.deck import Deck, SUIT
+from backend.hooks import run_steps
+from backend.player import Player
+from backend.round import Round
+
+
+class RoundSeededDeck(Deck):
+    """Deals the same cards for a round number in every game, so a restored game gets the deals the original got"""
+
+    def __init__(self, game) -> None:
+        super().__init__()
+        self.game = game
+
+    def shuffle(self) -> None:
+        self.cards.sort()
+        random.Random(self.game.round_count).shuffle(self.cards)
+
+
+class Table:
+    """Two players and two bots. A checkpoint is taken the nth time a hook of the given kind is called"""
+
+    def __init__(self, seed: int, save_at: Optional[tuple[str, int]] = None) -> None:
+        self.rng = random.Random(seed)
+        self.save_at = save_at
+        self.calls: dict[str, int] = {}
+        self.saved: Optional[tuple[bytes, object, int]] = None
+        self.plays: list[int] = []
+        self.api = scripted_api(("Alice", "Bob"), self.rng)
+        scripted_play, scripted_pass = self.api.play_card, self.api.pass_cards
+
+        def play_card(player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
+            self.hook_called("play")
+            return scripted_play(player, led_suit, is_leading)  # type: ignore
+
+        def pass_cards(player: Player) -> list[Deck.Card]:
+            self.hook_called("pass")
+            return scripted_pass(player)  # type: ignore
+
+        def trick_end(trick: Round.Trick) -> None:
+            self.hook_called("trick_end")
+
+        def card_played(player: Player, card: Deck.Card) -> None:
+            self.plays.append(card.index())
+
+        def round_end() -> None:
+            self.hook_called("round_end")
+        self.api.set_play_card_hook(play_card)
+        self.api.set_get_pass_cards_hook(pass_cards)
+        self.api.set_trick_end_hook(trick_end)
+        self.api.set_card_played_hook(card_played)
+        self.api.set_round_end_hook(round_end)
+        self.api.create_game()
+        self.game = self.api.game
+        self.game.deck = RoundSeededDeck(self.game)  # type: ignore
+
+    def hook_called(self, kind: str) -> None:
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        if self.save_at == (kind, self.calls[kind]):
+            self.saved = (self.game.checkpoint(), self.rng.getstate(), len(self.plays))  # type: ignore
+
+    def play(self) -> list[int]:
+        run_steps(self.game.steps())  # type: ignore
+        return [player.total_score for player in self.game.players + self.game.bots]  # type: ignore
+
+
+class CheckpointTests(unittest.TestCase):
+
+    def assert_resumes(self, save_at: tuple[str, int]):
+        original = Table(7, save_at)
+        scores = original.play()
+        checkpoint, rng_state, plays = original.saved  # type: ignore
+        self.assertLess(len(checkpoint), 140)
+
+        restored = Table(0)
+        restored.rng.setstate(rng_state)
+        restored.game.restore(checkpoint)  # type: ignore
+        self.assertEqual(restored.game.checkpoint(), checkpoint)  # type: ignore
+        self.assertEqual(restored.play(), scores)
+        self.assertEqual(restored.plays, original.plays[plays:])
+
+    def test_resume_mid_trick(self):
+        self.assert_resumes(("play", 30))
+
+    def test_resume_while_passing(self):
+        # Alice has passed and Bob is passing
+        self.assert_resumes(("pass", 2))
+
+    def test_resume_at_trick_end(self):
+        self.assert_resumes(("trick_end", 20))
+
+    def test_resume_between_rounds(self):
+        self.assert_resumes(("round_end", 1))
+
+    def test_restore_checks_the_players(self):
+        checkpoint = Table(1).game.checkpoint()  # type: ignore
+        table = Table(2)
+        with self.assertRaises(ValueError):
+            table.game.restore(checkpoint[:5])  # type: ignore
+        table.game.restore(checkpoint)  # type: ignore
+        three_players = Table(3)
+        three_players.game.players.append(Player("Carol"))  # type: ignore
+        with self.assertRaises(ValueError):
+            three_players.game.restore(checkpoint)  # type: ignore
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from backend.deck import Deck
+from backend.game_log import GameReplay
+from tests.test_game_log import play_logged_game
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+VARIANT = {'JACK_NEGATIVE': False, 'PASS_CYCLE': ('right', 'across', 'hold'), 'FIRST_TRICK_POINTS': True}
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class DatasetTests(unittest.TestCase):
+
+    def setUp(self):
+        from archive import Archive
+        self.path = tempfile.mkdtemp()
+        # The second game is played with a variant of the rules
+        self.logs = [play_logged_game(11)[1], play_logged_game(12, VARIANT)[1]]
+        self.archive = Archive(os.path.join(self.path, "archive"))
+        self.archive.append_logs(self.logs)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_decisions_match_the_engine(self):
+        from dataset import decisions
+        for game_id, log in enumerate(self.logs):
+            rows = decisions(self.archive.records[self.archive.records["game"] == game_id], self.archive.rules)
+            self.assertEqual(self.check_rows(rows, GameReplay(log)), len(rows))
+
+    def check_rows(self, rows, replay: GameReplay) -> int:
+        checked = 0
+        for row, (game, round_index, play) in zip(rows, replay.positions()):
+            current_round = game.round
+            trick = current_round.current_trick
+            player = trick.current_player
+            seats = game.players + game.bots
+            is_leading = not trick.played
+            led_suit = ("clubs" if current_round.trick_count == 0 else None) if is_leading else trick.led_suit
+            allowed = player.allowed_cards_to_play(
+                current_round.hearts_broken, current_round.trick_count == 0, led_suit, is_leading, game.rules)
+            self.assertEqual((row["round"], row["trick"]), (round_index, play // 4))
+            self.assertEqual(row["seat"], seats.index(player))
+            self.assertEqual(int(row["hand"]), Deck.cards_to_mask(player.hand))
+            self.assertEqual(int(row["legal"]), Deck.cards_to_mask(allowed))
+            self.assertEqual(bool(row["hearts_broken"]), current_round.hearts_broken)
+            self.assertEqual(list(row["trick_cards"][:len(trick.played)]),
+                             [card.index() for card in trick.played.values()])
+            self.assertEqual(list(row["round_points"]), [seat.round_score for seat in seats])
+            self.assertEqual(list(row["total_scores"]), [seat.total_score for seat in seats])
+            self.assertTrue(int(row["legal"]) >> int(row["chosen"]) & 1)
+            checked += 1
+        return checked
+
+    def test_export(self):
+        import numpy as np
+        from dataset import decisions, export
+        out = os.path.join(self.path, "decisions")
+        manifest = export(self.archive.path, out, workers=2, part_rounds=7, chunk_rounds=3)
+        self.assertEqual(manifest["rows"], len(self.archive) * 52)
+        parts = [np.load(os.path.join(out, part["file"]), mmap_mode="r") for part in manifest["parts"]]
+        self.assertTrue((np.concatenate(parts) == decisions(self.archive.records, self.archive.rules)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
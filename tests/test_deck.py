@@ -37,6 +37,17 @@ class DeckTests(unittest.TestCase):
         self.assertEqual(deck_cards, sorted_deck_cards,
                          "The sorted deck should be the same as the original deck")
 
+    def test_card_masks(self):
+        deck = Deck()
+        self.assertEqual(sorted(card.index() for card in deck.cards), list(range(52)),
+                         "Every card should have a unique index")
+        self.assertEqual([Deck.card_from_index(card.index()) for card in deck.cards], deck.cards,
+                         "A card should be recovered from its index")
+        hand = deck.deal()[0]
+        self.assertEqual(Deck.mask_to_cards(Deck.cards_to_mask(hand)), Deck.sort_hand(hand),
+                         "A hand should be recovered from its mask in sorted order")
+        self.assertRaises(BadPlayingCardError, Deck.card_from_index, 52)
+
 
 class CardTests(unittest.TestCase):
 
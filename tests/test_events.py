@@ -0,0 +1,69 @@
+import unittest
+from api import scripted_api
+from backend.deck import Deck
+from backend.events import EventKind, EventStream, pack_event, unpack_event
+
+
+class EventStreamTests(unittest.TestCase):
+
+    def test_pack_round_trip(self):
+        mask = Deck.cards_to_mask(Deck().cards[-3:])
+        event = unpack_event(pack_event(EventKind.PASS, 3, mask))
+        self.assertEqual(event, (EventKind.PASS, 3, mask))
+
+    def test_no_work_without_subscribers(self):
+        stream = EventStream(capacity=4)
+        stream.emit(EventKind.CARD_PLAYED, 1, 5)
+        self.assertEqual(stream.count, 0)
+
+    def test_full_buffer_is_delivered_early(self):
+        stream = EventStream(capacity=4)
+        batches = []
+        stream.subscribe(batches.append, batch="round")
+        for index in range(6):
+            stream.emit(EventKind.CARD_PLAYED, 0, index)
+        stream.emit(EventKind.ROUND_END, value=1)
+        values = [event.value for batch in batches for event in batch]
+        self.assertEqual(values, [0, 1, 2, 3, 4, 5, 1], "No event should be lost")
+
+    def test_unsubscribe(self):
+        stream = EventStream()
+        batches = []
+        unsubscribe = stream.subscribe(batches.append)
+        unsubscribe()
+        stream.emit(EventKind.TRICK_END)
+        self.assertEqual(batches, [])
+        self.assertFalse(stream.active)
+
+
+class GameEventTests(unittest.TestCase):
+
+    def setUp(self):
+        self.api = scripted_api()
+
+    def test_batches(self):
+        tricks = []
+        rounds = []
+        self.api.subscribe_events(tricks.append, batch="trick")
+        self.api.subscribe_events(rounds.append, batch="round")
+        self.api.start_game()
+        game = self.api.game
+
+        first_trick = [event for event in tricks[0]
+                       if event.kind in (EventKind.CARD_PLAYED, EventKind.TRICK_END)]
+        self.assertEqual([event.kind for event in first_trick],
+                         [EventKind.CARD_PLAYED] * 4 + [EventKind.TRICK_END])
+        self.assertEqual(first_trick[0].value, Deck.Card("clubs", 2).index(),
+                         "The 2 of clubs leads the first trick")
+
+        self.assertEqual(rounds[-1][-1].kind, EventKind.GAME_END)
+        round_ends = [event for batch in rounds for event in batch if event.kind == EventKind.ROUND_END]
+        self.assertEqual(len(round_ends), game.round_count)  # type: ignore
+        points = sum(event.value for batch in rounds for event in batch
+                     if event.kind == EventKind.TRICK_END)
+        self.assertEqual(points, sum(player.total_score for player in game.players + game.bots),  # type: ignore
+                         "Trick points should add up to the scores")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import io
+import random
+import unittest
+from typing import Optional
+from api import API, scripted_api
+from backend.deck import Deck
+from backend.game_log import GameReplay, ReplayError, append_framed, read_framed
+
+
+def play_logged_game(seed: int, settings: Optional[dict] = None, names: tuple = ("Alice", "Bob")) -> tuple[API, bytes]:
+    api = scripted_api(names, random.Random(seed))
+    if settings is not None:
+        api.set_settings(settings)
+    log = io.BytesIO()
+    api.set_game_log(log)
+    api.start_game()
+    return api, log.getvalue()
+
+
+class GameLogTests(unittest.TestCase):
+
+    def test_deal_round_trip(self):
+        hands = Deck().deal()
+        self.assertEqual(Deck.unpack_deal(Deck.pack_deal(hands)),
+                         [Deck.sort_hand(hand) for hand in hands])
+
+    def test_replay_reaches_the_same_end(self):
+        api, log = play_logged_game(1)
+        game = api.game
+        self.assertLess(len(log), 100 * game.round_count + 32,  # type: ignore
+                        "A round should take less than 100 bytes")
+        replay = GameReplay(log)
+        self.assertTrue(replay.finished)
+        self.assertEqual(replay.names, ["Alice", "Bob"])
+        replayed = replay.final_game()
+        self.assertEqual([player.total_score for player in replayed.players + replayed.bots],
+                         [player.total_score for player in game.players + game.bots])  # type: ignore
+
+    def test_replay_a_variant(self):
+        settings = {'JACK_NEGATIVE': False, 'PASS_CYCLE': ('right', 'hold'), 'SHOOT_THE_MOON': True}
+        api, log = play_logged_game(7, settings)
+        replay = GameReplay(log)
+        self.assertIs(replay.rules, api.game.rules)  # type: ignore
+        replayed = replay.final_game()
+        self.assertEqual([player.total_score for player in replayed.seats],
+                         [player.total_score for player in api.game.seats])  # type: ignore
+
+    def test_long_names_are_cut_between_characters(self):
+        _, log = play_logged_game(8, names=("é" * 200, "Bob"))
+        self.assertEqual(GameReplay(log).names[:2], ["é" * 127, "Bob"])
+
+    def test_seek(self):
+        _, log = play_logged_game(2)
+        game = GameReplay(log).seek(0, 6)
+        self.assertEqual(game.round.trick_count, 1)
+        self.assertEqual(len(game.round.current_trick.played), 2)  # type: ignore
+        # Played cards leave the hands when the trick ends
+        self.assertEqual(sum(len(player.hand) for player in game.players + game.bots), 52 - 4)
+        with self.assertRaises(ReplayError):
+            GameReplay(log).seek(100)
+
+    def test_truncated_log(self):
+        _, log = play_logged_game(3)
+        # Cut the log while the second round is passing
+        # The first round takes 119 bytes, then comes the deal, one full pass and part of the next
+        game = GameReplay(log[:119 + 14 + 5 + 2]).final_game()
+        self.assertLessEqual(game.round_count, 1)
+
+    def test_tampered_scores_are_detected(self):
+        _, log = play_logged_game(4)
+        # Header with the passing cycle and the two names, the deal, 4 passes and 52 plays come before the scores
+        # of the first round
+        scores = 10 + 4 + 6 + 4 + 14 + 4 * 5 + 52
+        data = bytearray(log)
+        self.assertEqual(data[scores], 0x82)
+        data[scores + 1] ^= 1
+        with self.assertRaises(ReplayError):
+            GameReplay(bytes(data)).final_game()
+
+    def test_framed_file(self):
+        _, first = play_logged_game(5)
+        _, second = play_logged_game(6)
+        stream = io.BytesIO()
+        append_framed(stream, first)
+        append_framed(stream, second)
+        self.assertEqual(list(read_framed(stream.getvalue())), [first, second])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import random
+import unittest
+
+from gateway import CLOSE, PING, TEXT, Gateway, encode_frame, read_message
+from loadgen import FleetStats, play_one_game, run_fleet
+
+
+async def _websocket(port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+    head = await reader.readuntil(b"\r\n\r\n")
+    # The example key and answer of RFC 6455
+    assert b"s3pPLMBiTxaQ9kYGzzhZRbK+xOo=" in head
+    return reader, writer
+
+
+def _fragment(payload: bytes, opcode: int, final: bool = False) -> bytes:
+    """A frame of a fragmented message, continuation frames have opcode 0"""
+    frame = encode_frame(payload, opcode, mask=True)
+    return bytes([frame[0] if final else frame[0] & 0x7F]) + frame[1:]
+
+
+async def _receive(reader: asyncio.StreamReader, kind: str) -> dict:
+    while True:
+        opcode, payload = await read_message(reader)
+        message = json.loads(payload)
+        if opcode == TEXT and message["type"] == kind:
+            return message
+
+
+class GatewayTests(unittest.TestCase):
+
+    def test_pings_between_fragments(self):
+        async def test() -> None:
+            reader = asyncio.StreamReader()
+            reader.feed_data(_fragment(b'{"type": ', TEXT))
+            reader.feed_data(encode_frame(b"are you there", PING, mask=True))
+            reader.feed_data(_fragment(b'"leave"}', 0, final=True))
+            reader.feed_data(encode_frame(b"", CLOSE))
+            pings = []
+            self.assertEqual(await read_message(reader, pings.append), (TEXT, b'{"type": "leave"}'))
+            self.assertEqual(pings, [b"are you there"])
+            self.assertEqual((await read_message(reader))[0], CLOSE)
+        asyncio.run(test())
+
+    def serve(self, test, **options) -> None:
+        async def run() -> None:
+            gateway = Gateway(**{"table_size": 1, "queue_time_target": 0, **options})
+            servers = await gateway.serve("127.0.0.1", 0, 0)
+            ports = [server.sockets[0].getsockname()[1] for server in servers]
+            try:
+                await asyncio.wait_for(test(gateway, *ports), 60)
+            finally:
+                for server in servers:
+                    server.close()
+        asyncio.run(run())
+
+    def test_websocket_and_text_clients_finish_games(self):
+        async def test(gateway, port, text_port) -> None:
+            stats = FleetStats()
+            fleet = run_fleet("127.0.0.1", port, 8, 0, 0, 1, websocket=True)
+            text = play_one_game("127.0.0.1", text_port, "Texter", stats, random.Random(2))
+            fleet_stats, finished = await asyncio.gather(fleet, text)
+            self.assertTrue(finished)
+            self.assertEqual(fleet_stats.games_completed, 8)
+            self.assertEqual(fleet_stats.dropped + fleet_stats.connect_failures, 0)
+            self.assertGreater(len(fleet_stats.round_trips), 8 * 13)
+            self.assertEqual(gateway.manager.stats()["hosted"], 0)
+        self.serve(test)
+
+    def test_decisions_are_checked_and_timed(self):
+        async def test(gateway, port, text_port) -> None:
+            reader, writer = await _websocket(port)
+            writer.write(encode_frame(json.dumps({"type": "join", "name": "alice"}).encode(), mask=True))
+            self.assertEqual((await _receive(reader, "welcome"))["name"], "Alice")
+            seated = await _receive(reader, "seated")
+            self.assertEqual(seated["seats"][seated["seat"]], "Alice")
+            decide = await _receive(reader, "decide")
+            self.assertEqual(decide["kind"], "pass")
+            writer.write(encode_frame(json.dumps({"type": "pass", "cards": decide["hand"][:2]}).encode(), mask=True))
+            await _receive(reader, "error")
+            # Nobody answers in time, so bots decide and the game goes on to the next decision
+            self.assertEqual((await _receive(reader, "decide"))["kind"], "play")
+            writer.write(encode_frame(json.dumps({"type": "leave"}).encode(), mask=True))
+            await _receive(reader, "left")
+            # Free to join again
+            writer.write(encode_frame(json.dumps({"type": "join", "name": "alice"}).encode(), mask=True))
+            await _receive(reader, "welcome")
+            writer.close()
+        self.serve(test, turn_timeout=0.05, pass_timeout=0.05)
+
+    def test_stats_over_http(self):
+        async def test(gateway, port, text_port) -> None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /stats HTTP/1.1\r\nHost: test\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            head, _, body = response.partition(b"\r\n\r\n")
+            self.assertTrue(head.startswith(b"HTTP/1.1 200"))
+            stats = json.loads(body)
+            self.assertEqual(stats["connections"], 0)
+            self.assertIn("hosted", stats["tables"])
+        self.serve(test)
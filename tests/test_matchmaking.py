@@ -0,0 +1,92 @@
+import time
+import unittest
+from matchmaking import Matchmaker
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class MatchmakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.matchmaker = Matchmaker(
+            table_size=4, queue_time_target=10, clock=self.clock)
+
+    def test_full_tables_are_seated_in_batches(self):
+        for i in range(9):
+            self.matchmaker.join(f"Player {i}")
+        self.assertEqual(self.matchmaker.queue_depth, 9)
+        tables = self.matchmaker.seat_ready()
+        self.assertEqual([len(table) for table in tables], [4, 4],
+                         "Two full tables should be formed")
+        self.assertEqual([entry.name for entry in tables[0]], [
+                         "Player 0", "Player 1", "Player 2", "Player 3"], "Players should be seated in the order they joined")
+        self.assertEqual(self.matchmaker.queue_depth, 1,
+                         "One player should still be waiting")
+
+    def test_buckets_are_not_mixed(self):
+        for i in range(2):
+            self.matchmaker.join(f"Novice {i}", skill=0)
+            self.matchmaker.join(f"Expert {i}", skill=2000)
+        self.assertEqual(self.matchmaker.seat_ready(), [],
+                         "Players of different skill should not share a table before the target")
+        for i in range(2, 4):
+            self.matchmaker.join(f"Expert {i}", skill=2000)
+        tables = self.matchmaker.seat_ready()
+        self.assertEqual(len(tables), 1)
+        self.assertTrue(all(entry.name.startswith("Expert")
+                        for entry in tables[0]), "Only experts should be seated together")
+
+    def test_overdue_players_are_seated_with_bots(self):
+        self.matchmaker.join("Alice", skill=0)
+        self.clock.now = 5
+        self.matchmaker.join("Bob", skill=5000)
+        self.assertEqual(self.matchmaker.seat_ready(), [])
+        self.clock.now = 11
+        tables = self.matchmaker.seat_ready()
+        self.assertEqual([[entry.name for entry in table] for table in tables], [
+                         ["Alice", "Bob"]], "The overdue player should be seated with whoever is waiting")
+        snapshot = self.matchmaker.snapshot()
+        self.assertEqual(snapshot["bot_seats"], 2,
+                         "The empty seats should be filled by bots")
+        self.assertEqual(snapshot["time_to_seat_max"], 11)
+        self.assertEqual(snapshot["queue_depth"], 0)
+
+    def test_leave(self):
+        self.matchmaker.join("Alice")
+        self.assertRaises(ValueError, self.matchmaker.join, "Alice")
+        self.matchmaker.leave("Alice")
+        for name in ["Bob", "Charlie", "David"]:
+            self.matchmaker.join(name)
+        self.assertEqual(self.matchmaker.seat_ready(), [],
+                         "A player who left should not be seated")
+        self.matchmaker.join("Alice")
+        tables = self.matchmaker.seat_ready()
+        self.assertEqual(sorted(entry.name for entry in tables[0]), [
+                         "Alice", "Bob", "Charlie", "David"])
+
+    def test_bad_table_size(self):
+        self.assertRaises(ValueError, Matchmaker, table_size=0)
+        self.assertRaises(ValueError, Matchmaker, table_size=5)
+
+    def test_join_throughput(self):
+        matchmaker = Matchmaker(table_size=4)
+        start = time.perf_counter()
+        for i in range(20000):
+            matchmaker.join(f"Player {i}", skill=i % 1000, latency_ms=i % 300)
+            if i % 1000 == 0:
+                matchmaker.seat_ready()
+        matchmaker.seat_ready()
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 5, "Thousands of joins per second should be sustained")
+        self.assertLess(matchmaker.queue_depth, 4 * len(matchmaker.buckets) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
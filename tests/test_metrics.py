@@ -0,0 +1,103 @@
+import random
+import socket
+import unittest
+import urllib.request
+from metrics import Registry, Histogram
+from outbound import Connection
+import server
+
+
+class HistogramTests(unittest.TestCase):
+
+    def test_percentiles_within_precision(self):
+        histogram = Histogram(scale=1)
+        rng = random.Random(0)
+        values = sorted(rng.randrange(1, 1_000_000) for _ in range(10000))
+        for value in values:
+            histogram.observe(value)
+        for percent in (50, 90, 99):
+            exact = values[int(len(values) * percent / 100) - 1]
+            self.assertAlmostEqual(histogram.percentile(percent), exact, delta=exact * 0.07,
+                                   msg=f"p{percent} should be within the bucket precision")
+        self.assertEqual(histogram.percentile(100), values[-1])
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram(scale=1)
+        for value in (1, 2, 3, 4):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(50), 2)
+        self.assertEqual(histogram.summary()["max"], 4)
+
+
+class RegistryTests(unittest.TestCase):
+
+    def test_snapshot(self):
+        registry = Registry()
+        registry.counter("games_total", "Games").inc(3)
+        registry.gauge("tables", "Tables", function=lambda: 7)
+        registry.histogram("wait_seconds", "Wait", {"hook": "play_card"}).observe(0.5)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["games_total"], 3)
+        self.assertEqual(snapshot["tables"], 7)
+        self.assertEqual(snapshot['wait_seconds{hook="play_card"}']["count"], 1)
+
+    def test_prometheus_text(self):
+        registry = Registry()
+        histogram = registry.histogram("wait_seconds", "Wait")
+        for value in (0.001, 0.002, 0.5):
+            histogram.observe(value)
+        text = registry.render_prometheus()
+        self.assertIn("# TYPE wait_seconds histogram", text)
+        self.assertIn('wait_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("wait_seconds_count 3", text)
+
+    def test_disabled_registry_does_nothing(self):
+        registry = Registry(enabled=False)
+        def hook(): return None
+        histogram = registry.histogram("wait_seconds", "Wait")
+        histogram.observe(1)
+        registry.counter("games_total", "Games").inc()
+        self.assertIs(registry.timed(histogram, hook), hook,
+                      "Hooks should not be wrapped when metrics are off")
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_timed_hooks_pass_validation(self):
+        registry = Registry()
+        server_side, client_side = socket.socketpair()
+        game = server.Game({"Alice": Connection(server_side)}, metrics=registry)
+        try:
+            self.assertIn('hearts_hook_seconds{hook="play_card"}', registry.snapshot())
+        finally:
+            game.close()
+            client_side.close()
+
+    def test_table_bytes_count_what_the_socket_accepted(self):
+        registry = Registry()
+        server_side, client_side = socket.socketpair()
+        connection = Connection(server_side)
+        connection.send(b"before the table")
+        game = server.Game({"Alice": connection}, metrics=registry)
+        try:
+            game.send("Alice", b"hello")
+        finally:
+            game.close()
+            client_side.close()
+        table_bytes = registry.snapshot()["hearts_table_bytes_sent"]
+        self.assertEqual(table_bytes["count"], 1)
+        self.assertEqual(table_bytes["sum"], len(b"hello"))
+
+    def test_serve(self):
+        registry = Registry()
+        registry.counter("games_total", "Games").inc()
+        http_server = registry.serve(0)
+        try:
+            port = http_server.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                self.assertIn(b"games_total 1", response.read())
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
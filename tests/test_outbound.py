@@ -0,0 +1,86 @@
+import socket
+import time
+import unittest
+from outbound import Connection, OutboundCounters, OutboundPump, SlowConsumerError
+
+FRAME = b"x" * 1024
+
+
+class OutboundTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server_side, self.client_side = socket.socketpair()
+        # Keep the kernel buffers small so the queue fills up quickly
+        self.server_side.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.client_side.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.pump = OutboundPump()
+        self.counters = OutboundCounters()
+
+    def tearDown(self):
+        self.client_side.close()
+        self.server_side.close()
+
+    def connection(self, policy):
+        return Connection(self.server_side, self.pump, max_bytes=16 * 1024, policy=policy, counters=self.counters)
+
+    def read_all(self) -> bytes:
+        self.client_side.settimeout(0.2)
+        received = b""
+        while True:
+            self.pump.run_once(0)
+            try:
+                data = self.client_side.recv(65536)
+            except socket.timeout:
+                return received
+            if not data:
+                return received
+            received += data
+
+    def test_send_does_not_block(self):
+        connection = self.connection("coalesce")
+        start = time.perf_counter()
+        for _ in range(100):
+            connection.send(FRAME, key="trick")
+        self.assertLess(time.perf_counter() - start, 1,
+                        "Sending to a client that is not reading should not block")
+        self.assertLessEqual(connection.queued_bytes, 16 * 1024)
+        self.assertGreater(self.counters.snapshot()["frames_coalesced"], 0)
+
+    def test_essential_frames_are_delivered_in_order(self):
+        connection = self.connection("drop")
+        frames = [bytes([i]) * 512 for i in range(20)]
+        for frame in frames:
+            connection.send(frame)
+        self.assertEqual(self.read_all(), b"".join(frames),
+                         "Frames without a key should all arrive in order once the client reads")
+        self.assertEqual(self.counters.snapshot()["bytes_sent"], 20 * 512)
+
+    def test_drop_spectator_frames(self):
+        connection = self.connection("drop")
+        for _ in range(60):
+            connection.send(FRAME, key="trick")
+        connection.send(b"prompt")
+        self.assertTrue(self.read_all().endswith(b"prompt"),
+                        "The newest frame should not be dropped")
+        snapshot = self.counters.snapshot()
+        self.assertGreater(snapshot["frames_dropped"], 0)
+        self.assertGreater(snapshot["high_water_bytes"], 16 * 1024)
+
+    def test_disconnect(self):
+        connection = self.connection("disconnect")
+        with self.assertRaises(SlowConsumerError):
+            for _ in range(100):
+                connection.send(FRAME)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.counters.snapshot()["slow_consumer_disconnects"], 1)
+        self.assertRaises(ConnectionError, connection.send, b"more")
+
+    def test_essential_frames_over_the_limit_disconnect(self):
+        connection = self.connection("coalesce")
+        with self.assertRaises(SlowConsumerError):
+            for _ in range(100):
+                connection.send(FRAME)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from typing import Optional
+from api import API, scripted_api
+from backend.deck import Deck, SUIT
+from backend.game_log import GameReplay
+from backend.player import Player
+from persistence import TableStore
+
+
+class Crash(Exception):
+    pass
+
+
+def make_api(seed: int, crash_after: Optional[int] = None) -> tuple[API, list[int]]:
+    """A game with random players, the play card hook raises Crash after the given number of plays"""
+    api = scripted_api(("Alice", "Bob"), random.Random(seed))
+    scripted_play = api.play_card
+    plays = [0]
+
+    def play_card(player: Player, led_suit: Optional[SUIT], is_leading: bool) -> Deck.Card:
+        if plays[0] == crash_after:
+            raise Crash()
+        plays[0] += 1
+        return scripted_play(player, led_suit, is_leading)  # type: ignore
+    api.set_play_card_hook(play_card)
+    return api, plays
+
+
+class TableStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "tables.db")
+        self.store = TableStore(self.path)
+        self.store.start()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_crashed_game_resumes(self):
+        api, _ = make_api(1, crash_after=40)
+        table_log = self.store.open_table([("Alice", "token"), ("Bob", "")])
+        api.set_game_log(table_log, batch="trick")  # type: ignore
+        with self.assertRaises(Crash):
+            api.start_game()
+        self.store.close()
+
+        restarted = TableStore(self.path)
+        [table] = restarted.unfinished()
+        self.assertEqual(table.seats, [("Alice", "token"), ("Bob", "")])
+        self.assertEqual(table.log, table_log.getvalue(), "Every trick should have been written")
+
+        api, plays = make_api(2)
+        restarted.start()
+        resumed_log = restarted.resume_table(table)
+        api.set_game_log(resumed_log, batch="trick")  # type: ignore
+        api.restore_game(table.log)
+        game = api.game
+        logged_plays = len(GameReplay(table.log).rounds[-1].plays)
+        self.assertEqual(logged_plays % 4, 0, "The log should end with a trick")
+        self.assertEqual(sum(len(player.hand) for player in game.players + game.bots), 52 - logged_plays,  # type: ignore
+                         "The game should carry on after the last trick that was written")
+        self.assertEqual(plays[0], 0, "No hook should be called for what is in the log")
+        api.start_game()
+        restarted.flush()
+
+        [table] = restarted.unfinished()
+        self.assertEqual(table.log, resumed_log.getvalue())
+        replayed = GameReplay(table.log).final_game()
+        self.assertEqual([player.total_score for player in replayed.players + replayed.bots],
+                         [player.total_score for player in game.players + game.bots])  # type: ignore
+
+        restarted.finish(table.table_id)
+        restarted.close()
+        self.assertEqual(TableStore(self.path).unfinished(), [])
+
+    def test_restore_checks_players(self):
+        api, _ = make_api(3)
+        table_log = self.store.open_table([("Alice", ""), ("Bob", "")])
+        api.set_game_log(table_log, batch="trick")  # type: ignore
+        api.start_game()
+        other = API()
+        other.add_player("Carol")
+        other.set_play_card_hook(api.play_card)  # type: ignore
+        other.set_get_pass_cards_hook(api.pass_cards)  # type: ignore
+        with self.assertRaises(ValueError):
+            other.restore_game(table_log.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -91,3 +91,12 @@ class PlayerTests(unittest.TestCase):
         with self.assertRaises(NoLegalMovesError):
             self.player.allowed_cards_to_play(
                 False, True, 'clubs', False)
+
+    def test_hand_mask_follows_the_hand(self):
+        player = Player("Mask")
+        player.set_hand([Deck.Card("clubs", 3), Deck.Card("hearts", 3)])
+        player.add_to_hand([Deck.Card("spades", 12)])
+        player.remove_from_hand([Deck.Card("clubs", 3)])
+        self.assertEqual(player.hand_mask, Deck.cards_to_mask(player.hand))
+        with self.assertRaises(AttributeError):
+            player.nickname = "slots"  # type: ignore
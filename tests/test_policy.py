@@ -0,0 +1,77 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from backend.deck import Deck
+from backend.game import bot_game
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class PolicyTests(unittest.TestCase):
+
+    def setUp(self):
+        from policy import Policy
+        self.policy = Policy.random(seed=3, hidden=(32, 16))
+
+    def test_moves_are_legal(self):
+        from policy import PolicyBot
+        game = bot_game(1)
+        bot = PolicyBot(self.policy, game)
+        checked = []
+
+        def play_card(player, led_suit, leading, allowed_cards_to_play):
+            card = bot.play_card(player, led_suit, leading, allowed_cards_to_play)
+            self.assertIn(card, allowed_cards_to_play)
+            checked.append(card)
+            return card
+
+        def pass_cards(player):
+            cards = bot.pass_cards(player)
+            self.assertEqual(len({card.index() for card in cards}), 3)
+            self.assertTrue(all(card in player.hand for card in cards))
+            return cards
+        game.bot_play_card = play_card
+        game.bot_pass_cards = pass_cards
+        game.play_game()
+        self.assertEqual(len(checked), 52 * game.round_count)
+
+    def test_batches_play_like_single_decisions(self):
+        from policy import PolicyBot, play_batched
+        single = [bot_game(seed) for seed in range(6)]
+        for game in single:
+            PolicyBot(self.policy, game)
+            game.play_game()
+        batched = [bot_game(seed) for seed in range(6)]
+        bots = play_batched(batched, self.policy)
+        self.assertEqual([[player.total_score for player in game.seats] for game in single],
+                         [[player.total_score for player in game.seats] for game in batched])
+        self.assertLess(bots.batches * 3, bots.decisions)
+
+    def test_save_and_load(self):
+        import numpy as np
+        from policy import Policy, STATE_DTYPE
+        rows = np.zeros(2, dtype=STATE_DTYPE)
+        rows["hand"] = rows["legal"] = Deck.cards_to_mask(Deck().cards[:13])
+        rows["trick_cards"] = [[5, -1, -1], [-1, -1, -1]]
+        rows["led_suit"] = [0, -1]
+        with tempfile.TemporaryDirectory() as path:
+            self.policy.save(os.path.join(path, "policy.npz"))
+            loaded = Policy.load(os.path.join(path, "policy.npz"))
+        self.assertTrue((loaded.choose_cards(rows) == self.policy.choose_cards(rows)).all())
+
+    def test_dataset_rows_are_states(self):
+        import numpy as np
+        from dataset import DECISION_DTYPE
+        from policy import STATE_DTYPE, play_features
+        rows = np.zeros(3, dtype=DECISION_DTYPE)
+        rows["seat"] = [0, 1, 2]
+        rows["total_scores"] = [4, 8, 12, 16]
+        states = np.zeros(3, dtype=STATE_DTYPE)
+        for name in STATE_DTYPE.names:
+            states[name] = rows[name]
+        features = play_features(rows)
+        self.assertTrue((features == play_features(states)).all())
+        # Scores start with the player's own seat
+        self.assertEqual(list(features[1, 213:217] * 26), [8, 12, 16, 4])
@@ -0,0 +1,72 @@
+import io
+import random
+import unittest
+
+from api import scripted_api
+from backend.game import Game, bot_game
+from backend.profiler import Profiler
+from backend.round import Round
+
+
+def profiled_game(seed: int) -> tuple[Game, Profiler]:
+    """A game between four bots"""
+    random.seed(seed)
+    profiler = Profiler()
+    game = bot_game(profiler=profiler)
+    game.play_game()
+    return game, profiler
+
+
+class ProfilerTests(unittest.TestCase):
+
+    def test_phases_and_hooks(self):
+        game, profiler = profiled_game(1)
+        summary = profiler.summary()
+        self.assertEqual(summary["phases"]["game"]["calls"], 1)
+        self.assertEqual(summary["phases"]["round"]["calls"], game.round_count)
+        self.assertEqual(summary["phases"]["trick"]["calls"], 13 * game.round_count)
+        self.assertEqual(summary["hooks"]["bot:play_card"]["calls"], 52 * game.round_count)
+        self.assertEqual(summary["phases"]["rules"]["calls"], 52 * game.round_count)
+        self.assertNotIn("human:play_card", summary["hooks"])
+        # The phases count what runs inside them, the split does not count anything twice
+        self.assertAlmostEqual(sum(summary["split"].values()), summary["phases"]["game"]["wall"])
+        self.assertGreaterEqual(summary["phases"]["game"]["wall"], summary["phases"]["round"]["wall"])
+        self.assertEqual(profiler.stack, [])
+
+    def test_human_hooks_are_apart_from_the_rule_checks(self):
+        api = scripted_api(("Alice", "Bob"), random.Random(2))
+        profiler = Profiler()
+        api.set_profiler(profiler)
+        api.start_game()
+        summary = profiler.summary()
+        self.assertEqual(summary["hooks"]["human:play_card"]["calls"], 26 * api.game.round_count)  # type: ignore
+        self.assertGreater(summary["split"]["human_wait"], 0)
+        # Checking the humans' cards is engine work inside the hook
+        self.assertIn(("game", "round", "trick", "human:play_card", "rules"), profiler.calls)
+
+    def test_collapsed_stacks(self):
+        _, profiler = profiled_game(3)
+        out = io.StringIO()
+        profiler.write_collapsed(out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, microseconds = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("game"))
+            self.assertGreater(int(microseconds), 0)
+
+    def test_trick_alone(self):
+        game, _ = profiled_game(4)
+        profiler = Profiler()
+        game.profiler = profiler
+        game._deal()
+        current_round = Round(game)
+        current_round.current_trick = current_round.Trick(current_round)
+        current_round.current_trick.play_trick()
+        self.assertEqual(profiler.calls[("trick",)], 1)
+        self.assertEqual(profiler.calls[("trick", "bot:play_card")], 4)
+        self.assertEqual(profiler.calls[("trick", "rules")], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
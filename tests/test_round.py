@@ -0,0 +1,44 @@
+import random
+import unittest
+
+from backend.deck import Deck
+from backend.game import bot_game
+from backend.round import Round
+
+
+class RoundTests(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.game = bot_game(trick_end_hook=self.trick_end)
+        self.game._deal()
+        self.tricks = []
+
+    def trick_end(self, trick: Round.Trick) -> None:
+        self.tricks.append((trick, dict(trick.played), trick.winner))
+
+    def test_seats(self):
+        self.assertEqual([player.seat for player in self.game.seats], [0, 1, 2, 3])
+        self.assertEqual(self.game.seats, self.game.players + self.game.bots)
+
+    def test_one_trick_object_per_round(self):
+        current_round = Round(self.game)
+        current_round.play_round()
+        self.assertEqual(len(self.tricks), 13)
+        self.assertTrue(all(trick is self.tricks[0][0] for trick, _, _ in self.tricks))
+        for _, played, winner in self.tricks:
+            lead_card = next(iter(played.values()))
+            on_suit = {player: card for player, card in played.items() if card.suit == lead_card.suit}
+            self.assertIs(winner, max(on_suit, key=lambda player: on_suit[player].rank))
+        self.assertEqual(sum(len(player.cards_taken) for player in self.game.seats), 52)
+
+    def test_restore_winner(self):
+        current_round = Round(self.game, self.game.seats[2])
+        trick = current_round.Trick(current_round)
+        trick.restore([Deck.Card("spades", 3), Deck.Card("spades", 14), Deck.Card("hearts", 14), Deck.Card("spades", 5)])
+        self.assertIs(trick.winner, self.game.seats[3])
+        self.assertEqual(list(trick.played), [self.game.seats[seat] for seat in (2, 3, 0, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
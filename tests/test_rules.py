@@ -0,0 +1,79 @@
+import random
+import unittest
+
+from api import API
+from backend.deck import Deck
+from backend.game import bot_game
+from backend.hooks import no_people
+from backend.player import Player
+from backend.rules import DEFAULT_RULES, Rules
+
+
+class RulesTests(unittest.TestCase):
+
+    def test_default_points_match_the_cards(self):
+        self.assertEqual(list(DEFAULT_RULES.points), [Deck.card_from_index(index).points() for index in range(52)])
+        self.assertEqual(DEFAULT_RULES.moon_points, 26)
+
+    def test_jack_rule(self):
+        rules = Rules({'JACK_NEGATIVE': False})
+        self.assertEqual(rules.trick_points([Deck.Card("diamonds", 11), Deck.Card("hearts", 4)]), 1)
+        self.assertEqual(DEFAULT_RULES.trick_points([Deck.Card("diamonds", 11), Deck.Card("hearts", 4)]), -9)
+
+    def test_same_settings_share_rules(self):
+        self.assertIs(Rules.compile({}), DEFAULT_RULES)
+        self.assertIs(Rules.compile({'JACK_NEGATIVE': True}), DEFAULT_RULES)
+        self.assertIsNot(Rules.compile({'JACK_NEGATIVE': False}), DEFAULT_RULES)
+
+    def test_bad_settings(self):
+        with self.assertRaises(ValueError):
+            Rules({'NO_SUCH_RULE': True})
+        with self.assertRaises(ValueError):
+            Rules({'PASS_CYCLE': ("left", "up")})
+        with self.assertRaises(ValueError):
+            Rules({'END_GAME_SCORE': 0})
+
+    def test_pass_cycle(self):
+        rules = Rules({'PASS_CYCLE': ("across", "hold")})
+        self.assertEqual([rules.pass_direction(round_count) for round_count in range(4)],
+                         ["across", "hold", "across", "hold"])
+        self.assertEqual([rules.pass_offset(round_count) for round_count in range(2)], [2, None])
+
+    def test_first_trick_points(self):
+        player = Player("Alice")
+        player.set_hand([Deck.Card("hearts", 3), Deck.Card("spades", 12), Deck.Card("diamonds", 4)])
+        self.assertEqual(player.allowed_cards_to_play(False, True, "clubs", False), [Deck.Card("diamonds", 4)])
+        self.assertEqual(player.allowed_cards_to_play(False, True, "clubs", False, Rules({'FIRST_TRICK_POINTS': True})),
+                         player.hand)
+
+    def test_shooting_the_moon(self):
+        game = bot_game(settings={'SHOOT_THE_MOON': True})
+        shooter, *others = game.bots
+        shooter.cards_taken = Deck.mask_to_cards(game.rules.point_cards)
+        shooter.round_score = 26
+        game._shoot_the_moon()
+        self.assertEqual([player.round_score for player in game.bots], [0, 26, 26, 26])
+
+    def test_variant_game(self):
+        random.seed(5)
+        game = bot_game(settings={'PASS_CYCLE': ("hold",), 'JACK_NEGATIVE': False, 'END_GAME_SCORE': 30})
+        game.play_game()
+        self.assertGreaterEqual(max(bot.total_score for bot in game.bots), 30)
+        # Without the jack every round gives out all 26 points
+        self.assertEqual(sum(bot.total_score for bot in game.bots), 26 * game.round_count)
+
+    def test_settings_are_not_shared(self):
+        first = API()
+        first.add_player("Alice")
+        first.play_card = no_people  # type: ignore
+        first.pass_cards = no_people  # type: ignore
+        first.create_game()
+        first.set_end_game_score(10)
+        self.assertEqual(first.game.settings['END_GAME_SCORE'], 10)  # type: ignore
+        self.assertEqual(bot_game().settings['END_GAME_SCORE'], 50)
+        with self.assertRaises(TypeError):
+            first.game.settings['END_GAME_SCORE'] = 20  # type: ignore
+
+
+if __name__ == '__main__':
+    unittest.main()
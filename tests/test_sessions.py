@@ -0,0 +1,54 @@
+import unittest
+from backend.deck import Deck
+from sessions import SessionRegistry, decode_snapshot, encode_snapshot
+
+
+class SnapshotTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        hand = [Deck.Card("clubs", 3), Deck.Card("spades", 12), Deck.Card("hearts", 14)]
+        taken = [Deck.Card("diamonds", 11), Deck.Card("hearts", 2)]
+        player_state = {"total_score": 30, "round_score": -9,
+                        "cards_taken": taken, "hand": hand, "passed_cards": None}
+        trick = [(3, Deck.Card("clubs", 9)), (0, Deck.Card("clubs", 2))]
+        data = encode_snapshot(7, 1, ["Alice", "Bob", "Bot 1", "Bot 2"],
+                               [(12, 0), (30, -9), (55, 3), (0, 26)], player_state, trick)
+        snapshot = decode_snapshot(data)
+        self.assertEqual(snapshot["round_count"], 7)
+        self.assertEqual(snapshot["seat"], 1)
+        self.assertEqual(snapshot["players"][1], {
+                         "name": "Bob", "total_score": 30, "round_score": -9})
+        self.assertEqual(snapshot["hand"], Deck.sort_hand(hand))
+        self.assertEqual(snapshot["cards_taken"], Deck.sort_hand(taken))
+        self.assertEqual(snapshot["passed_cards"], [])
+        self.assertEqual(snapshot["trick"], trick)
+
+    def test_long_names_are_cut_between_characters(self):
+        player_state = {"cards_taken": [], "hand": [], "passed_cards": None}
+        data = encode_snapshot(0, 0, ["é" * 200, "Bob"], [(0, 0), (0, 0)], player_state, [])
+        self.assertEqual(decode_snapshot(data)["players"][0]["name"], "é" * 127)
+
+    def test_size_is_bounded(self):
+        player_state = {"cards_taken": Deck().cards, "hand": Deck().cards[:13],
+                        "passed_cards": Deck().cards[:3]}
+        trick = [(seat, Deck.Card("clubs", 2 + seat)) for seat in range(3)]
+        data = encode_snapshot(65535, 0, ["Alice", "Bob", "Charlie", "David"],
+                               [(-100, 26)] * 4, player_state, trick)
+        self.assertLess(len(data), 100, "A snapshot should only be a few dozen bytes")
+
+
+class SessionRegistryTests(unittest.TestCase):
+
+    def test_register_lookup_remove(self):
+        registry = SessionRegistry()
+        game = object()
+        token = registry.register("Alice", game)
+        self.assertEqual(registry.lookup(token), ("Alice", game))
+        self.assertNotEqual(token, registry.register("Alice", game),
+                            "Every session should get its own token")
+        registry.remove(token)
+        self.assertIsNone(registry.lookup(token))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import multiprocessing
+import socket
+import struct
+import threading
+import unittest
+
+from aggregation import GameSummary
+from simulation import Coordinator, play_game, run_worker, simulate
+
+
+def _lose_a_unit(port: int) -> None:
+    """Take a unit and disconnect without reporting it"""
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        hello = json.dumps({"type": "hello", "worker": "lost"}).encode()
+        connection.sendall(struct.pack("<I", len(hello)) + hello)
+        connection.recv(4)
+
+
+class SimulationTests(unittest.TestCase):
+
+    def test_games_follow_their_seed(self):
+        first = play_game(7)
+        second = play_game(7)
+        self.assertEqual([player.total_score for player in first.seats],
+                         [player.total_score for player in second.seats])
+        self.assertEqual(first.round_count, second.round_count)
+
+    def test_stats_merge(self):
+        whole = simulate(0, 6)
+        parts = simulate(0, 2)
+        parts.merge(GameSummary.from_dict(json.loads(json.dumps(simulate(2, 4).to_dict()))))
+        self.assertEqual(whole, parts)
+        self.assertEqual(whole.games, 6)
+        self.assertGreaterEqual(sum(whole.wins), 6)
+
+    def test_lost_units_are_reassigned(self):
+        coordinator = Coordinator(12, unit_games=3)
+        context = multiprocessing.get_context("spawn")
+        processes = []
+
+        def ready(port: int) -> None:
+            # The lost worker has its unit before the others connect
+            lost = threading.Thread(target=_lose_a_unit, args=(port,))
+            lost.start()
+
+            def start_workers() -> None:
+                lost.join()
+                for index in range(2):
+                    process = context.Process(target=run_worker, args=("127.0.0.1", port, f"test{index}"))
+                    process.start()
+                    processes.append(process)
+            threading.Thread(target=start_workers).start()
+
+        try:
+            stats = asyncio.run(asyncio.wait_for(coordinator.run("127.0.0.1", 0, ready), 120))
+        finally:
+            for process in processes:
+                process.join(10)
+                process.terminate()
+        self.assertEqual(stats, simulate(0, 12))
+        self.assertGreaterEqual(coordinator.reassigned, 1)
+        self.assertEqual(coordinator.workers_seen, 3)
@@ -0,0 +1,56 @@
+import unittest
+from api import scripted_api
+from backend.deck import Deck
+from backend.player import Player
+
+
+class StateViewTests(unittest.TestCase):
+
+    def setUp(self):
+        self.api = scripted_api()
+        self.api.create_game()
+        self.game = self.api.game
+        for player, hand in zip(self.game.players + self.game.bots, self.game.deck.deal()):  # type: ignore
+            player.set_hand(hand)
+        self.alice = self.game.players[0]  # type: ignore
+
+    def test_views_are_cached_until_a_change(self):
+        state = self.api.get_current_state()
+        self.assertIs(self.api.get_current_state(), state)
+        self.assertIs(self.api.get_player_state(self.alice), state['players']['Alice'])
+
+        self.alice.remove_from_hand(self.alice.hand[:1])
+        changed = self.api.get_current_state()
+        self.assertIsNot(changed, state)
+        self.assertEqual(len(changed['players']['Alice']['hand']), 12)
+        self.assertIs(changed['players']['Bot 1'], state['players']['Bot 1'],
+                      "Players that did not change should keep their view")
+
+    def test_views_are_read_only(self):
+        state = self.api.get_player_state(self.alice)
+        with self.assertRaises(TypeError):
+            state['hand'] = ()  # type: ignore
+        with self.assertRaises(AttributeError):
+            state['hand'].pop()  # type: ignore
+
+    def test_hand_stays_sorted(self):
+        passed = [Deck.Card("spades", 12), Deck.Card("clubs", 2), Deck.Card("hearts", 14)]
+        self.alice.set_hand(Deck().cards[20:30])
+        self.alice.add_to_hand(passed)
+        self.assertEqual(self.alice.hand, Deck.sort_hand(self.alice.hand))
+        self.alice.take_trick(reversed(passed), 14)
+        self.assertEqual(self.alice.cards_taken, Deck.sort_hand(passed))
+
+    def test_changes_since(self):
+        version = self.api.get_state_version()
+        self.assertEqual(dict(self.api.get_changes_since(version)['players']), {})
+        self.alice.take_trick([Deck.Card("hearts", 2)], 1)
+        changes = self.api.get_changes_since(version)
+        self.assertEqual(list(changes['players']), ['Alice'])
+        self.assertEqual(changes['players']['Alice']['round_score'], 1)
+        self.assertGreater(changes['version'], version)
+        self.assertEqual(len(self.api.get_changes_since(0)['players']), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import random
+import unittest
+from backend.deck import Deck
+from metrics import Registry
+from tables import TableLimitError, TableManager
+
+
+class TableManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(5)
+        self.messages = []
+        self.registry = Registry()
+        self.manager = TableManager(lambda table, seat, message: self.messages.append((table, seat, message)),
+                                    max_tables=3, pool_size=2, metrics=self.registry)
+
+    def answer_everything(self):
+        """Play the lowest allowed card, or pass the first 3, for every person asked"""
+        while True:
+            self.manager.run()
+            asked = [(table, seat, message) for table, seat, message in self.messages if message["type"] == "decide"]
+            self.messages.clear()
+            if not asked:
+                return
+            for table, seat, message in asked:
+                cards = message["legal"][:1] if message["kind"] == "play" else message["hand"][:3]
+                self.manager.answer(table, seat, cards)
+
+    def test_games_with_people_finish(self):
+        tables = [self.manager.open_table(["Alice"]), self.manager.open_table(["Bob", "Carol"])]
+        self.answer_everything()
+        self.assertEqual(self.manager.tables, {})
+        for table in tables:
+            self.assertEqual(table.games_played, 1)
+            self.assertGreaterEqual(max(player.total_score for player in table.game.players),
+                                    table.game.rules.end_game_score)
+
+    def test_answers_are_checked(self):
+        table = self.manager.open_table(["Alice"])
+        self.manager.run()
+        (_, seat, message), = [entry for entry in self.messages if entry[2]["type"] == "decide"]
+        self.assertEqual(message["kind"], "pass")
+        with self.assertRaises(ValueError):
+            self.manager.answer(table, seat + 1, message["hand"][:3])
+        with self.assertRaises(ValueError):
+            self.manager.answer(table, seat, [message["hand"][0]] * 3)
+        outside = next(index for index in range(52) if index not in message["hand"])
+        with self.assertRaises(ValueError):
+            self.manager.answer(table, seat, message["hand"][:2] + [outside])
+        self.manager.answer(table, seat, message["hand"][:3])
+        self.assertIsNone(table.waiting)
+
+    def test_tables_are_reused(self):
+        first = self.manager.open_table(["Alice"])
+        self.answer_everything()
+        second = self.manager.open_table(["Dave", "Erin"])
+        self.assertIs(second, first)
+        self.assertEqual(second.names, ["Dave", "Erin", "Bot 1", "Bot 2"])
+        self.assertTrue(all(player.total_score == 0 for player in second.game.seats))
+        self.assertTrue(all(len(player.hand) == 13 for player in second.game.seats))
+        self.answer_everything()
+        self.assertEqual(second.games_played, 2)
+        self.assertEqual(self.manager.reuse_rate, 0.5)
+
+    def test_table_limit(self):
+        for name in ("A", "B", "C"):
+            self.manager.open_table([name])
+        with self.assertRaises(TableLimitError):
+            self.manager.open_table(["D"])
+        self.assertEqual(self.manager.stats()["rejected"], 1)
+        self.assertIn("# TYPE hearts_tables_rejected_total counter", self.registry.render_prometheus())
+        self.assertEqual(self.registry.snapshot()["hearts_tables_opened_total"], 3)
+        self.assertEqual(self.registry.snapshot()["hearts_tables_rejected_total"], 1)
+        self.assertGreater(self.manager.table_bytes(), 0)
+
+    def test_turns_are_fair(self):
+        # Bot tables only ever make decisions, each gets one turn in every round of turns
+        tables = [self.manager.open_table([]) for _ in range(3)]
+        played = {table.table_id: 0 for table in tables}
+
+        def count(table, seat, message):
+            if message["type"] == "card":
+                played[table.table_id] += 1
+        self.manager.listener = count
+        self.manager.run(budget=300)
+        self.assertLessEqual(max(played.values()) - min(played.values()), 1)
+
+    def test_leaving(self):
+        table = self.manager.open_table(["Alice"])
+        self.manager.run()
+        self.manager.leave(table, 0)
+        self.assertNotIn(table.table_id, self.manager.tables)
+        self.assertEqual(self.messages[-1][2], {"type": "closed"})
+        self.assertEqual(Deck.cards_to_mask(table.game.seats[0].hand), table.game.seats[0].hand_mask)
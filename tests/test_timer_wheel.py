@@ -0,0 +1,107 @@
+import socket
+import threading
+import unittest
+from backend.deck import Deck
+from outbound import Connection
+from timer_wheel import TimerWheel
+import server
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TimerWheelTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(tick=0.1, slots=8, clock=self.clock)
+        self.fired = []
+
+    def test_fires_after_deadline(self):
+        self.wheel.schedule(0.5, lambda: self.fired.append("a"))
+        self.clock.now = 0.45
+        self.assertEqual(self.wheel.advance(), 0, "The timer should not fire early")
+        self.clock.now = 0.65
+        self.assertEqual(self.wheel.advance(), 1)
+        self.assertEqual(self.fired, ["a"])
+        self.clock.now = 5
+        self.assertEqual(self.wheel.advance(), 0, "A timer should fire only once")
+
+    def test_wraps_around(self):
+        # 8 slots of 0.1s, so this timer is further away than one turn of the wheel
+        handle = self.wheel.schedule(2.0, lambda: self.fired.append("late"))
+        for step in range(1, 20):
+            self.clock.now = step / 10
+            self.wheel.advance()
+        self.assertEqual(self.fired, [])
+        self.clock.now = 2.15
+        self.wheel.advance()
+        self.assertEqual(self.fired, ["late"])
+        self.assertTrue(handle.fired)
+
+    def test_cancel(self):
+        handle = self.wheel.schedule(0.2, lambda: self.fired.append("a"))
+        self.wheel.schedule(0.2, lambda: self.fired.append("b"))
+        handle.cancel()
+        self.clock.now = 1
+        self.wheel.advance()
+        self.assertEqual(self.fired, ["b"], "A cancelled timer should not fire")
+
+
+class TurnDeadlineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(tick=0.1, clock=self.clock)
+        self.server_side, self.client_side = socket.socketpair()
+        self.game = server.Game({"Alice": Connection(self.server_side)}, self.wheel)
+        self.options = Deck().cards[:5]
+
+    def tearDown(self):
+        self.game.close()
+        self.server_side.close()
+        self.client_side.close()
+
+    def test_input_before_deadline(self):
+        deadline = self.game.start_deadline(10)
+        timer = threading.Timer(0.05, self.client_side.send, args=(b"2",))
+        timer.start()
+        self.assertEqual(self.game.get_valid_user_input(
+            "Alice", "Pick", "Cards:", self.options, deadline), 2)
+        timer.join()
+
+    def test_deadline_expires(self):
+        deadline = self.game.start_deadline(1)
+
+        def expire():
+            self.clock.now = 2
+            self.wheel.advance()
+        timer = threading.Timer(0.05, expire)
+        timer.start()
+        self.assertIsNone(self.game.get_valid_user_input(
+            "Alice", "Pick", "Cards:", self.options, deadline), "The deadline should stop the wait for input")
+        timer.join()
+
+    def test_disconnect(self):
+        self.client_side.close()
+        self.assertIsNone(self.game.get_valid_user_input(
+            "Alice", "Pick", "Cards:", self.options))
+        self.assertIn("Alice", self.game.disconnected,
+                      "The seat should be held for the player")
+
+    def test_grace_period_expires(self):
+        self.client_side.close()
+        self.game.get_valid_user_input("Alice", "Pick", "Cards:", self.options)
+        self.clock.now = server.RESUME_GRACE + 1
+        self.wheel.advance()
+        with self.assertRaises(server.TableAbandonedError):
+            self.game.process_events()
+
+
+if __name__ == '__main__':
+    unittest.main()
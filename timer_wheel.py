@@ -0,0 +1,115 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TimerHandle:
+    """A scheduled callback in a `TimerWheel`"""
+    __slots__ = ("deadline_tick", "callback", "cancelled", "fired")
+
+    def __init__(self, deadline_tick: int, callback: Callable[[], None]) -> None:
+        self.deadline_tick = deadline_tick
+        self.callback = callback
+        self.cancelled = False
+        self.fired = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel. Timers are bucketed into slots by the tick they expire on, so scheduling and cancelling
+    are constant time and a single thread can drive the deadlines of every table on the server.
+    Timers fire on tick boundaries, so a timer may fire up to one tick late.
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 512, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Args:
+            tick (float): Resolution of the wheel in seconds
+            slots (int): Number of slots, timers further away than `tick * slots` wrap around the wheel
+            clock (Callable[[], float]): Time source, monotonic seconds
+        """
+        if tick <= 0 or slots <= 0:
+            raise ValueError("Tick and slots must be positive")
+        self.tick = tick
+        self.clock = clock
+        self.slots: list[list[TimerHandle]] = [[] for _ in range(slots)]
+        self.start_time = clock()
+        # The last tick that has been processed
+        self.current_tick = 0
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def _tick_of(self, when: float) -> int:
+        return int((when - self.start_time) / self.tick)
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> TimerHandle:
+        """Call `callback` from the wheel thread after `delay` seconds.
+
+        Args:
+            delay (float): Seconds from now
+            callback (Callable[[], None]): Must be quick, it runs on the wheel thread
+
+        Returns:
+            TimerHandle: Handle that can be used to cancel the timer
+        """
+        with self.lock:
+            # Round up so a timer never fires early
+            deadline_tick = max(self._tick_of(self.clock() + delay) + 1,
+                                self.current_tick + 1)
+            handle = TimerHandle(deadline_tick, callback)
+            self.slots[deadline_tick % len(self.slots)].append(handle)
+        return handle
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """Fire every timer that expired up to `now`.
+
+        Args:
+            now (Optional[float]): The current time, defaults to the wheel clock
+
+        Returns:
+            int: The number of timers fired
+        """
+        if now is None:
+            now = self.clock()
+        expired = []
+        with self.lock:
+            target_tick = self._tick_of(now)
+            # Never walk more than one full turn of the wheel, every slot is visited by then
+            first_tick = max(self.current_tick + 1,
+                             target_tick - len(self.slots) + 1)
+            for tick in range(first_tick, target_tick + 1):
+                slot = self.slots[tick % len(self.slots)]
+                if not slot:
+                    continue
+                remaining = []
+                for handle in slot:
+                    if handle.cancelled:
+                        continue
+                    if handle.deadline_tick <= target_tick:
+                        expired.append(handle)
+                    else:
+                        remaining.append(handle)
+                slot[:] = remaining
+            self.current_tick = max(self.current_tick, target_tick)
+        for handle in expired:
+            handle.fired = True
+            handle.callback()
+        return len(expired)
+
+    def start(self) -> None:
+        """Drive the wheel from a daemon thread"""
+        def run():
+            while not self.stopped.wait(self.tick):
+                self.advance()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()